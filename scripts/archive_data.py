@@ -0,0 +1,43 @@
+import json
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.archive import write_archive
+
+if "__main__" == __name__:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert crawled json files into columnar archives (.npz)."
+    )
+    logging.basicConfig(encoding="utf-8", level=logging.INFO)
+
+    parser.add_argument(
+        "--data", help="Crawled json files.", required=True, nargs="+"
+    )
+    parser.add_argument(
+        "--out", help="Directory of the archives. Defaults to next to the json files."
+    )
+    parser.add_argument(
+        "--mmap",
+        help="Store the columns uncompressed so they can be memory mapped.",
+        action="store_true",
+    )
+    args = parser.parse_args()
+
+    for data_path in args.data:
+        data_path = Path(data_path)
+        out_dir = Path(args.out) if args.out else data_path.parent
+        out_dir.mkdir(parents=True, exist_ok=True)
+        # competition names may contain dots, only the .json extension is replaced
+        archive_path = out_dir / f"{data_path.name.removesuffix('.json')}.npz"
+
+        with open(data_path, "r") as f:
+            crawled_results = json.load(f)
+        write_archive(archive_path, crawled_results, compress=not args.mmap)
+        logging.info(
+            f"{data_path} ({data_path.stat().st_size / 1e3:.0f}kB) -> {archive_path} ({archive_path.stat().st_size / 1e3:.0f}kB)"
+        )
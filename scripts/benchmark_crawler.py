@@ -0,0 +1,58 @@
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(".").absolute()))
+from src.async_crawler import AsyncCrawl2K, AsyncFetcher
+from src.fixture_server import FixtureServer
+from src.http_crawler import Http2K
+
+FROM_DATE = datetime(2022, 8, 1)
+
+
+def crawl_sequentially(url: str):
+    """One Http2K per competition, like crawl_concurrently.py with a single worker."""
+    n_requests = 0
+    with Http2K(2023, url=url) as crawler:
+        selection = [(a, c) for a in crawler.get_associations() for c in crawler.get_competitions(a)]
+        n_requests += crawler.n_requests
+    for association, competition in selection:
+        with Http2K(2023, url=url) as crawler:
+            crawler.get_clubs_and_teams([association], [competition])
+            crawler.get_matches([association], [competition], from_date=FROM_DATE)
+            n_requests += crawler.n_requests
+    return n_requests
+
+
+def crawl_async(url: str, per_host: int, rate: float):
+    fetcher = AsyncFetcher(per_host=per_host, rate=rate, burst=per_host)
+    try:
+        AsyncCrawl2K(2023, fetcher=fetcher, url=url).run(from_date=FROM_DATE)
+    finally:
+        fetcher.close()
+    return fetcher.n_requests
+
+
+if "__main__" == __name__:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Time the sequential and the async http crawler against a local server with fixture pages."
+    )
+    parser.add_argument("--latency", help="Seconds per response of the server.", default=0.05, type=float)
+    parser.add_argument("--reports", help="Match reports per competition.", default=40, type=int)
+    parser.add_argument("--per-host", help="Concurrency limits to compare.", nargs="*", default=[1, 4, 8, 16], type=int)
+    parser.add_argument("--rate", help="Requests per second of the async crawler.", default=None, type=float)
+    args = parser.parse_args()
+
+    with FixtureServer(latency=args.latency, n_reports=args.reports) as server:
+        start = time.perf_counter()
+        n_requests = crawl_sequentially(server.url)
+        elapsed = time.perf_counter() - start
+        print(f"sequential      {n_requests:5d} requests  {elapsed:7.2f}s  {n_requests / elapsed:7.1f} req/s")
+        for per_host in args.per_host:
+            start = time.perf_counter()
+            n_requests = crawl_async(server.url, per_host, args.rate)
+            elapsed = time.perf_counter() - start
+            print(f"async {per_host:3d}/host  {n_requests:5d} requests  {elapsed:7.2f}s  {n_requests / elapsed:7.1f} req/s")
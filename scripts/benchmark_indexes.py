@@ -0,0 +1,123 @@
+import shutil
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(".").absolute()))
+import sqlalchemy
+from sqlalchemy import and_, select, text
+
+from src.migrations import migrate_database
+from src.schema import (
+    Base,
+    Club,
+    Competition,
+    DoublesMatch,
+    Human,
+    Player,
+    SinglesMatch,
+    SkillRating,
+    Team,
+    TeamMatch,
+)
+
+# the only secondary index of the original schema
+BASELINE_INDEXES = {"ix_Player_human"}
+
+
+def hot_queries(engine):
+    """Lookups of the ingest and rating code, with parameters taken from existing rows."""
+    with engine.connect() as connection:
+        team = connection.execute(select(Team)).first()
+        competition = connection.execute(select(Competition)).first()
+        team_match = connection.execute(select(TeamMatch)).first()
+        rating = connection.execute(select(SkillRating)).first()
+        name, club = connection.execute(
+            select(Human.name, Player.club).join(Human, Human.id == Player.human)
+        ).first()
+        club_name = connection.execute(select(Club.name).where(Club.id == club)).scalar()
+    return {
+        "team": select(Team).where(
+            and_(
+                Team.rank == team.rank,
+                Team.club == team.club,
+                Team.year == team.year,
+                Team.competition == team.competition,
+            )
+        ),
+        "competition": select(Competition).where(
+            and_(
+                Competition.name == competition.name,
+                Competition.association == competition.association,
+                Competition.year == competition.year,
+            )
+        ),
+        "team match": select(TeamMatch).where(
+            and_(
+                TeamMatch.date == team_match.date,
+                TeamMatch.home_team == team_match.home_team,
+                TeamMatch.away_team == team_match.away_team,
+                TeamMatch.competition == team_match.competition,
+            )
+        ),
+        "singles of team match": select(SinglesMatch).where(
+            SinglesMatch.team_match == team_match.id
+        ),
+        "doubles of team match": select(DoublesMatch).where(
+            DoublesMatch.team_match == team_match.id
+        ),
+        "rating": select(SkillRating).where(
+            (SkillRating.player == rating.player) & (SkillRating.team == rating.team)
+        ),
+        "player by name": select(Player)
+        .join(Human, Human.id == Player.human)
+        .where(and_(Human.name == name, Player.club == club)),
+        "club by name": select(Club).where(Club.name == club_name),
+        "unrated team matches": select(TeamMatch)
+        .where(TeamMatch.used_for_rating == False)  # noqa: E712
+        .order_by(TeamMatch.date),
+    }
+
+
+def report(engine, title, repeat):
+    print(f"## {title}")
+    for name, stmt in hot_queries(engine).items():
+        sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+        with engine.connect() as connection:
+            plan = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+            seconds = min(
+                timeit.repeat(lambda: connection.execute(stmt).all(), number=repeat, repeat=3)
+            )
+        print(f"{name}: {seconds / repeat * 1e6:.0f}us")
+        for row in plan:
+            print(f"    {row[-1]}")
+
+
+if "__main__" == __name__:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Show query plans and timings of the hot lookups before and after migrating."
+    )
+    parser.add_argument("-db", "--database", required=True, help="Path to a populated database.")
+    parser.add_argument("--repeat", default=200, type=int, help="Executions per query.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "benchmark.db"
+        shutil.copy(args.database, db_path)
+        engine = sqlalchemy.create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(engine)
+
+        with engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    if index.name not in BASELINE_INDEXES:
+                        connection.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+        report(engine, "before", args.repeat)
+
+        migrate_database(engine)
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+        report(engine, "after", args.repeat)
@@ -0,0 +1,87 @@
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(".").absolute()))
+import sqlalchemy
+from sqlalchemy import func, select
+
+from src.archive import load_crawl
+from src.insert import (
+    IdentityCache,
+    bulk_populate,
+    populate_clubs_and_teams,
+    populate_competitions,
+    populate_players,
+    populate_teammatches,
+)
+from src.schema import Base, DoublesMatch, Player, SinglesMatch, TeamMatch
+
+
+def load(paths):
+    crawls = []
+    for path in paths:
+        crawled_results = load_crawl(path)
+        crawled_results["season"] = datetime.fromisoformat(crawled_results["season"])
+        crawls.append(crawled_results)
+    return crawls
+
+
+def orm_ingest(engine, crawls, cached):
+    cache = IdentityCache(engine) if cached else None
+    for crawled_results in crawls:
+        season = crawled_results["season"]
+        populate_competitions(engine, crawled_results["crawled_competitions"], season=season)
+        for association, competitions in crawled_results["crawled_competitions"].items():
+            for competition in competitions:
+                crawled = crawled_results[association][competition]
+                populate_clubs_and_teams(engine, crawled["clubs_teams"], association, competition, season, cache=cache)
+                populate_players(engine, crawled["players"], association, competition, season, cache=cache)
+                populate_teammatches(engine, crawled["team_matches"], crawled["matches"], season, cache=cache)
+
+
+def bulk_ingest(engine, crawls):
+    for crawled_results in crawls:
+        bulk_populate(engine, crawled_results)
+
+
+MODES = {
+    "orm": lambda engine, crawls: orm_ingest(engine, crawls, cached=False),
+    "cached": lambda engine, crawls: orm_ingest(engine, crawls, cached=True),
+    "bulk": bulk_ingest,
+}
+
+
+def row_counts(engine):
+    with engine.connect() as connection:
+        return {
+            table.__tablename__: connection.execute(select(func.count()).select_from(table)).scalar()
+            for table in [TeamMatch, SinglesMatch, DoublesMatch, Player]
+        }
+
+
+if "__main__" == __name__:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Time the insert modes on crawled files, first into an empty database and then again."
+    )
+    parser.add_argument("--data", required=True, nargs="+", help="Crawled json files or archives.")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    crawls = load(args.data)
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            engine = sqlalchemy.create_engine(f"sqlite:///{Path(tmp) / mode}.db")
+            Base.metadata.create_all(engine)
+            start = time.perf_counter()
+            MODES[mode](engine, crawls)
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            MODES[mode](engine, crawls)
+            again = time.perf_counter() - start
+            print(f"{mode}: {first:.1f}s, re-import {again:.1f}s, {row_counts(engine)}")
+            engine.dispose()
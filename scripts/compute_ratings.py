@@ -5,7 +5,8 @@ from pathlib import Path
 import sqlalchemy
 
 sys.path.append(str(Path(".").absolute()))
-from src.rating import compute_ratings
+from src.rating import compute_ratings, rollback_ratings
+from src.migrations import migrate_database
 
 if __name__ == "__main__":
     import argparse
@@ -17,7 +18,31 @@ if __name__ == "__main__":
         "-db", "--database", help="Path to the database.", required=True
     )
 
+    parser.add_argument(
+        "--backend",
+        help="Implementation of the TrueSkill update.",
+        choices=["trueskill", "numpy"],
+        default="trueskill",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        help="Store a snapshot of all ratings every n match days. 0 disables checkpoints.",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--rollback",
+        help="Re-rate all matches from this date on, e.g. after correcting a result. Expects YYYY-MM-DD.",
+        required=False,
+    )
+
     args = parser.parse_args()
     engine = sqlalchemy.create_engine(f"sqlite:///{args.database}")
+    # adds tables and indexes that are missing in databases created with an older schema
+    migrate_database(engine)
 
-    compute_ratings(engine)
+    if args.rollback:
+        rollback_ratings(engine, args.rollback)
+    compute_ratings(
+        engine, backend=args.backend, checkpoint_every=args.checkpoint_every
+    )
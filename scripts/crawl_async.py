@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(".").absolute()))
+from src.archive import write_archive
+from src.async_crawler import AsyncCrawl2K, AsyncFetcher, competition_results
+from src.crawl_state import CrawlIndex
+
+
+def write_results(data_path: Path, season: int, data: dict, file_format: str):
+    """Write the results of one competition like crawl_concurrently.py does."""
+    (association, competitions), = data["crawled_competitions"].items()
+    time_str = datetime.fromisoformat(data["crawled_date"]).strftime("%Y-%m-%d-T%H+%M+%S")
+    os.makedirs(data_path / f"{season}", exist_ok=True)
+    file_path = data_path / f"{season}" / f"{association}_{competitions[0]}_{time_str}"
+    if file_format in ("json", "both"):
+        with open(file_path.parent / f"{file_path.name}.json", "w+") as f:
+            json.dump(data, f)
+    if file_format in ("archive", "both"):
+        write_archive(file_path.parent / f"{file_path.name}.npz", data)
+
+
+if "__main__" == __name__:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Crawl data from 2k app over http, all competitions share one request queue. Experimental, the requests are unverified against the live site."
+    )
+
+    parser.add_argument(
+        "--date",
+        help="Matches before this date are ignored. Expects YYYY-MM-DD.",
+        required=False,
+    )
+    parser.add_argument(
+        "--path", help="Destination for the crawled data.", required=True
+    )
+    parser.add_argument(
+        "--season",
+        help="What season we crawl. Expects YYYY (will be set to first of august that year.)",
+        required=True,
+        type=int,
+    )
+    parser.add_argument(
+        "--associations",
+        help="Limit associations to be crawled, all if omitted.",
+        nargs="*",
+        default=None,
+    )
+    parser.add_argument(
+        "--format",
+        help="Write the crawled data as json, as compressed columnar archive (.npz) or both.",
+        choices=["json", "archive", "both"],
+        default="json",
+    )
+    parser.add_argument(
+        "--per-host", help="Requests in flight per host.", default=4, type=int
+    )
+    parser.add_argument(
+        "--rate", help="Requests per second per host, unlimited if omitted.", default=None, type=float
+    )
+    parser.add_argument(
+        "--index",
+        help="SQLite file of crawled match reports. Only new reports and those whose result changed are opened.",
+        required=False,
+    )
+    parser.add_argument(
+        "--max-retries", help="Maximum number of retries per request.", default=4, type=int
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(encoding="utf-8", level=logging.INFO)
+
+    data_path = Path(args.path)
+    os.makedirs(data_path, exist_ok=True)
+    season = datetime(args.season, 8, 1)
+    from_date = season if not args.date else datetime.fromisoformat(args.date)
+    logging.info(f"Only checking matches past {from_date}")
+
+    crawl_index = CrawlIndex.open(args.index) if args.index else None
+    fetcher = AsyncFetcher(per_host=args.per_host, rate=args.rate, retries=args.max_retries)
+    try:
+        crawled, failed = AsyncCrawl2K(args.season, fetcher=fetcher).run(
+            args.associations, from_date=from_date, crawl_index=crawl_index
+        )
+    finally:
+        fetcher.close()
+    for crawl in crawled:
+        write_results(data_path, args.season, competition_results(crawl, season, from_date), args.format)
+        if crawl_index is not None:
+            crawl_index.save(crawl.association, crawl.competition)
+    logging.info(f"Crawled {len(crawled)} competitions with {fetcher.n_requests} requests, {fetcher.n_retries} retries")
+    for association, competition, error in failed:
+        logging.error(f"{association}: {competition} failed, {error}")
@@ -8,12 +8,17 @@ from pathlib import Path
 
 sys.path.append(r"S:\Dokumente\Code\ndv-elo\src")
 sys.path.append(str(Path(".").absolute()))
+from src.archive import write_archive
+from src.crawl_state import CrawlIndex
 from src.crawler import Crawler2K
+from src.http_crawler import Http2K
 
+CRAWLERS = {"selenium": Crawler2K, "http": Http2K}
 
-def crawl_competition(season, results, association, competition, from_date):
+
+def crawl_competition(season, results, association, competition, from_date, backend="selenium", crawl_index=None):
     """Function that can crawls data for one competition. Should be used concurrently.
-    Depends on a selenium docker instance.
+    The selenium backend depends on a selenium docker instance.
 
     Args:
         season (int): Season to crawl. Determines crawler URL.
@@ -21,19 +26,21 @@ def crawl_competition(season, results, association, competition, from_date):
         association (str): Name of the association.
         competition (str): Name of the competition within the association.
         from_date (datetime): Matches before this date will be ignored in crawling.
+        backend (str, optional): "selenium" or "http", see CRAWLERS. Defaults to "selenium".
+        crawl_index (CrawlIndex, optional): Skips match reports crawled before. Defaults to None.
 
     Returns:
         dict: Results in standard format.
     """
     logging.info(f"Start {association}: {competition}")
     # Prepare empty result dict for each thread
-    with Crawler2K(season) as crawler:
+    with CRAWLERS[backend](season) as crawler:
         results["crawled_competitions"][association] = [competition]
         results[association] = {}
         results[association][competition] = {}
         clubs_teams, players = crawler.get_clubs_and_teams([association], [competition])
         matchdays, matches = crawler.get_matches(
-            [association], [competition], from_date=from_date
+            [association], [competition], from_date=from_date, crawl_index=crawl_index
         )
         results[association][competition]["clubs_teams"] = {
             club: list(teams) for club, teams in clubs_teams.items()
@@ -72,6 +79,23 @@ if "__main__" == __name__:
         nargs="*",
         default=["DBH", "NDV"],
     )
+    parser.add_argument(
+        "--format",
+        help="Write the crawled data as json, as compressed columnar archive (.npz) or both.",
+        choices=["json", "archive", "both"],
+        default="json",
+    )
+    parser.add_argument(
+        "--backend",
+        help="Drive a browser through selenium or request the pages directly over http (experimental, unverified against the live site).",
+        choices=list(CRAWLERS),
+        default="selenium",
+    )
+    parser.add_argument(
+        "--index",
+        help="SQLite file of crawled match reports. Only new reports and those whose result changed are opened.",
+        required=False,
+    )
     parser.add_argument(
         "--max-retries",
         help="Maximum number of retries per competition.",
@@ -91,9 +115,10 @@ if "__main__" == __name__:
     else:
         from_date = datetime.fromisoformat(args.date)
     logging.info(f"Only checking matches past {from_date}")
+    crawl_index = CrawlIndex.open(args.index) if args.index else None
 
     jobs = []
-    with Crawler2K(args.season) as crawler:
+    with CRAWLERS[args.backend](args.season) as crawler:
         if args.associations[0] == "all":
             assocs = crawler.get_associations()
         else:
@@ -106,7 +131,7 @@ if "__main__" == __name__:
                 results["crawled_date"] = datetime.now().isoformat()
                 results["season"] = season.isoformat()
                 results["crawled_competitions"] = {}
-                jobs.append((args.season, results, a, c, from_date))
+                jobs.append((args.season, results, a, c, from_date, args.backend, crawl_index))
 
     while len(jobs) > 0:
         logging.info(f"Running for {len(jobs)} jobs")
@@ -116,7 +141,7 @@ if "__main__" == __name__:
             }
             for future in concurrent.futures.as_completed(future_to_job):
                 job = future_to_job[future]
-                season, _, a, c, from_date = job
+                season, _, a, c, from_date, _, _ = job
                 logging.info(f"Finished job for {a,c}")
                 try:
                     data = future.result()
@@ -124,11 +149,14 @@ if "__main__" == __name__:
                         "%Y-%m-%d-T%H+%M+%S"
                     )
                     os.makedirs(data_path / f"{season}", exist_ok=True)
-                    with open(
-                        data_path / f"{season}" / f"{a}_{c}_{time_str}.json",
-                        "w+",
-                    ) as f:
-                        json.dump(data, f)
+                    file_path = data_path / f"{season}" / f"{a}_{c}_{time_str}"
+                    if args.format in ("json", "both"):
+                        with open(file_path.parent / f"{file_path.name}.json", "w+") as f:
+                            json.dump(data, f)
+                    if args.format in ("archive", "both"):
+                        write_archive(file_path.parent / f"{file_path.name}.npz", data)
+                    if crawl_index is not None:
+                        crawl_index.save(a, c)
                     jobs.remove(job)
                 except Exception as e:
                     logging.error(f"{c} crashed, up for retry")
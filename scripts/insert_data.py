@@ -1,4 +1,3 @@
-import json
 import logging
 import sys
 from datetime import datetime
@@ -8,12 +7,18 @@ from sqlalchemy import create_engine
 
 sys.path.append(str(Path(".").absolute()))
 
+from src.archive import load_crawl
 from src.insert import (
+    IdentityCache,
+    bulk_populate,
+    bulk_populate_files,
     populate_clubs_and_teams,
     populate_competitions,
     populate_players,
     populate_teammatches,
+    stream_populate,
 )
+from src.migrations import migrate_database
 
 if __name__ == "__main__":
     logging.basicConfig(encoding="utf-8", level=logging.INFO)
@@ -26,21 +31,54 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--data",
-        help="Path to the data to be inserted. Expecting a json file",
+        help="Path to the data to be inserted. Expecting a json file or an archive (.npz)",
         required=True,
         nargs="+",
     )
+    parser.add_argument(
+        "--bulk",
+        help="Insert each file with set based lookups in a single transaction.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stream",
+        help="Read each file incrementally and insert records while parsing.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--workers",
+        help="Parse files in this many processes and write them in date order. Implies --bulk.",
+        type=int,
+    )
     args = parser.parse_args()
 
     engine = create_engine(f"sqlite:///{args.database}")
+    # every mode writes the columns of the current schema, the bulk modes also rely on its unique indexes
+    migrate_database(engine)
+    if not (args.bulk or args.workers):
+        # lookups of clubs, teams and players during this run
+        cache = IdentityCache(engine)
+
+    if args.workers:
+        for data_path, added in bulk_populate_files(engine, args.data, workers=args.workers):
+            logging.info(f"Inserted {data_path}: {added}")
+        sys.exit(0)
 
     for data_path in args.data:
         data_path = Path(data_path)
 
-        with open(data_path, "r") as f:
-            crawled_results = json.load(f)
+        if args.stream and not args.bulk and data_path.suffix == ".json":
+            stream_populate(engine, data_path, cache=cache)
+            continue
+
+        crawled_results = load_crawl(data_path)
         crawled_results["season"] = datetime.fromisoformat(crawled_results["season"])
 
+        if args.bulk:
+            added = bulk_populate(engine, crawled_results)
+            logging.info(f"Inserted {data_path}: {added}")
+            continue
+
         populate_competitions(
             engine,
             crawled_results["crawled_competitions"],
@@ -57,6 +95,7 @@ if __name__ == "__main__":
                     association,
                     competition,
                     season=crawled_results["season"],
+                    cache=cache,
                 )
                 populate_players(
                     engine,
@@ -64,10 +103,12 @@ if __name__ == "__main__":
                     association,
                     competition,
                     season=crawled_results["season"],
+                    cache=cache,
                 )
                 populate_teammatches(
                     engine,
                     crawled_results[association][competition]["team_matches"],
                     crawled_results[association][competition]["matches"],
                     season=crawled_results["season"],
+                    cache=cache,
                 )
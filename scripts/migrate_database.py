@@ -0,0 +1,23 @@
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(".").absolute()))
+import sqlalchemy
+
+from src.migrations import migrate_database
+
+if "__main__" == __name__:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Add tables and indexes of the current schema to an existing database."
+    )
+    logging.basicConfig(encoding="utf-8", level=logging.INFO)
+
+    parser.add_argument("-db", "--database", required=True, help="Path to the database.")
+    args = parser.parse_args()
+
+    engine = sqlalchemy.create_engine(f"sqlite:///{args.database}")
+    created = migrate_database(engine)
+    logging.info(f"Created {len(created)} indexes")
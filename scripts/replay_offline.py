@@ -0,0 +1,76 @@
+import logging
+import sys
+import time
+from pathlib import Path
+
+import trueskill
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.offline import (
+    OfflineReplay,
+    write_history_csv,
+    write_ratings_csv,
+    write_ratings_npz,
+)
+
+if "__main__" == __name__:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Compute ratings from crawled files without a database."
+    )
+    logging.basicConfig(encoding="utf-8", level=logging.INFO)
+
+    parser.add_argument(
+        "--data", help="Crawled json files or archives.", required=True, nargs="+"
+    )
+    parser.add_argument(
+        "--out", help="Directory of the ratings and history.", required=True
+    )
+    parser.add_argument(
+        "--format",
+        help="csv writes ratings.csv and history.csv, npz writes ratings.npz.",
+        choices=["csv", "npz"],
+        default="csv",
+    )
+    parser.add_argument("--mu", type=float, default=trueskill.MU)
+    parser.add_argument("--sigma", type=float, default=trueskill.SIGMA)
+    parser.add_argument("--beta", type=float, default=trueskill.BETA)
+    parser.add_argument("--tau", type=float, default=trueskill.TAU)
+    parser.add_argument(
+        "--draw-probability", type=float, default=trueskill.DRAW_PROBABILITY
+    )
+    parser.add_argument(
+        "--repeat",
+        help="Replay n times and report the time per replay.",
+        default=1,
+        type=int,
+    )
+    args = parser.parse_args()
+
+    env = trueskill.TrueSkill(
+        mu=args.mu,
+        sigma=args.sigma,
+        beta=args.beta,
+        tau=args.tau,
+        draw_probability=args.draw_probability,
+    )
+    start = time.perf_counter()
+    replay = OfflineReplay.from_files(args.data)
+    logging.info(
+        f"Loaded {len(replay.legs)} legs of {len(replay.keys)} ratings in {time.perf_counter() - start:.2f}s"
+    )
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        ratings = replay.replay(env)
+    logging.info(f"{(time.perf_counter() - start) / args.repeat * 1e3:.1f}ms per replay")
+
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if args.format == "csv":
+        write_ratings_csv(out_dir / "ratings.csv", ratings)
+        write_history_csv(out_dir / "history.csv", ratings)
+    else:
+        write_ratings_npz(out_dir / "ratings.npz", ratings)
@@ -0,0 +1,59 @@
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.sweep import PARAMETERS, grid_search, random_search, sweep, write_sweep_csv
+
+if "__main__" == __name__:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Score TrueSkill parameters by the log-loss and Brier score of pre-match win probabilities."
+    )
+    logging.basicConfig(encoding="utf-8", level=logging.INFO)
+
+    parser.add_argument(
+        "--data", help="Crawled json files or archives.", required=True, nargs="+"
+    )
+    parser.add_argument("--out", help="Csv file of the ranked configurations.")
+    for name in PARAMETERS:
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            help=f"Values of {name} for the grid, or (low, high) with --random.",
+            nargs="+",
+            type=float,
+        )
+    parser.add_argument(
+        "--random",
+        help="Draw n random configurations from the given ranges instead of a grid.",
+        type=int,
+    )
+    parser.add_argument("--seed", help="Seed of the random search.", default=0, type=int)
+    parser.add_argument(
+        "--workers", help="Number of worker processes. Defaults to the number of cores.", type=int
+    )
+    parser.add_argument("--top", help="Number of configurations to print.", default=10, type=int)
+    args = parser.parse_args()
+
+    values = {name: getattr(args, name) for name in PARAMETERS if getattr(args, name) is not None}
+    if args.random:
+        for name, bounds in values.items():
+            if len(bounds) != 2:
+                parser.error(f"--{name.replace('_', '-')} needs low and high with --random")
+        configs = random_search(args.random, seed=args.seed, **values)
+    else:
+        configs = grid_search(**values)
+
+    start = time.perf_counter()
+    results = sweep(args.data, configs, workers=args.workers)
+    logging.info(f"Scored {len(configs)} configurations in {time.perf_counter() - start:.1f}s")
+
+    print(" ".join(f"{column:>16}" for column in ["rank", *PARAMETERS, "log_loss", "brier", "accuracy"]))
+    for rank, (config, score) in enumerate(results[: args.top], start=1):
+        row = [rank, *(config[name] for name in PARAMETERS), score.log_loss, score.brier, score.accuracy]
+        print(" ".join(f"{value:>16.4f}" if isinstance(value, float) else f"{value:>16}" for value in row))
+    if args.out:
+        write_sweep_csv(args.out, results)
@@ -0,0 +1,280 @@
+import json
+import struct
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# crawl metadata stored in the "meta" column, in this order
+META_KEYS = ["season", "from_date", "crawled_date"]
+# -1 marks a missing string, e.g. a player without team rank
+MISSING = -1
+
+# crawled team match fields and the columns holding their codes
+TEAM_MATCH_COLUMNS = {
+    "date": "team_match_date",
+    "home_team": "team_match_home",
+    "away_team": "team_match_away",
+    "result": "team_match_result",
+    "legs": "team_match_legs",
+    "competition": "team_match_competition_name",
+    "association": "team_match_association",
+}
+
+COLUMNS = {
+    "meta": np.int32,
+    "competition_association": np.int32,
+    "competition_name": np.int32,
+    "team_competition": np.int32,
+    "team_club": np.int32,
+    "team_rank": np.int32,
+    "player_competition": np.int32,
+    "player_association_id": np.int32,
+    "player_name": np.int32,
+    "player_club": np.int32,
+    "player_rank": np.int32,
+    "team_match_competition": np.int32,
+    **{column: np.int32 for column in TEAM_MATCH_COLUMNS.values()},
+    "team_match_has_legs": np.bool_,
+    "team_match_leg_offsets": np.int64,
+    "leg_home": np.int32,
+    "leg_away": np.int32,
+    "leg_result": np.int32,
+    "leg_number": np.int16,
+}
+
+
+class StringDictionary:
+    """Assigns consecutive codes to strings, used to dictionary encode all text columns."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, value):
+        if value is None:
+            return MISSING
+        return self.codes.setdefault(value, len(self.codes))
+
+    def columns(self):
+        encoded = [value.encode("utf-8") for value in self.codes]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return {"strings_data": data, "strings_offsets": offsets}
+
+
+def write_archive(path, crawled_results: dict, compress: bool = True):
+    """Write a crawled file as dictionary encoded columns into a .npz archive.
+
+    Every string (names, teams, dates, results) is stored once and referenced by an int32 code.
+    Uncompressed archives can be memory mapped by read_columns, compressed ones are smaller.
+
+    Args:
+        path (Union[str, Path]): Destination of the archive.
+        crawled_results (dict): Crawled file in the json layout. The season may be a datetime.
+        compress (bool, optional): Deflate the columns, otherwise they can be memory mapped. Defaults to True.
+    """
+    strings = StringDictionary()
+    columns = {name: [] for name in COLUMNS}
+
+    for key in META_KEYS:
+        value = crawled_results.get(key)
+        columns["meta"].append(strings.encode(value.isoformat() if isinstance(value, datetime) else value))
+    for association, competitions in crawled_results["crawled_competitions"].items():
+        for competition in competitions:
+            comp_index = len(columns["competition_association"])
+            columns["competition_association"].append(strings.encode(association))
+            columns["competition_name"].append(strings.encode(competition))
+            crawled = crawled_results[association][competition]
+
+            for club, ranks in crawled["clubs_teams"].items():
+                for rank in ranks or [None]:
+                    columns["team_competition"].append(comp_index)
+                    columns["team_club"].append(strings.encode(club))
+                    columns["team_rank"].append(strings.encode(rank))
+
+            for player in crawled["players"]:
+                assoc_id, name, club, *rank = player
+                columns["player_competition"].append(comp_index)
+                columns["player_association_id"].append(strings.encode(assoc_id))
+                columns["player_name"].append(strings.encode(name))
+                columns["player_club"].append(strings.encode(club))
+                columns["player_rank"].append(strings.encode(rank[0]) if rank else MISSING)
+
+            n_legs = len(columns["leg_home"])
+            for team_match, legs in zip(crawled["team_matches"], crawled["matches"]):
+                columns["team_match_competition"].append(comp_index)
+                for key, column in TEAM_MATCH_COLUMNS.items():
+                    columns[column].append(strings.encode(team_match[key]))
+                columns["team_match_has_legs"].append(legs is not None)
+                for leg in legs or []:
+                    columns["leg_home"].append(strings.encode(leg["home_player"]))
+                    columns["leg_away"].append(strings.encode(leg["away_player"]))
+                    columns["leg_result"].append(strings.encode(leg["result"]))
+                    columns["leg_number"].append(leg["match_number"])
+                n_legs += len(legs or [])
+                columns["team_match_leg_offsets"].append(n_legs)
+
+    arrays = {name: np.asarray(values, dtype=COLUMNS[name]) for name, values in columns.items()}
+    arrays["team_match_leg_offsets"] = np.concatenate([[0], arrays["team_match_leg_offsets"]])
+    arrays.update(strings.columns())
+    save = np.savez_compressed if compress else np.savez
+    with open(path, "wb") as f:
+        save(f, **arrays)
+
+
+def read_columns(path):
+    """Open the columns of an archive. Uncompressed members are memory mapped, compressed ones are read.
+
+    Args:
+        path (Union[str, Path]): Path to the archive.
+
+    Returns:
+        dict: Column name to numpy array.
+    """
+    columns = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename.removesuffix(".npy")
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    columns[name] = np.lib.format.read_array(member)
+                continue
+            # the local header may carry a different extra field than the central directory
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if 0 in shape:
+                columns[name] = np.zeros(shape, dtype=dtype)
+                continue
+            columns[name] = np.memmap(
+                path,
+                dtype=dtype,
+                mode="r",
+                offset=f.tell(),
+                shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return columns
+
+
+class Archive:
+    """Read access to an archived crawl.
+
+    Args:
+        path (Union[str, Path]): Path to the archive.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.columns = read_columns(path)
+        self.strings = self._decode_strings()
+
+    def _decode_strings(self):
+        data = self.columns["strings_data"].tobytes()
+        offsets = self.columns["strings_offsets"].tolist()
+        return [data[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def string(self, code):
+        return None if code == MISSING else self.strings[code]
+
+    def decode(self, name):
+        """Strings of a dictionary encoded column."""
+        return [self.string(code) for code in self.columns[name].tolist()]
+
+    def to_crawled_results(self):
+        """Rebuild the json layout of the crawled file, as json.load would return it.
+
+        Returns:
+            dict: Crawled results with the season as string.
+        """
+        crawled_results = {
+            key: self.string(code) for key, code in zip(META_KEYS, self.columns["meta"].tolist())
+        }
+        crawled_results["crawled_competitions"] = {}
+        competitions = []
+        for association, competition in zip(
+            self.decode("competition_association"), self.decode("competition_name")
+        ):
+            crawled_results["crawled_competitions"].setdefault(association, []).append(competition)
+            crawled = {"clubs_teams": {}, "matches": [], "players": [], "team_matches": []}
+            crawled_results.setdefault(association, {})[competition] = crawled
+            competitions.append(crawled)
+
+        for comp_index, club, rank in zip(
+            self.columns["team_competition"].tolist(), self.decode("team_club"), self.decode("team_rank")
+        ):
+            ranks = competitions[comp_index]["clubs_teams"].setdefault(club, [])
+            if rank is not None:
+                ranks.append(rank)
+
+        for comp_index, *player in zip(
+            self.columns["player_competition"].tolist(),
+            self.decode("player_association_id"),
+            self.decode("player_name"),
+            self.decode("player_club"),
+            self.columns["player_rank"].tolist(),
+        ):
+            *player, rank = player
+            if rank != MISSING:
+                player.append(self.string(rank))
+            competitions[comp_index]["players"].append(player)
+
+        legs = [
+            {"home_player": home, "result": result, "away_player": away, "match_number": number}
+            for home, result, away, number in zip(
+                self.decode("leg_home"),
+                self.decode("leg_result"),
+                self.decode("leg_away"),
+                self.columns["leg_number"].tolist(),
+            )
+        ]
+        offsets = self.columns["team_match_leg_offsets"].tolist()
+        fields = zip(*[self.decode(column) for column in TEAM_MATCH_COLUMNS.values()])
+        for i, (comp_index, has_legs, values) in enumerate(
+            zip(
+                self.columns["team_match_competition"].tolist(),
+                self.columns["team_match_has_legs"].tolist(),
+                fields,
+            )
+        ):
+            competitions[comp_index]["team_matches"].append(dict(zip(TEAM_MATCH_COLUMNS, values)))
+            competitions[comp_index]["matches"].append(legs[offsets[i] : offsets[i + 1]] if has_legs else None)
+        return crawled_results
+
+
+def read_archive(path):
+    """Read an archived crawl into the json layout of the crawler.
+
+    Args:
+        path (Union[str, Path]): Path to the archive.
+
+    Returns:
+        dict: Crawled results with the season as string.
+    """
+    return Archive(path).to_crawled_results()
+
+
+def load_crawl(path):
+    """Read a crawled file, either json or an archive written by write_archive.
+
+    Args:
+        path (Union[str, Path]): Path to the crawled file.
+
+    Returns:
+        dict: Crawled results with the season as string.
+    """
+    if Path(path).suffix == ".npz":
+        return read_archive(path)
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from urllib.parse import urlsplit
+
+import requests
+
+from .http_crawler import ASSOCIATION_KEY, COMPETITION_KEY, REPORT_KEY, Http2K, pooled_session
+from .page_parser import (
+    parse_associations,
+    parse_competitions,
+    parse_gameplan,
+    parse_match_report,
+    parse_squads,
+)
+
+# answers worth another try, everything else of 4xx fails right away
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+CompetitionCrawl = namedtuple(
+    "CompetitionCrawl", ["association", "competition", "teams", "players", "team_matches", "matches"]
+)
+
+
+class TokenBucket:
+    """Rate limit of `rate` requests per second with bursts of up to `capacity` requests."""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RetryableStatus(requests.HTTPError):
+    pass
+
+
+class AsyncFetcher:
+    """GET requests from asyncio with bounded concurrency and a rate limit per host.
+
+    Requests wait in FIFO order for a slot of their host, so a crawl keeps one queue across all
+    associations and competitions. Failed requests are retried on their own with exponential
+    backoff, while the slot is free for other requests.
+
+    Args:
+        session (requests.Session, optional): Session to send requests with. Defaults to a pooled session without retries.
+        per_host (int, optional): Requests in flight per host. Defaults to 4.
+        rate (float, optional): Requests per second per host, None for no limit. Defaults to None.
+        burst (int, optional): Requests that may be sent at once after an idle period. Defaults to 1.
+        retries (int, optional): Retries per request. Defaults to 4.
+        backoff (float, optional): Delay before the first retry in seconds, doubled for every further one. Defaults to 0.5.
+        timeout (float, optional): Timeout per request in seconds. Defaults to 30.
+    """
+
+    def __init__(
+        self,
+        session: requests.Session = None,
+        per_host: int = 4,
+        rate: float = None,
+        burst: int = 1,
+        retries: int = 4,
+        backoff: float = 0.5,
+        timeout: float = 30,
+    ):
+        self.session = pooled_session(pool_size=per_host, retries=0) if session is None else session
+        self.per_host = per_host
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.n_requests = 0
+        self.n_retries = 0
+        self._loop = None
+        self._slots = {}
+        self._buckets = {}
+        self._executors = {}
+
+    def _host(self, url: str):
+        # semaphores and locks belong to an event loop, every asyncio.run gets new ones
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._slots, self._buckets = {}, {}
+        host = urlsplit(url).netloc
+        if host not in self._slots:
+            self._slots[host] = asyncio.Semaphore(self.per_host)
+            self._buckets[host] = TokenBucket(self.rate, self.burst) if self.rate else None
+        if host not in self._executors:
+            # requests blocks, every slot gets a thread
+            self._executors[host] = ThreadPoolExecutor(max_workers=self.per_host)
+        return self._slots[host], self._buckets[host], self._executors[host]
+
+    def _get(self, url: str, params: dict):
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        if response.status_code in RETRY_STATUS:
+            raise RetryableStatus(f"{response.status_code} for {response.url}", response=response)
+        response.raise_for_status()
+        return response.text
+
+    async def get(self, url: str, params: dict = None):
+        """Text of a GET request.
+
+        Args:
+            url (str): The url.
+            params (dict, optional): Query parameters. Defaults to None.
+
+        Returns:
+            str: Body of the response.
+        """
+        slot, bucket, executor = self._host(url)
+        for attempt in range(self.retries + 1):
+            async with slot:
+                if bucket is not None:
+                    await bucket.acquire()
+                try:
+                    text = await self._loop.run_in_executor(executor, partial(self._get, url, params))
+                except (requests.ConnectionError, requests.Timeout, RetryableStatus) as error:
+                    if attempt == self.retries:
+                        raise
+                    logging.debug(f"Retrying {url} {params} after {error}")
+                else:
+                    self.n_requests += 1
+                    return text
+            self.n_retries += 1
+            delay = self.backoff * 2**attempt
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+    def close(self):
+        for executor in self._executors.values():
+            executor.shutdown()
+        self.session.close()
+
+
+class AsyncCrawl2K:
+    """Crawls whole seasons with the requests of `Http2K`, all competitions at once.
+
+    Args:
+        season (int): Season to crawl. Determines crawler URL.
+        fetcher (AsyncFetcher, optional): Sends the requests. Defaults to AsyncFetcher().
+        url (str, optional): Dashboard url instead of the one of the season. Defaults to None.
+    """
+
+    def __init__(self, season, fetcher: AsyncFetcher = None, url: str = None):
+        self.pages = Http2K(season, url=url)
+        self.fetcher = AsyncFetcher() if fetcher is None else fetcher
+
+    async def fetch(self, view: str = "dashboard", **params):
+        return await self.fetcher.get(self.pages.url, self.pages.request_params(view, **params))
+
+    async def get_competitions(self, associations: list = None, competitions: list = None):
+        """Selection parameters of every competition to crawl.
+
+        Returns:
+            list: (association, competition, params) per competition.
+        """
+        association_keys = parse_associations(await self.fetch(), ASSOCIATION_KEY)
+        if associations is None:
+            associations = list(association_keys)
+        dashboards = await asyncio.gather(
+            *[self.fetch(**{ASSOCIATION_KEY: association_keys[assoc]}) for assoc in associations]
+        )
+        selected = []
+        for assoc, dashboard in zip(associations, dashboards):
+            competition_keys = parse_competitions(dashboard, COMPETITION_KEY)
+            for comp in competition_keys if competitions is None else competitions:
+                params = {ASSOCIATION_KEY: association_keys[assoc], COMPETITION_KEY: competition_keys[comp]}
+                selected.append((assoc, comp, params))
+        return selected
+
+    async def crawl_competition(
+        self, association: str, competition: str, params: dict, from_date: datetime, crawl_index=None
+    ):
+        """Squads, team matches and match reports of one competition.
+
+        Team matches that crawl_index knows at the same result are left out.
+
+        Returns:
+            CompetitionCrawl: Crawled data in the shape of the Crawler2K methods.
+        """
+        squads, gameplan = await asyncio.gather(self.fetch("squads", **params), self.fetch("gameplan", **params))
+        teams, players = parse_squads(squads)
+        played = parse_gameplan(gameplan, association, competition, from_date)
+        if crawl_index is not None:
+            played = [(info, key) for info, key in played if not crawl_index.is_current(info)]
+
+        async def report(matchday_info, key):
+            if key is None:
+                return None
+            matches = parse_match_report(await self.fetch("match_report", **{REPORT_KEY: key}))
+            if crawl_index is not None:
+                crawl_index.add(matchday_info, matches)
+            return matches
+
+        matches = await asyncio.gather(*[report(info, key) for info, key in played])
+        team_matches = [matchday_info for matchday_info, _ in played]
+        logging.info(f"Crawled {association}: {competition}, {len(team_matches)} team matches")
+        return CompetitionCrawl(association, competition, teams, players, team_matches, list(matches))
+
+    async def crawl(
+        self,
+        associations: list = None,
+        competitions: list = None,
+        from_date: datetime = datetime(2022, 8, 1),
+        crawl_index=None,
+    ):
+        """Crawl all selected competitions concurrently.
+
+        Args:
+            associations (list, optional): Associations to crawl. Defaults to all.
+            competitions (list, optional): Competitions to crawl per association. Defaults to all.
+            from_date (datetime, optional): Matches before this date are skipped. Defaults to datetime(2022, 8, 1).
+            crawl_index (CrawlIndex, optional): Skips matches crawled before at the same result
+                and remembers the new ones. Defaults to None.
+
+        Returns:
+            tuple: CompetitionCrawl per finished competition and (association, competition, error) per failed one.
+        """
+        selected = await self.get_competitions(associations, competitions)
+        results = await asyncio.gather(
+            *[
+                self.crawl_competition(assoc, comp, params, from_date, crawl_index)
+                for assoc, comp, params in selected
+            ],
+            return_exceptions=True,
+        )
+        crawled, failed = [], []
+        for (assoc, comp, _), result in zip(selected, results):
+            if isinstance(result, Exception):
+                logging.error(f"{assoc}: {comp} failed, {result}")
+                failed.append((assoc, comp, result))
+            else:
+                crawled.append(result)
+        return crawled, failed
+
+    def run(self, *args, **kwargs):
+        """`crawl` from synchronous code."""
+        return asyncio.run(self.crawl(*args, **kwargs))
+
+
+def competition_results(crawl: CompetitionCrawl, season: datetime, from_date: datetime):
+    """Results of one competition in the standard format of the crawler files.
+
+    Args:
+        crawl (CompetitionCrawl): Crawled competition.
+        season (datetime): Start of the season.
+        from_date (datetime): Matches before this date were ignored.
+
+    Returns:
+        dict: Results in standard format.
+    """
+    return {
+        "from_date": from_date.isoformat(),
+        "crawled_date": datetime.now().isoformat(),
+        "season": season.isoformat(),
+        "crawled_competitions": {crawl.association: [crawl.competition]},
+        crawl.association: {
+            crawl.competition: {
+                "clubs_teams": {club: list(club_teams) for club, club_teams in crawl.teams.items()},
+                "matches": crawl.matches,
+                "players": crawl.players,
+                "team_matches": [{**match, "date": match["date"].isoformat()} for match in crawl.team_matches],
+            }
+        },
+    }
@@ -0,0 +1,180 @@
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.expected_conditions import (
+    invisibility_of_element_located,
+    staleness_of,
+    visibility_of_element_located,
+)
+from selenium.webdriver.support.wait import WebDriverWait
+
+# Counts mutations below the element with id arguments[0], or anywhere for null. The element may be
+# replaced by its parent, so added nodes that contain it count as well.
+ARM_SCRIPT = """
+var id = arguments[0];
+var state = window.__crawlWait = window.__crawlWait || {};
+if (state.observer) { state.observer.disconnect(); }
+state.mutations = 0;
+state.last = performance.now();
+function inArea(record) {
+    if (!id) { return true; }
+    var node = record.target.nodeType === 1 ? record.target : record.target.parentElement;
+    if (node && (node.id === id || node.closest('#' + id))) { return true; }
+    for (var i = 0; i < record.addedNodes.length; i++) {
+        var added = record.addedNodes[i];
+        if (added.nodeType === 1 && (added.id === id || added.querySelector('#' + id))) { return true; }
+    }
+    return false;
+}
+state.observer = new MutationObserver(function (records) {
+    if (records.some(inArea)) {
+        state.mutations += 1;
+        state.last = performance.now();
+    }
+});
+state.observer.observe(document.body, {childList: true, subtree: true, characterData: true});
+"""
+
+# [settled, mutations]: the document is loaded, jQuery has no request in flight and the observed
+# area did not change for arguments[0] milliseconds.
+SETTLED_SCRIPT = """
+var state = window.__crawlWait || {last: 0, mutations: 0};
+var ajax = window.jQuery ? window.jQuery.active : 0;
+var idle = document.readyState === 'complete' && ajax === 0;
+return [idle && performance.now() - state.last >= arguments[0], state.mutations];
+"""
+
+
+class LatencyStats:
+    """Durations of crawler steps, to see where crawl time goes."""
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.timeouts = defaultdict(int)
+
+    def record(self, step: str, seconds: float):
+        self.durations[step].append(seconds)
+
+    @contextmanager
+    def timed(self, step: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(step, time.perf_counter() - start)
+
+    def summary(self):
+        """Count, total, mean, median, 95th percentile and maximum in seconds and timeouts per step.
+
+        Returns:
+            dict: Step to a dict of statistics, the steps with the largest total first.
+        """
+        summary = {}
+        for step, durations in self.durations.items():
+            ordered = sorted(durations)
+            summary[step] = {
+                "count": len(ordered),
+                "total": sum(ordered),
+                "mean": sum(ordered) / len(ordered),
+                "median": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                "max": ordered[-1],
+                "timeouts": self.timeouts[step],
+            }
+        return dict(sorted(summary.items(), key=lambda item: item[1]["total"], reverse=True))
+
+    def log(self, level=logging.INFO):
+        for step, stats in self.summary().items():
+            logging.log(
+                level,
+                f"{step}: {stats['count']}x, total {stats['total']:.1f}s, mean {stats['mean']:.3f}s, "
+                f"p95 {stats['p95']:.3f}s, max {stats['max']:.3f}s, {stats['timeouts']} timeouts",
+            )
+
+
+class BrowserWaits:
+    """Explicit waits of the crawler instead of fixed sleeps.
+
+    Clicks on the dashboard load their content with jQuery, a step is done once no request is in
+    flight and the area it updates stopped changing for `quiet` seconds. Steps that update a named
+    area also need at least one change of it, otherwise the quiet period before the request starts
+    would count as settled. A click that changes nothing therefore waits until the timeout.
+
+    Args:
+        browser (WebDriver): The browser.
+        timeout (float, optional): Longest wait per step in seconds. Defaults to 15.
+        quiet (float, optional): Seconds without changes that count as settled. Defaults to 0.15.
+        poll (float, optional): Seconds between checks. Defaults to 0.05.
+        stats (LatencyStats, optional): Collects the duration of every step. Defaults to a new one.
+    """
+
+    def __init__(self, browser, timeout: float = 15, quiet: float = 0.15, poll: float = 0.05, stats: LatencyStats = None):
+        self.browser = browser
+        self.timeout = timeout
+        self.quiet = quiet
+        self.poll = poll
+        self.stats = LatencyStats() if stats is None else stats
+
+    def _wait(self, step: str, condition, timeout: float = None):
+        try:
+            return WebDriverWait(self.browser, timeout or self.timeout, poll_frequency=self.poll).until(condition)
+        except TimeoutException:
+            self.stats.timeouts[step] += 1
+            logging.warning(f"Timed out waiting for {step}")
+            return None
+
+    def settled(self, driver, changed: bool = False):
+        """Whether the page is idle and quiet, with changed=True also whether the observed area changed."""
+        settled, mutations = driver.execute_script(SETTLED_SCRIPT, int(self.quiet * 1000))
+        return settled and (not changed or mutations > 0)
+
+    def _updated(self, area_id: str):
+        # a named area has to change before it counts as settled
+        return partial(self.settled, changed=area_id is not None)
+
+    def after(self, step: str, action, area_id: str = None):
+        """Run an action, e.g. a click, and wait until the page settled.
+
+        Args:
+            step (str): Name of the step in the statistics.
+            action (Callable): The action.
+            area_id (str, optional): Id of the element the action updates. Defaults to the whole page.
+
+        Returns:
+            Any: Result of the action.
+        """
+        with self.stats.timed(step):
+            self.browser.execute_script(ARM_SCRIPT, area_id)
+            result = action()
+            self._wait(step, self._updated(area_id))
+        return result
+
+    def reload(self, step: str = "reload"):
+        """Reload the page and wait until the new document is loaded and idle."""
+        with self.stats.timed(step):
+            html = self.browser.find_element(By.TAG_NAME, "html")
+            self.browser.execute_script("window.location.reload();")
+            self._wait(step, staleness_of(html))
+            self.browser.execute_script(ARM_SCRIPT, None)
+            self._wait(step, self.settled)
+
+    def modal_shown(self, step: str, modal_id: str, action):
+        """Run an action that opens a modal and wait until it is visible and its content settled."""
+        with self.stats.timed(step):
+            self.browser.execute_script(ARM_SCRIPT, modal_id)
+            action()
+            self._wait(step, visibility_of_element_located((By.ID, modal_id)))
+            self._wait(step, self._updated(modal_id))
+
+    def modal_hidden(self, step: str, modal_id: str, action=None):
+        """Run an action that closes a modal, if any, and wait until the modal and its backdrop are gone."""
+        with self.stats.timed(step):
+            if action is not None:
+                action()
+            self._wait(step, invisibility_of_element_located((By.ID, modal_id)))
+            self._wait(step, invisibility_of_element_located((By.CLASS_NAME, "modal-backdrop")))
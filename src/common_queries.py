@@ -1,39 +1,227 @@
-from sqlalchemy import select, insert, update, create_engine, Date, and_, Engine
+from sqlalchemy import select, insert, update, create_engine, Date, and_, Engine, event, func
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session, aliased
 from tqdm import tqdm
 import datetime
+import functools
+import threading
+import time
+import weakref
 import trueskill
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 
 import schema
 
+# cached results of the decorated queries, least recently used ones are dropped first
+CACHE_SIZE = 256
+# seconds a generation read from the database is trusted, commits through the same engine expire it at once
+GENERATION_TTL = 1.0
 
-def leaderboard(engine: Engine, competition : str, season : datetime, conservative=True):
-    # return player and their conservative rating mu - 3sigma
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "size", "maxsize"])
+
+
+def _freeze(value):
+    """Hashable form of a query argument, lists of PlayerTuples included."""
+    if isinstance(value, trueskill.Rating):
+        return (value.mu, value.sigma)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        frozen = tuple(_freeze(v) for v in value)
+        return frozenset(frozen) if isinstance(value, (set, frozenset)) else frozen
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    hash(value)
+    return value
+
+
+def _data_generation(engine: Engine):
+    """Generation counter that inserts and rating runs bump, None if the database predates it."""
+    try:
+        with engine.connect() as connection:
+            generation = connection.execute(
+                select(schema.DataGeneration.generation).where(schema.DataGeneration.id == 1)
+            ).scalar()
+    except OperationalError:
+        return None
+    return generation or 0
+
+
+class _EngineState:
+    """Generation of the cached entries of one engine and when it was read."""
+
+    def __init__(self):
+        self.generation = None
+        self.checked = None
+
+    def expire(self, connection):
+        # commit listener, holds no reference to the engine
+        self.checked = None
+
+
+class QueryCache:
+    """Read-through LRU cache of query results, keyed by engine, query and arguments.
+
+    `compute_ratings` and the insert functions bump the generation counter of the database in
+    their write transactions, results of an older generation are dropped. The counter is read at
+    most once per `ttl` seconds and after every commit through the engine, so cache hits do not
+    touch the database. Writes of other processes are seen after at most `ttl` seconds.
+
+    Engines are only referenced weakly, the entries of a collected engine are dropped with it.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = GENERATION_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # (engine state, query, args, kwargs) -> result
+        self.states = weakref.WeakKeyDictionary()  # engine -> _EngineState
+        self.collected = []  # states of collected engines whose entries are still cached
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _state(self, engine: Engine):
+        state = self.states.get(engine)
+        if state is None:
+            state = self.states[engine] = _EngineState()
+            event.listen(engine, "commit", state.expire)
+            # garbage collection may run while the lock is held, the entries are dropped later
+            weakref.finalize(engine, self.collected.append, state)
+        return state
+
+    def _generation(self, engine: Engine):
+        with self.lock:
+            while self.collected:
+                self._drop(self.collected.pop())
+            state = self._state(engine)
+            if state.checked is not None and time.monotonic() - state.checked < self.ttl:
+                return state, state.generation
+        generation = _data_generation(engine)
+        with self.lock:
+            state.checked = time.monotonic()
+            if state.generation != generation:
+                self._drop(state)
+                state.generation = generation
+        return state, generation
+
+    def get(self, engine: Engine, query, args: tuple, kwargs: dict):
+        """Return the cached result of query(engine, *args, **kwargs) or run and cache it."""
+        try:
+            key = (query.__name__, _freeze(args), _freeze(kwargs))
+        except TypeError:
+            # unhashable arguments are never cached
+            return query(engine, *args, **kwargs)
+        state, generation = self._generation(engine)
+        if generation is None:
+            return query(engine, *args, **kwargs)
+        key = (state, *key)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self._copy(self.entries[key])
+            self.misses += 1
+
+        result = query(engine, *args, **kwargs)
+        with self.lock:
+            # a newer generation read in the meantime must not get this result
+            if state.generation == generation:
+                self.entries[key] = result
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return self._copy(result)
+
+    def _drop(self, state: _EngineState):
+        for key in [key for key in self.entries if key[0] is state]:
+            del self.entries[key]
+
+    @staticmethod
+    def _copy(result):
+        # callers may sort or extend the returned lists
+        return list(result) if isinstance(result, list) else result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            for state in self.states.values():
+                state.generation = state.checked = None
+            self.hits = self.misses = 0
+
+    def info(self):
+        with self.lock:
+            while self.collected:
+                self._drop(self.collected.pop())
+            return CacheInfo(self.hits, self.misses, len(self.entries), self.maxsize)
+
+
+query_cache = QueryCache()
+
+
+def cached_query(query):
+    """Serve a query from `query_cache`, the uncached query stays available as `__wrapped__`."""
+
+    @functools.wraps(query)
+    def wrapper(engine: Engine, *args, **kwargs):
+        return query_cache.get(engine, query, args, kwargs)
+
+    return wrapper
+
+
+@cached_query
+def leaderboard(engine: Engine, competition : str, season : datetime, conservative=True, offset : int = 0, limit : int = None):
+    """Ranked players of a competition, read from the leaderboard that `compute_ratings` maintains.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+        competition (str): Name of the competition.
+        season (datetime): Season of the competition.
+        conservative (bool, optional): Rank by mu - 3 sigma instead of mu. Defaults to True.
+        offset (int, optional): Number of top entries to skip, for paging. Defaults to 0.
+        limit (int, optional): Maximal number of entries. Defaults to None.
+
+    Returns:
+        list: PlayerRating tuples sorted by rating.
+    """
     PlayerRating = namedtuple("PlayerRating", ["name", "id", "rating", "club"])
+    board = schema.Leaderboard
+    comp_id = select(schema.Competition.id).where(
+        (schema.Competition.name == competition) & (schema.Competition.year == season)
+    ).scalar_subquery()
+    rating = board.conservative_rating if conservative else board.rating_mu
+    # both orders are covered by an index on (competition, ...)
+    order = (board.rank, board.id) if conservative else (board.rating_mu.desc(), board.id)
+    stmt = (
+        select(board.name, board.player, rating, board.club_name)
+        .where(board.competition == comp_id)
+        .order_by(*order)
+        .offset(offset)
+        .limit(limit)
+    )
     with Session(engine) as session:
-        # select competition from name
-        comp_stmt = select(schema.Competition.id).where((schema.Competition.name == competition) & (schema.Competition.year == season))
-        comp_id = session.execute(comp_stmt).first()
-        rating_stmt = select(schema.SkillRating, schema.Player, schema.Club).where(
-            (schema.SkillRating.player == schema.Player.id) & 
-            (schema.SkillRating.competition == comp_id[0]) & 
-            (schema.Player.club == schema.Club.id)
-        )
-        ratings = session.execute(rating_stmt).all()
-        leaderboard = []
-        for rating, player, club in ratings:
-            if player.association_id == "":
-                continue
-            r = rating.rating_mu - (3 * rating.rating_sigma)
-            if not conservative:
-                r = rating.rating_mu
-            player_rating = PlayerRating(player.name, player.id, r, club.name)
-            leaderboard.append(player_rating)
-    
-    leaderboard = sorted(leaderboard, key = lambda p : p.rating, reverse=True)
-    return leaderboard
+        result = session.execute(stmt).all()
+    return [PlayerRating(*row) for row in result]
 
+
+def leaderboard_rank(engine: Engine, player_id : int, team_id : int = None):
+    """Leaderboard entries of a player, one per team, with their rank within the competition.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+        player_id (int): Database id of the player.
+        team_id (int, optional): Only return the entry for this team. Defaults to None.
+
+    Returns:
+        list: LeaderboardRank tuples (competition, team, rank, rating).
+    """
+    LeaderboardRank = namedtuple("LeaderboardRank", ["competition", "team", "rank", "rating"])
+    board = schema.Leaderboard
+    stmt = select(board.competition, board.team, board.rank, board.conservative_rating).where(board.player == player_id)
+    if team_id is not None:
+        stmt = stmt.where(board.team == team_id)
+    with Session(engine) as session:
+        result = session.execute(stmt.order_by(board.competition)).all()
+    return [LeaderboardRank(*row) for row in result]
+
+@cached_query
 def get_associations_and_competitions(engine : Engine, association: str = None, season : datetime = None):
     with Session(engine) as session:
         stmt = select(schema.Competition)
@@ -45,6 +233,7 @@ def get_associations_and_competitions(engine : Engine, association: str = None,
     return result
 
 
+@cached_query
 def get_previous_matches(engine : Engine, my_players : list, other_players: list):
     """Get previous matches between any two player from the given teams.
 
@@ -76,59 +265,76 @@ def get_previous_matches(engine : Engine, my_players : list, other_players: list
     
     return match_strings
 
+@cached_query
 def get_player_skill_for_team(engine : Engine, club_name : str, competition : str, ignore_players : list = None):
+    """Get the rated players of a club that played singles in a competition, with one query.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+        club_name (str): Name of the club.
+        competition (str): Name of the competition, the latest season is used if the name is ambiguous.
+        ignore_players (list, optional): Names of players to leave out. Defaults to None.
+
+    Returns:
+        list: PlayerTuple (name, Player.id, trueskill.Rating) sorted by mu, best first.
+    """
     if ignore_players is None:
         ignore_players = []
 
     PlayerTuple = namedtuple("PlayerTuple", ["name", "id", "rating"])
 
+    club_id = select(schema.Club.id).where(schema.Club.name == club_name).scalar_subquery()
+    comp_id = (
+        select(schema.Competition.id)
+        .where(schema.Competition.name == competition)
+        .order_by(schema.Competition.year.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    played_singles = (
+        select(schema.SinglesMatch.id)
+        .join(schema.TeamMatch, schema.TeamMatch.id == schema.SinglesMatch.team_match)
+        .where(
+            (schema.TeamMatch.competition == comp_id)
+            & (
+                (schema.SinglesMatch.home_player == schema.Player.id)
+                | (schema.SinglesMatch.away_player == schema.Player.id)
+            )
+        )
+        .exists()
+    )
+    # ratings are kept per team, a player of several club teams in the competition gets the latest one
+    latest_first = func.row_number().over(
+        partition_by=schema.Player.id, order_by=schema.SkillRating.latest_update.desc()
+    ).label("latest_first")
+    ratings = (
+        select(
+            schema.Human.name,
+            schema.Player.id,
+            schema.SkillRating.rating_mu,
+            schema.SkillRating.rating_sigma,
+            latest_first,
+        )
+        .join(schema.Player, schema.Player.id == schema.SkillRating.player)
+        .join(schema.Human, schema.Human.id == schema.Player.human)
+        .join(schema.Team, schema.Team.id == schema.SkillRating.team)
+        .where(
+            (schema.Player.club == club_id)
+            & (schema.Team.club == club_id)
+            & (schema.Team.competition == comp_id)
+            & schema.Human.name.not_in(ignore_players)
+            & played_singles
+        )
+        .subquery()
+    )
+    stmt = (
+        select(ratings.c.name, ratings.c.id, ratings.c.rating_mu, ratings.c.rating_sigma)
+        .where(ratings.c.latest_first == 1)
+        .order_by(ratings.c.rating_mu.desc(), ratings.c.id)
+    )
     with Session(engine) as session:
-        # select club from clubname
-        club_stmt = select(schema.Club.id).where(schema.Club.name == club_name)
-        club_id = session.execute(club_stmt).first()
-        # select competition from name
-        comp_stmt = select(schema.Competition.id).where(schema.Competition.name == competition)
-        comp_id = session.execute(comp_stmt).first()
-        # select team matches for competition
-        team_match_stmt = select(schema.TeamMatch.id).where(schema.TeamMatch.competition == comp_id[0])
-        team_matches_id = session.execute(team_match_stmt).all()
-
-        # iterate over team_matches of this competition
-        # extract players that played for the relevant club
-        relevant_matches = []
-        for team_match_id in team_matches_id:
-            players_home_stmt = select(schema.SinglesMatch, schema.Player).join(
-                schema.Player, schema.SinglesMatch.home_player == schema.Player.id
-            ).where(
-                    (schema.SinglesMatch.team_match == team_match_id[0]) & \
-                    (schema.Player.club == club_id[0])
-                )
-            home_players_club = session.execute(players_home_stmt).all()
-            if home_players_club:
-                relevant_matches.extend(home_players_club)
-
-            players_away_stmt = select(schema.SinglesMatch, schema.Player).join(
-                schema.Player, schema.SinglesMatch.away_player == schema.Player.id
-            ).where(
-                    (schema.SinglesMatch.team_match == team_match_id[0]) & \
-                    (schema.Player.club == club_id[0])
-                )
-            away_players_club = session.execute(players_away_stmt).all()
-            if away_players_club:
-                relevant_matches.extend(away_players_club)
-
-        ratings = []
-        players_retrieved = []
-        for _, player in relevant_matches:
-            if player.id in players_retrieved or player.name in ignore_players:
-                continue
-            rating_stmt = select(schema.SkillRating).where((schema.SkillRating.player == player.id) & (schema.SkillRating.competition == comp_id[0]))
-            rating = session.execute(rating_stmt).first()
-            player_rating = PlayerTuple(player.name, player.association_id, trueskill.Rating(rating[0].rating_mu, rating[0].rating_sigma))
-            players_retrieved.append(player.id)
-
-            ratings.append(player_rating)
-    return ratings
+        result = session.execute(stmt).all()
+    return [PlayerTuple(name, player_id, trueskill.Rating(mu, sigma)) for name, player_id, mu, sigma in result]
 
 def get_positions_for_player(engine : Engine, player_id : int):
     with Session(engine) as session:
@@ -139,6 +345,93 @@ def get_positions_for_player(engine : Engine, player_id : int):
 
     return home_positions, away_positions
 
+def get_rating_trajectory(engine : Engine, player_id : int, team_id : int = None):
+    """Get the rating of a player after each of his team matches.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+        player_id (int): Database id of the player.
+        team_id (int, optional): Only return ratings for this team. Defaults to None.
+
+    Returns:
+        list: RatingPoint tuples ordered by date.
+    """
+    RatingPoint = namedtuple("RatingPoint", ["date", "team", "team_match", "mu", "sigma"])
+    with Session(engine) as session:
+        stmt = select(
+            schema.RatingHistory.date,
+            schema.RatingHistory.team,
+            schema.RatingHistory.team_match,
+            schema.RatingHistory.rating_mu,
+            schema.RatingHistory.rating_sigma,
+        ).where(schema.RatingHistory.player == player_id)
+        if team_id is not None:
+            stmt = stmt.where(schema.RatingHistory.team == team_id)
+        stmt = stmt.order_by(schema.RatingHistory.date)
+        result = session.execute(stmt).all()
+    return [RatingPoint(*row) for row in result]
+
+
+def leaderboard_at(engine : Engine, date : str, competition_id : int = None, conservative=True):
+    """Leaderboard as it was after all team matches up to a date.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+        date (str): ISO date or datetime, team matches at or before it are taken into account.
+            A date without time includes the whole day.
+        competition_id (int, optional): Only rank players of teams in this competition. Defaults to None.
+        conservative (bool, optional): Rank by mu - 3 sigma instead of mu. Defaults to True.
+
+    Returns:
+        list: PlayerRating tuples sorted by rating.
+    """
+    PlayerRating = namedtuple("PlayerRating", ["name", "id", "rating", "club", "date"])
+    history = schema.RatingHistory
+    # history dates are full ISO datetimes, "2023-09-15" would sort before every match of that day
+    try:
+        day = datetime.date.fromisoformat(date)
+    except ValueError:
+        # with a time component, compared in the same format as the stored dates
+        up_to_date = history.date <= datetime.datetime.fromisoformat(date).isoformat()
+    else:
+        up_to_date = history.date < (day + datetime.timedelta(days=1)).isoformat()
+    with Session(engine) as session:
+        # latest history row per (player, team) up to the date
+        latest = (
+            select(history.player, history.team, func.max(history.date).label("date"))
+            .where(up_to_date)
+            .group_by(history.player, history.team)
+            .subquery()
+        )
+        stmt = (
+            select(history, schema.Human.name, schema.Club.name)
+            .join(
+                latest,
+                and_(
+                    history.player == latest.c.player,
+                    history.team == latest.c.team,
+                    history.date == latest.c.date,
+                ),
+            )
+            .join(schema.Player, schema.Player.id == history.player)
+            .join(schema.Human, schema.Human.id == schema.Player.human)
+            .join(schema.Team, schema.Team.id == history.team)
+            .join(schema.Club, schema.Club.id == schema.Team.club)
+            # the same players as `leaderboard`, those without association id are not ranked
+            .where(schema.Player.association_id != "")
+        )
+        if competition_id is not None:
+            stmt = stmt.where(schema.Team.competition == competition_id)
+        ratings = session.execute(stmt).all()
+
+    leaderboard = []
+    for rating, name, club in ratings:
+        r = rating.rating_mu - (3 * rating.rating_sigma)
+        if not conservative:
+            r = rating.rating_mu
+        leaderboard.append(PlayerRating(name, rating.player, r, club, rating.date))
+    return sorted(leaderboard, key=lambda p : p.rating, reverse=True)
+
 
 if __name__ == "__main__":
     db_path = "./darts-json.db"
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import Engine, create_engine, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .schema import CrawledMatch
+
+
+def match_key(matchday_info: dict):
+    """Identity of a team match in the gameplan: association, competition, date, home and away team."""
+    date = matchday_info["date"]
+    return (
+        matchday_info["association"],
+        matchday_info["competition"],
+        date.isoformat() if isinstance(date, datetime) else date,
+        matchday_info["home_team"],
+        matchday_info["away_team"],
+    )
+
+
+def report_hash(matches: list):
+    """Content hash of a parsed match report."""
+    return hashlib.sha256(json.dumps(matches, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class CrawlIndex:
+    """Team matches whose report has been crawled, with the gameplan result they were crawled at.
+
+    The crawlers skip a played team match if its result did not change since the last crawl.
+    New entries are kept in memory until `save`, call it once the crawled data has been written,
+    otherwise a failed run would hide its matches from the next one.
+
+    Args:
+        engine (Engine): SQLite database of the index, the ratings database or a file of its own.
+    """
+
+    def __init__(self, engine: Engine):
+        CrawledMatch.__table__.create(engine, checkfirst=True)
+        self.engine = engine
+        self.lock = threading.Lock()
+        with Session(engine) as session:
+            rows = session.execute(
+                select(
+                    CrawledMatch.association,
+                    CrawledMatch.competition,
+                    CrawledMatch.date,
+                    CrawledMatch.home_team,
+                    CrawledMatch.away_team,
+                    CrawledMatch.result,
+                    CrawledMatch.report_hash,
+                )
+            ).all()
+        self.seen = {tuple(row[:5]): (row[5], row[6]) for row in rows}
+        self.pending = {}
+
+    @classmethod
+    def open(cls, path):
+        """Index in a SQLite file, created if it does not exist."""
+        return cls(create_engine(f"sqlite:///{path}"))
+
+    def __len__(self):
+        return len(self.seen)
+
+    def is_current(self, matchday_info: dict):
+        """Whether the report of a gameplan row was crawled and saved at the same result before."""
+        key = match_key(matchday_info)
+        with self.lock:
+            entry = self.seen.get(key)
+        return entry is not None and entry[0] == matchday_info["result"]
+
+    def add(self, matchday_info: dict, matches: list):
+        """Remember a crawled report until the next `save`.
+
+        Returns:
+            bool: Whether the report differs from the one crawled before.
+        """
+        key = match_key(matchday_info)
+        digest = report_hash(matches)
+        with self.lock:
+            previous = self.seen.get(key)
+            self.pending[key] = (matchday_info["result"], digest, matchday_info.get("legs"))
+        if previous is not None and previous[1] != digest:
+            logging.info(f"Report of {key} changed")
+        return previous is None or previous[1] != digest
+
+    def save(self, association: str = None, competition: str = None):
+        """Write remembered reports, optionally only those of one association or competition.
+
+        Returns:
+            int: Number of written entries.
+        """
+        with self.lock:
+            keys = [
+                key
+                for key in self.pending
+                if association in (None, key[0]) and competition in (None, key[1])
+            ]
+            entries = {key: self.pending.pop(key) for key in keys}
+        if not entries:
+            return 0
+        crawled_date = datetime.now().isoformat()
+        stmt = insert(CrawledMatch)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["association", "competition", "date", "home_team", "away_team"],
+            set_={
+                "result": stmt.excluded.result,
+                "legs": stmt.excluded.legs,
+                "report_hash": stmt.excluded.report_hash,
+                "crawled_date": stmt.excluded.crawled_date,
+            },
+        )
+        with Session(self.engine) as session, session.begin():
+            session.execute(
+                stmt,
+                [
+                    dict(
+                        zip(["association", "competition", "date", "home_team", "away_team"], key),
+                        result=result,
+                        legs=legs,
+                        report_hash=digest,
+                        crawled_date=crawled_date,
+                    )
+                    for key, (result, digest, legs) in entries.items()
+                ],
+            )
+        with self.lock:
+            self.seen.update({key: (result, digest) for key, (result, digest, _) in entries.items()})
+        return len(entries)
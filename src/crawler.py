@@ -1,30 +1,52 @@
 import logging
-import time
 from collections import defaultdict
 from datetime import datetime
-import re
+from functools import partial
 
 from bs4 import BeautifulSoup
 from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.support.expected_conditions import (
-    element_to_be_clickable,
-    invisibility_of_element,
-)
+from selenium.webdriver.support.expected_conditions import element_to_be_clickable
 from selenium.webdriver.support.select import Select
 from selenium.webdriver.support.wait import WebDriverWait
 
-data_sources = {
-    2022: "https://ndv.2k-dart-software.de/index.php/de/component/dartliga/index.php?option=com_dartliga&controller=showligagameplan&layout=showdashboard&filVbKey=6&filCompKey=1&filSaiKey=112&filVbsubKey=1&filStaffKey=667&filStaffFsGrpdataKey=0#",
-    2023: "https://ddv.2k-dart-software.de/index.php/de/component/dartliga/index.php?option=com_dartliga&controller=showligagameplan&layout=showdashboard&filVbKey=6&filCompKey=1&filSaiKey=126&filVbsubKey=1&filStaffKey=823&filStaffFsGrpdataKey=0",
-}
+from .browser_waits import BrowserWaits, LatencyStats
+from .page_parser import (
+    data_sources,
+    parse_associations,
+    parse_competitions,
+    parse_gameplan,
+    parse_match_report,
+    parse_squads,
+)
+
+
+# areas of the dashboard that clicks update
+DASHBOARD = "showligadashDashboard"
+GAMEPLAN = "showGameplanAreaData"
+DIALOG = "showligadashDialog"
+SQUADS = "showPlayerSquadAreaData"
+REPORT = "ligameplgame"
+
+# outerHTML of an area and its "Spielbericht" buttons in one round trip, every button is tagged
+# with its position so the parsed rows can be matched with the elements to click
+GAMEPLAN_SCRIPT = """
+var area = document.getElementById(arguments[0]);
+if (!area) { return [null, []]; }
+var buttons = Array.from(area.getElementsByClassName('ligameplBtnLigameplgameExist'));
+buttons.forEach(function (button, i) { button.setAttribute('data-crawl-button', i); });
+return [area.outerHTML, buttons];
+"""
 
 
 class Crawler2K:
 
-    def __init__(self, season) -> None:
+    def __init__(self, season, stats: LatencyStats = None) -> None:
         self.url = data_sources[season]
+        # time per step of the crawl, logged when the browser is closed
+        self.stats = LatencyStats() if stats is None else stats
 
     def __enter__(self):
         options = Options()
@@ -34,21 +56,32 @@ class Crawler2K:
         self.browser = webdriver.Remote(
             command_executor="http://localhost:4444", options=options
         )
-        self.browser.implicitly_wait(5)
-        self.browser.get(self.url)
+        # explicit waits only, an implicit wait delays every lookup of a missing element
+        self.browser.implicitly_wait(0)
+        self.waits = BrowserWaits(self.browser, stats=self.stats)
+        self.waits.after("load", partial(self.browser.get, self.url))
         self.browser.execute_script("window.loadWaitTime = 10000 * 1000000;")
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.log()
         self.browser.quit()
 
     @property
     def page_content(self):
         return BeautifulSoup(self.browser.page_source, "html.parser")
 
+    def area_content(self, element_id: str):
+        """Html of one element, fetched in a single round trip and parsed locally."""
+        html = self.browser.execute_script(
+            "var e = document.getElementById(arguments[0]); return e ? e.outerHTML : null;", element_id
+        )
+        if html is None:
+            raise NoSuchElementException(f"No element with id {element_id}")
+        return BeautifulSoup(html, "html.parser")
+
     def refresh(self):
-        self.browser.execute_script("window.location.reload();")
-        time.sleep(1)
+        self.waits.reload()
         self.browser.execute_script("window.loadWaitTime = 10000 * 1000000;")
 
     def wait(self):
@@ -91,53 +124,18 @@ class Crawler2K:
                 t.click()
                 break
 
-    def _get_results_from_overlay(self, match_row):
-
-        try:
-            # this is only visible once we have clicked on the first "spielbericht"
-            WebDriverWait(self.browser, timeout=1).until(
-                invisibility_of_element(
-                    self.browser.find_element(By.CLASS_NAME, "modal-backdrop")
-                )
-            )
-        # trunk-ignore(bandit/B110)
-        except Exception:
-            pass
-
-        # crashes when game has not been played yet
-        try:
-            button = match_row.find_element(
-                By.CLASS_NAME, "ligameplBtnLigameplgameExist"
-            )
-            button.click()
-        except Exception:
-            logging.debug(
-                "Skipping match, no button", match_row.get_attribute("outerHTML")
-            )
-            return
+    def _get_results_from_overlay(self, button):
+        # the backdrop of the previous "spielbericht" may still be fading out
+        self.waits.modal_hidden("report backdrop", DIALOG)
 
-        matches = []
+        # no button when the game has not been played yet
+        if button is None:
+            logging.debug("Skipping match, no button")
+            return
+        self.waits.modal_shown("open report", DIALOG, button.click)
 
-        table = self.browser.find_element(By.ID, "ligameplgame").find_element(
-            By.TAG_NAME, "table"
-        )
-        match_rows = table.find_elements(By.CLASS_NAME, "resultTable")
-        for i, m in enumerate(match_rows):
-            match_info = m.find_elements(By.TAG_NAME, "td")
-            match = {}
-            match["home_player"] = match_info[2].get_attribute("textContent")
-            match["result"] = match_info[3].get_attribute("textContent")
-            match["away_player"] = match_info[4].get_attribute("textContent")
-            if i in [0, 1, 2, 3]:
-                match_number = i + 1
-            elif i in [6, 7, 8, 9]:
-                match_number = i - 5
-            elif i in [4, 5]:
-                match_number = i - 3
-            elif i in [10, 11]:
-                match_number = i - 9
-            match["match_number"] = match_number
-            matches.append(match)
+        with self.stats.timed("read report"):
+            matches = parse_match_report(self.area_content(REPORT))
 
         self._close_match_overlay()
         return matches
@@ -146,29 +144,15 @@ class Crawler2K:
         dialogue = self.browser.find_element(By.ID, "showligadashDialog")
         button = dialogue.find_element(By.TAG_NAME, "button")
         WebDriverWait(self.browser, timeout=15).until(element_to_be_clickable(button))
-        time.sleep(1)
         # self.browser.execute_script("arguments[0].click();", button)
-        button.click()
+        self.waits.modal_hidden("close report", DIALOG, button.click)
 
     def get_associations(self):
-        dashboard = self.browser.find_element(By.ID, "showligadashDashboard")
-        header_rows = dashboard.find_element(By.CLASS_NAME, "well-sm")
-        assoc_div, competition_div = header_rows.find_elements(By.XPATH, "./*")
-
-        assoc_elements = assoc_div.find_elements(By.TAG_NAME, "a")
-        assocs = [a.get_attribute("title") for a in assoc_elements]
-        return assocs
+        return list(parse_associations(self.area_content(DASHBOARD)))
 
     def get_competitions(self, association):
-        self._choose_association(association)
-        time.sleep(1)
-        dashboard = self.browser.find_element(By.ID, "showligadashDashboard")
-        header_rows = dashboard.find_element(By.CLASS_NAME, "well-sm")
-        _, competition_div = header_rows.find_elements(By.XPATH, "./*")
-
-        comp_elements = competition_div.find_elements(By.TAG_NAME, "a")
-        comps = [a.get_attribute("title") for a in comp_elements]
-        return comps
+        self.waits.after("association", partial(self._choose_association, association), DASHBOARD)
+        return list(parse_competitions(self.area_content(DASHBOARD)))
 
     def get_clubs_and_teams(self, associations: list = None, competitions: list = None):
         teams = defaultdict(set)  # holds club : {A, B, C, D, E}
@@ -178,53 +162,17 @@ class Crawler2K:
             associations = self.get_associations()
 
         for assoc in associations:
-            time.sleep(1)
-            self._choose_association(assoc)
+            self.waits.after("association", partial(self._choose_association, assoc), DASHBOARD)
             if competitions is None:
                 competitions = self.get_competitions(assoc)
 
             for comp in competitions:
-                time.sleep(1)
-                self._choose_competition(comp)
-                time.sleep(1)
-                self._choose_tab("Spielerkader")
-                time.sleep(1)
-                self._choose_association(assoc)
-                time.sleep(1)
-
-                squad_panel = self.browser.find_element(
-                    By.ID, "showPlayerSquadAreaData"
-                )
-                team_headings = squad_panel.find_elements(
-                    By.CLASS_NAME, "panel-heading"
-                )  # previous "collapsed"
-
-                for team_heading in team_headings:
-
-                    team_id = team_heading.get_attribute("id").replace("teamTopic", "")
-                    # "Club Name e.V. C (irrelevant extra)" -> "Club Name e.V. C"
-                    club_team_name = re.sub(r'\(.*\)', '', team_heading.get_attribute("textContent")).strip()
-                    club, team = club_team_name[:-2], club_team_name[-1]
-                    club = club.strip()
-                    logging.debug(f"Crawled club: {club} {team}")
-                    teams[club].add(team)
-                    team_data = squad_panel.find_element(By.ID, f"teamData{team_id}")
-
-                    player_spans = team_data.find_elements(
-                        By.CLASS_NAME, "form-control-static"
-                    )
-                    player_info = [p.get_attribute("textContent") for p in player_spans]
-                    for p in player_info:
-                        player = p.replace("TC", "").strip().split("(")
-
-                        # ["van Hooff, Jens", 100405)]
-                        name_split = player[0].split(",")
-                        name = f"{' '.join([n.strip() for n in name_split[1:]])} {name_split[0]}".strip()
-                        if "Spieler ist nicht" in name:
-                            continue
-                        player_id = player[-1][:-1]
-                        logging.debug(f"Crawled player: {name, player_id, club, team}")
-                        players.append((player_id, name, club, team))
+                self.waits.after("competition", partial(self._choose_competition, comp), DASHBOARD)
+                self.waits.after("squad tab", partial(self._choose_tab, "Spielerkader"), DASHBOARD)
+                self.waits.after("association", partial(self._choose_association, assoc), DASHBOARD)
+
+                with self.stats.timed("read squads"):
+                    parse_squads(self.area_content(SQUADS), teams, players)
         return teams, players
 
     def get_matches(
@@ -232,6 +180,7 @@ class Crawler2K:
         associations: list = None,
         competitions: list = None,
         from_date=datetime(2022, 8, 1),
+        crawl_index=None,
     ):
         # click on each "Spielbericht" that took place after "from_date"
         # If there is data available, parse into pandas from html table
@@ -243,61 +192,29 @@ class Crawler2K:
             associations = self.get_associations()
 
         for assoc in associations:
-            self._choose_association(assoc)
+            self.waits.after("association", partial(self._choose_association, assoc), DASHBOARD)
             if competitions is None:
                 competitions = self.get_competitions(assoc)
 
             for comp in competitions:
-                time.sleep(1)
-                self._choose_competition(comp)
-                time.sleep(1)
-                self._choose_tab("Spielplan")
-                time.sleep(1)
-                self._choose_from_dropdown("Spielplan")
-                time.sleep(1)
-                dashboard = self.browser.find_element(By.ID, "showGameplanAreaData")
-                matchday_bodys = dashboard.find_elements(By.TAG_NAME, "tbody")
-                for matchday in matchday_bodys:
-                    match_rows = matchday.find_elements(By.TAG_NAME, "tr")
-                    for match_row in match_rows:
-                        if len(match_row.get_attribute("id")):
-                            continue
-
-                        matchday_info = {}
-                        match_info = match_row.find_elements(By.TAG_NAME, "td")
-                        date = match_info[0].get_attribute("textContent")
-                        if "." not in date:
-                            continue
-                        _, date, time_ = date.split(" ")
-                        d, m, y = date.split(".")
-                        h, min = time_.split(":")
-                        match_date = datetime(
-                            int(y) + 2000, int(m), int(d), int(h), int(min)
-                        )
-
-                        if match_date < from_date:
-                            logging.info(f"skip, {match_date} before {from_date}")
-                            continue
-
-                        matchday_info["date"] = match_date
-                        matchday_info["home_team"] = (
-                            match_info[1].get_attribute("textContent").strip()
-                        )
-                        matchday_info["away_team"] = (
-                            match_info[2].get_attribute("textContent").strip()
-                        )
-                        matchday_info["result"] = (
-                            match_info[3].get_attribute("textContent").strip()
-                        )
-                        matchday_info["legs"] = (
-                            match_info[4].get_attribute("textContent").strip()
-                        )
-                        matchday_info["competition"] = comp
-                        matchday_info["association"] = assoc
-
-                        if not matchday_info["result"].strip() == "-:-":
-                            results = self._get_results_from_overlay(match_info[-1])
-
-                            matchdays.append(matchday_info)
-                            matches.append(results)
+                self.waits.after("competition", partial(self._choose_competition, comp), DASHBOARD)
+                self.waits.after("gameplan tab", partial(self._choose_tab, "Spielplan"), GAMEPLAN)
+                self.waits.after("gameplan", partial(self._choose_from_dropdown, "Spielplan"), GAMEPLAN)
+                with self.stats.timed("read gameplan"):
+                    html, buttons = self.browser.execute_script(GAMEPLAN_SCRIPT, GAMEPLAN)
+                    if html is None:
+                        raise NoSuchElementException(f"No element with id {GAMEPLAN}")
+                    played = parse_gameplan(
+                        html, assoc, comp, from_date, report_of=lambda button: buttons[int(button["data-crawl-button"])]
+                    )
+                for matchday_info, button in played:
+                    # only open reports that are new or whose result changed
+                    if crawl_index is not None and crawl_index.is_current(matchday_info):
+                        continue
+                    results = self._get_results_from_overlay(button)
+                    if crawl_index is not None and results is not None:
+                        crawl_index.add(matchday_info, results)
+
+                    matchdays.append(matchday_info)
+                    matches.append(results)
         return matchdays, matches
@@ -0,0 +1,84 @@
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from .http_crawler import VIEWS
+
+FIXTURES = Path(__file__).parent.parent / "test" / "fixtures" / "2k"
+
+
+def _pages(directory: Path, n_reports: int = None):
+    """Recorded pages by the layout that requests them, the gameplan optionally grown to n_reports rows."""
+    pages = {None: (directory / "dashboard.html").read_text(encoding="utf-8")}
+    for view, params in VIEWS.items():
+        if "layout" in params:
+            pages[params["layout"]] = (directory / f"{view}.html").read_text(encoding="utf-8")
+    if n_reports is not None:
+        gameplan = pages[VIEWS["gameplan"]["layout"]]
+        played = re.search(r"<tr>\s*<td>[^<]*\d\d:\d\d</td>.*?</tr>", gameplan, re.S).group(0)
+        rows = "\n".join(re.sub(r"showLigameplgame\(\d+\)", f"showLigameplgame({key})", played) for key in range(n_reports))
+        pages[VIEWS["gameplan"]["layout"]] = f'<div id="showGameplanAreaData"><table><tbody>{rows}</tbody></table></div>'
+    return pages
+
+
+class FixtureServer:
+    """Local stand-in for the 2k dashboard that serves recorded pages, for tests and benchmarks.
+
+    Args:
+        directory (Path, optional): Directory of the recorded pages. Defaults to test/fixtures/2k.
+        latency (float, optional): Seconds every response is delayed, like a remote server. Defaults to 0.
+        n_reports (int, optional): Number of played team matches of every gameplan. Defaults to the recording.
+        fail_every (int, optional): Answer every n-th request with 503. Defaults to 0, never.
+    """
+
+    def __init__(self, directory: Path = FIXTURES, latency: float = 0.0, n_reports: int = None, fail_every: int = 0):
+        pages = _pages(Path(directory), n_reports)
+        counter = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+        lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with lock:
+                    counter["requests"] += 1
+                    counter["in_flight"] += 1
+                    counter["max_in_flight"] = max(counter["max_in_flight"], counter["in_flight"])
+                    failing = fail_every and counter["requests"] % fail_every == 0
+                try:
+                    time.sleep(latency)
+                    layout = parse_qs(urlsplit(self.path).query).get("layout", [None])[0]
+                    body = b"" if failing else pages.get(layout, pages[None]).encode("utf-8")
+                    self.send_response(503 if failing else 200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with lock:
+                        counter["in_flight"] -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        self.counter = counter
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/index.php?option=com_dartliga&controller=showligagameplan&layout=showdashboard&filSaiKey=126"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,25 @@
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from .schema import DataGeneration
+
+GENERATION_ID = 1
+
+
+def bump_generation(session: Session):
+    """Mark the data as changed, cached query results of older generations are dropped.
+
+    Call it in the transaction that writes, so readers never see new data with an old generation.
+
+    Args:
+        session (Session): The current db session. Committing is up to the caller.
+    """
+    bumped = session.execute(
+        update(DataGeneration)
+        .where(DataGeneration.id == GENERATION_ID)
+        .values(generation=DataGeneration.generation + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if bumped.rowcount == 0:
+        session.execute(insert(DataGeneration).values(id=GENERATION_ID, generation=1))
+
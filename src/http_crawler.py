@@ -0,0 +1,175 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .page_parser import (
+    data_sources,
+    parse_associations,
+    parse_competitions,
+    parse_gameplan,
+    parse_match_report,
+    parse_squads,
+)
+
+# Query parameters that select an association and a competition on the dashboard
+ASSOCIATION_KEY = "filVbKey"
+COMPETITION_KEY = "filStaffKey"
+REPORT_KEY = "filLigameplgameKey"
+# Views the dashboard loads into its areas when a tab or a "Spielbericht" is clicked. The site has no
+# documented API, these follow the dashboard url and the ids of the areas they fill
+# (showPlayerSquadAreaData, showGameplanAreaData, ligameplgame) and may need adjusting. They were never
+# checked against the live site: the fixtures in test/fixtures/2k are hand written and the fixture
+# server answers by the same table, so the tests only cover the parsing.
+VIEWS = {
+    "dashboard": {},
+    "squads": {"layout": "showplayersquad", "format": "raw"},
+    "gameplan": {"layout": "showgameplan", "format": "raw", "filOnlrepKeyGameplan": "Spielplan"},
+    "match_report": {"layout": "showligameplgame", "format": "raw"},
+}
+
+
+def pooled_session(pool_size: int = 8, retries: int = 3):
+    """requests.Session that keeps connections alive and retries failed requests with backoff.
+
+    Args:
+        pool_size (int, optional): Connections kept per host. Defaults to 8.
+        retries (int, optional): Retries per request on connection errors and 429/5xx, 0 leaves
+            failed responses to the caller. Defaults to 3.
+    """
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)) if retries else 0
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class Http2K:
+    """Crawler with the interface of `Crawler2K` that requests the dashboard views directly.
+
+    Every association, competition, tab and match report is one GET request on a pooled session,
+    the returned html fragments are parsed with the functions of `page_parser`.
+
+    Experimental: the query parameters in VIEWS are unverified against the live site, `Crawler2K`
+    stays the default crawler.
+    """
+
+    def __init__(self, season, session: requests.Session = None, timeout: float = 30, url: str = None) -> None:
+        parts = urlsplit(data_sources[season] if url is None else url)
+        self.url = urlunsplit(parts._replace(query="", fragment=""))
+        self.params = dict(parse_qsl(parts.query))
+        self.session = session
+        self.timeout = timeout
+        self._own_session = session is None
+        self._associations = None
+        self._competitions = {}
+        self.n_requests = 0
+
+    def __enter__(self):
+        if self.session is None:
+            self.session = pooled_session()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._own_session:
+            self.session.close()
+            self.session = None
+
+    def request_params(self, view: str = "dashboard", **params):
+        """Query parameters of a view: those of the dashboard url, the view and the given ones."""
+        return {**self.params, **VIEWS[view], **params}
+
+    def fetch(self, view: str = "dashboard", **params):
+        """Html of a view of the dashboard.
+
+        Args:
+            view (str, optional): Key of VIEWS. Defaults to "dashboard".
+            **params: Query parameters on top of those of the dashboard url and the view.
+
+        Returns:
+            str: The html.
+        """
+        response = self.session.get(self.url, params=self.request_params(view, **params), timeout=self.timeout)
+        response.raise_for_status()
+        self.n_requests += 1
+        return response.text
+
+    def _selection(self, association, competition=None):
+        if self._associations is None:
+            self.get_associations()
+        params = {ASSOCIATION_KEY: self._associations[association]}
+        if competition is not None:
+            if association not in self._competitions:
+                self.get_competitions(association)
+            params[COMPETITION_KEY] = self._competitions[association][competition]
+        return params
+
+    def get_associations(self):
+        self._associations = parse_associations(self.fetch(), ASSOCIATION_KEY)
+        return list(self._associations)
+
+    def get_competitions(self, association):
+        html = self.fetch(**self._selection(association))
+        self._competitions[association] = parse_competitions(html, COMPETITION_KEY)
+        return list(self._competitions[association])
+
+    def get_clubs_and_teams(self, associations: list = None, competitions: list = None):
+        teams = defaultdict(set)  # holds club : {A, B, C, D, E}
+        players = []  # {(assoc id, name, club)}
+
+        if associations is None:
+            associations = self.get_associations()
+
+        for assoc in associations:
+            comps = self.get_competitions(assoc) if competitions is None else competitions
+            for comp in comps:
+                parse_squads(self.fetch("squads", **self._selection(assoc, comp)), teams, players)
+        return teams, players
+
+    def get_matches(
+        self,
+        associations: list = None,
+        competitions: list = None,
+        from_date=datetime(2022, 8, 1),
+        crawl_index=None,
+    ):
+        """Played team matches and their reports, see `Crawler2K.get_matches`.
+
+        Args:
+            associations (list, optional): Associations to crawl. Defaults to all.
+            competitions (list, optional): Competitions to crawl per association. Defaults to all.
+            from_date (datetime, optional): Matches before this date are skipped. Defaults to datetime(2022, 8, 1).
+            crawl_index (CrawlIndex, optional): Skips matches crawled before at the same result
+                and remembers the new ones. Defaults to None.
+
+        Returns:
+            tuple: Team match dicts and the legs of each team match.
+        """
+        matchdays = []  # hold match dicts
+        matches = []  # hold list of single/double matches per matchday
+
+        if associations is None:
+            associations = self.get_associations()
+
+        for assoc in associations:
+            comps = self.get_competitions(assoc) if competitions is None else competitions
+            for comp in comps:
+                gameplan = self.fetch("gameplan", **self._selection(assoc, comp))
+                for matchday_info, report in parse_gameplan(gameplan, assoc, comp, from_date):
+                    if crawl_index is not None and crawl_index.is_current(matchday_info):
+                        continue
+                    if report is None:
+                        logging.debug(f"Skipping match, no report {matchday_info}")
+                        results = None
+                    else:
+                        results = parse_match_report(self.fetch("match_report", **{REPORT_KEY: report}))
+                        if crawl_index is not None:
+                            crawl_index.add(matchday_info, results)
+                    matchdays.append(matchday_info)
+                    matches.append(results)
+        return matchdays, matches
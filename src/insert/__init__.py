@@ -1,8 +1,14 @@
 # trunk-ignore(ruff/F401)
+from .bulk import bulk_populate, bulk_populate_files, stage_file, write_staged
+# trunk-ignore(ruff/F401)
+from .cache import IdentityCache
+# trunk-ignore(ruff/F401)
 from .clubs import populate_clubs_and_teams
 # trunk-ignore(ruff/F401)
 from .competition import populate_competitions
 # trunk-ignore(ruff/F401)
 from .match import populate_matches, populate_teammatches
 # trunk-ignore(ruff/F401)
-from .player import get_player_or_create_player_and_human, populate_players
\ No newline at end of file
+from .player import get_player_or_create_player_and_human, populate_players
+# trunk-ignore(ruff/F401)
+from .stream import iter_crawl_records, stream_populate
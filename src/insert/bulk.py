@@ -0,0 +1,498 @@
+import heapq
+import itertools
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from sqlalchemy import Engine, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from ..archive import load_crawl
+from ..generation import bump_generation
+from ..schema import (
+    Club,
+    Competition,
+    DoublesMatch,
+    Human,
+    Player,
+    SinglesMatch,
+    Team,
+    TeamMatch,
+)
+from .player import create_human_id, reorder_name
+
+# keeps IN (...) lists well below the SQLite parameter limit
+CHUNK_SIZE = 500
+
+
+def chunked(values, size=CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def split_team_name(team_name: str):
+    """Split a crawled team name into club name and team rank.
+
+    Args:
+        team_name (str): Team name as crawled, e.g. "DC Langendamm e.V. B (Jgd.)".
+
+    Returns:
+        tuple: Club name and rank.
+    """
+    team_name = team_name.replace("(Jgd.)", "").strip()
+    return team_name[:-2], team_name[-1]
+
+
+def stage_leg(match: dict):
+    """Parse players and result of a crawled singles or doubles match.
+
+    Args:
+        match (dict): Match dict with unparsed player names.
+
+    Returns:
+        Union[tuple, None]: (home names, away names, result, match number) or None for invalid legs.
+    """
+    home_player = match["home_player"]
+    away_player = match["away_player"]
+    if "/" in home_player:
+        try:
+            home_player1, home_player2 = home_player.split("/")
+            away_player1, away_player2 = away_player.split("/")
+        except Exception:
+            logging.info(f"No valid double: {home_player} vs {away_player}")
+            return None
+        home = (reorder_name(home_player1), reorder_name(home_player2))
+        away = (reorder_name(away_player1), reorder_name(away_player2))
+    else:
+        home, away = (reorder_name(home_player),), (reorder_name(away_player),)
+        if "KEIN EINTRAG" in home + away:
+            logging.info(f"Skip match {home_player} vs {away_player}")
+            return None
+    if "---" in home + away:
+        logging.info(f"Skip match {home_player} vs {away_player}")
+        return None
+    return home, away, match["result"], match["match_number"]
+
+
+def stage_file(crawled_results: dict):
+    """Flatten a crawled file into rows identified by natural keys. Does not touch the database.
+
+    Players of files without team ranks are assigned to their club's team if the club
+    has exactly one team in the competition.
+
+    Args:
+        crawled_results (dict): Parsed json file of the crawler, the season being a datetime.
+
+    Returns:
+        dict: Season, start of the crawl, competitions, teams, players and team matches with their legs.
+            Legs are (position, home names, away names, result, match number) tuples.
+    """
+    season = crawled_results["season"].isoformat()
+    staged = {
+        "season": season,
+        "from_date": crawled_results.get("from_date"),
+        "competitions": [],
+        "teams": [],
+        "players": [],
+        "team_matches": [],
+    }
+    for association, competitions in crawled_results["crawled_competitions"].items():
+        for competition in competitions:
+            comp_key = (competition, association)
+            staged["competitions"].append(comp_key)
+            crawled = crawled_results[association][competition]
+
+            for club, ranks in crawled["clubs_teams"].items():
+                staged["teams"].extend((club, rank, comp_key) for rank in ranks)
+
+            for player in crawled["players"]:
+                if len(player) == 4:
+                    assoc_id, name, club, rank = player
+                else:
+                    assoc_id, name, club = player
+                    ranks = crawled["clubs_teams"].get(club, [])
+                    rank = ranks[0] if len(ranks) == 1 else None
+                staged["players"].append((name.strip(), club, rank, comp_key, assoc_id))
+
+            for team_match, legs in zip(crawled["team_matches"], crawled["matches"]):
+                if "Spielfrei" in (team_match["home_team"], team_match["away_team"]):
+                    continue
+                legs = [(position, stage_leg(leg)) for position, leg in enumerate(legs or [], start=1)]
+                staged["team_matches"].append(
+                    {
+                        "date": datetime.fromisoformat(team_match["date"]).isoformat(),
+                        "competition": (team_match["competition"], team_match["association"]),
+                        "home_team": split_team_name(team_match["home_team"]),
+                        "away_team": split_team_name(team_match["away_team"]),
+                        "result": team_match["result"],
+                        "legs": [(position, *leg) for position, leg in legs if leg is not None],
+                    }
+                )
+    return staged
+
+
+def load_players(session: Session, club_ids):
+    """Map (name, club id) of existing players to (id, association id, team). The oldest player wins."""
+    players = {}
+    for chunk in chunked(club_ids):
+        rows = session.execute(
+            select(Human.name, Player.club, Player.id, Player.association_id, Player.team)
+            .join(Human, Human.id == Player.human)
+            .where(Player.club.in_(chunk))
+            .order_by(Player.id)
+        ).all()
+        for name, club, *player in rows:
+            players.setdefault((name, club), player)
+    return players
+
+
+def write_staged(session: Session, staged: dict):
+    """Write a staged file with set based lookups and conflict ignoring inserts.
+
+    NOTE: Session commits and rollbacks need to be done outside this function!
+    Args:
+        session (Session): The current db session.
+        staged (dict): Output of stage_file.
+
+    Returns:
+        dict: Number of team matches, singles and doubles that were added.
+    """
+    season = staged["season"]
+
+    # competitions, clubs and teams have unique natural keys
+    if staged["competitions"]:
+        session.execute(
+            insert(Competition).on_conflict_do_nothing(),
+            [
+                {"name": name, "association": association, "year": season}
+                for name, association in dict.fromkeys(staged["competitions"])
+            ],
+        )
+    competitions = {
+        (name, association): comp_id
+        for comp_id, name, association in session.execute(
+            select(Competition.id, Competition.name, Competition.association).where(
+                Competition.year == season
+            )
+        )
+    }
+
+    club_names = {club for club, _, _ in staged["teams"]}
+    if club_names:
+        session.execute(
+            insert(Club).on_conflict_do_nothing(), [{"name": name} for name in sorted(club_names)]
+        )
+    clubs = {name: club_id for club_id, name in session.execute(select(Club.id, Club.name))}
+
+    if staged["teams"]:
+        session.execute(
+            insert(Team).on_conflict_do_nothing(),
+            [
+                {"rank": rank, "club": clubs[club], "year": season, "competition": competitions[comp_key]}
+                for club, rank, comp_key in dict.fromkeys(staged["teams"])
+            ],
+        )
+    teams, any_teams = {}, {}
+    for team_id, club, rank, comp_id in session.execute(
+        select(Team.id, Team.club, Team.rank, Team.competition)
+        .where(Team.year == season)
+        .order_by(Team.id)
+    ):
+        teams[(club, rank, comp_id)] = team_id
+        any_teams.setdefault((club, rank), team_id)
+    team_clubs = {team_id: club for (club, _, _), team_id in teams.items()}
+
+    def find_team(team, comp_id):
+        # prefer the team of the competition, crawled names do not identify it
+        club, rank = team
+        club_id = clubs.get(club)
+        return teams.get((club_id, rank, comp_id), any_teams.get((club_id, rank)))
+
+    team_matches = []
+    for team_match in staged["team_matches"]:
+        comp_id = competitions.get(team_match["competition"])
+        home_team = find_team(team_match["home_team"], comp_id)
+        away_team = find_team(team_match["away_team"], comp_id)
+        if None in (comp_id, home_team, away_team):
+            logging.info(
+                f"Could not find Competition or team in database {team_match['competition']} {season} {team_match['home_team']} {team_match['away_team']}"
+            )
+            continue
+        team_matches.append((team_match, comp_id, home_team, away_team))
+
+    # players have no unique natural key, so resolve them before inserting
+    club_ids = {clubs.get(club) for _, club, _, _, _ in staged["players"]}
+    club_ids.update(team_clubs[team] for _, _, home, away in team_matches for team in (home, away))
+    club_ids.discard(None)
+    players = load_players(session, club_ids)
+    new_players, updates = {}, {}
+
+    def stage_player(name, club_id, team=None, association_id=None):
+        key = (name, club_id)
+        if key in players:
+            player_id, current_id, current_team = players[key]
+            if current_id == "" and association_id is not None:
+                current_id = str(association_id)
+                updates.setdefault(player_id, {"id": player_id})["association_id"] = current_id
+            if current_team is None and team is not None:
+                current_team = team
+                updates.setdefault(player_id, {"id": player_id})["team"] = current_team
+            players[key] = (player_id, current_id, current_team)
+        elif key in new_players:
+            player = new_players[key]
+            if player["association_id"] == "" and association_id is not None:
+                player["association_id"] = str(association_id)
+            if player["team"] is None and team is not None:
+                player["team"] = team
+        elif association_id is not None and "Spieler ist nicht" in association_id:
+            logging.info(f"Skip Player {name=} with association_id {association_id=}")
+        elif name == "---":
+            logging.info(f"Skip Player {name=} ({club_id=}) with association_id {association_id=}")
+        else:
+            new_players[key] = {
+                "human": create_human_id(name),
+                "association_id": "" if association_id is None else str(association_id),
+                "club": club_id,
+                "team": team,
+            }
+
+    for name, club, rank, comp_key, assoc_id in staged["players"]:
+        club_id = clubs.get(club)
+        if club_id is None:
+            logging.info(f"Club not found {club}, skipping player {name}")
+            continue
+        team = teams.get((club_id, rank, competitions[comp_key]))
+        stage_player(name, club_id, team=team, association_id=assoc_id)
+
+    for team_match, _, home_team, away_team in team_matches:
+        for _, home, away, _, _ in team_match["legs"]:
+            for name in home:
+                stage_player(name, team_clubs[home_team])
+            for name in away:
+                stage_player(name, team_clubs[away_team])
+
+    if updates:
+        session.execute(update(Player), list(updates.values()))
+    if new_players:
+        session.execute(
+            insert(Human).on_conflict_do_nothing(),
+            [{"id": player["human"], "name": name} for (name, _), player in new_players.items()],
+        )
+        session.execute(insert(Player), list(new_players.values()))
+        players.update(load_players(session, {club_id for _, club_id in new_players}))
+
+    # team matches keep the result of their first insert
+    comp_ids = {comp_id for _, comp_id, _, _ in team_matches}
+    known = load_team_matches(session, comp_ids)
+    new_team_matches = {}
+    for team_match, comp_id, home_team, away_team in team_matches:
+        key = (team_match["date"], home_team, away_team, comp_id)
+        if key not in known:
+            new_team_matches.setdefault(key, team_match["result"])
+    if new_team_matches:
+        session.execute(
+            insert(TeamMatch).on_conflict_do_nothing(),
+            [
+                {
+                    "date": date,
+                    "competition": comp_id,
+                    "result": result,
+                    "home_team": home_team,
+                    "away_team": away_team,
+                    "used_for_rating": False,
+                }
+                for (date, home_team, away_team, comp_id), result in new_team_matches.items()
+            ],
+        )
+        known = load_team_matches(session, comp_ids)
+
+    # legs are identified by their position, older legs without one by their players
+    team_match_ids = {known[(tm["date"], home, away, comp_id)] for tm, comp_id, home, away in team_matches}
+    positions, singles, doubles = load_legs(session, team_match_ids)
+    new_singles, new_doubles = [], []
+    for team_match, comp_id, home_team, away_team in team_matches:
+        team_match_id = known[(team_match["date"], home_team, away_team, comp_id)]
+        for position, home, away, result, match_number in team_match["legs"]:
+            if (team_match_id, position) in positions:
+                continue
+            home_ids = tuple(players.get((name, team_clubs[home_team]), (None,))[0] for name in home)
+            away_ids = tuple(players.get((name, team_clubs[away_team]), (None,))[0] for name in away)
+            if None in home_ids + away_ids:
+                logging.info(f"Skipping match because we could not get or create one of {home + away}")
+                continue
+            key = (team_match_id, *home_ids, *away_ids)
+            if len(home) == 1:
+                if key in singles:
+                    continue
+                singles.add(key)
+                new_singles.append(
+                    {
+                        "team_match": team_match_id,
+                        "home_player": home_ids[0],
+                        "away_player": away_ids[0],
+                        "result": result,
+                        "match_number": match_number,
+                        "position": position,
+                    }
+                )
+            else:
+                if key in doubles:
+                    continue
+                doubles.add(key)
+                new_doubles.append(
+                    {
+                        "team_match": team_match_id,
+                        "home_player1": home_ids[0],
+                        "home_player2": home_ids[1],
+                        "away_player1": away_ids[0],
+                        "away_player2": away_ids[1],
+                        "result": result,
+                        "match_number": match_number,
+                        "position": position,
+                    }
+                )
+            positions.add((team_match_id, position))
+    if new_singles:
+        session.execute(insert(SinglesMatch).on_conflict_do_nothing(), new_singles)
+    if new_doubles:
+        session.execute(insert(DoublesMatch).on_conflict_do_nothing(), new_doubles)
+    bump_generation(session)
+    return {
+        "players": len(new_players),
+        "team_matches": len(new_team_matches),
+        "singles": len(new_singles),
+        "doubles": len(new_doubles),
+    }
+
+
+def load_team_matches(session: Session, comp_ids):
+    """Map (date, home team, away team, competition) of existing team matches to their id."""
+    team_matches = {}
+    for chunk in chunked(comp_ids):
+        rows = session.execute(
+            select(
+                TeamMatch.date,
+                TeamMatch.home_team,
+                TeamMatch.away_team,
+                TeamMatch.competition,
+                TeamMatch.id,
+            ).where(TeamMatch.competition.in_(chunk))
+        ).all()
+        team_matches.update((tuple(key), team_match_id) for *key, team_match_id in rows)
+    return team_matches
+
+
+def load_legs(session: Session, team_match_ids):
+    """Keys (team match, position) and (team match, home players, away players) of the existing singles and doubles."""
+    positions, singles, doubles = set(), set(), set()
+    for chunk in chunked(team_match_ids):
+        for team_match, position, *players in session.execute(
+            select(
+                SinglesMatch.team_match,
+                SinglesMatch.position,
+                SinglesMatch.home_player,
+                SinglesMatch.away_player,
+            ).where(SinglesMatch.team_match.in_(chunk))
+        ):
+            positions.add((team_match, position))
+            singles.add((team_match, *players))
+        for team_match, position, *players in session.execute(
+            select(
+                DoublesMatch.team_match,
+                DoublesMatch.position,
+                DoublesMatch.home_player1,
+                DoublesMatch.home_player2,
+                DoublesMatch.away_player1,
+                DoublesMatch.away_player2,
+            ).where(DoublesMatch.team_match.in_(chunk))
+        ):
+            positions.add((team_match, position))
+            doubles.add((team_match, *players))
+    return positions, singles, doubles
+
+
+def bulk_populate(engine: Engine, crawled_results: dict):
+    """Insert a crawled file in one transaction. Expects the unique indexes of the schema,
+    see migrations.migrate_database.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+        crawled_results (dict): Parsed json file of the crawler, the season being a datetime.
+
+    Returns:
+        dict: Number of players, team matches, singles and doubles that were added.
+    """
+    staged = stage_file(crawled_results)
+    with Session(engine) as session, session.begin():
+        return write_staged(session, staged)
+
+
+def load_and_stage(path):
+    """Read and stage a crawled file. Runs in the worker processes of bulk_populate_files.
+
+    Args:
+        path (Union[str, Path]): Path to the crawled json file or archive.
+
+    Returns:
+        dict: Output of stage_file.
+    """
+    crawled_results = load_crawl(path)
+    crawled_results["season"] = datetime.fromisoformat(crawled_results["season"])
+    return stage_file(crawled_results)
+
+
+def staged_date(staged: dict):
+    """Sort key of a staged file: season, first team match and start of the crawl."""
+    first_match = min((team_match["date"] for team_match in staged["team_matches"]), default="")
+    return staged["season"], first_match, staged["from_date"] or ""
+
+
+def bulk_populate_files(engine: Engine, paths: list, workers: int = None, window: int = 16):
+    """Parse and stage crawled files in a process pool and write them from this process while
+    the workers parse the next ones.
+
+    The calling process is the only writer, so SQLite never sees concurrent write transactions.
+    Parsed files wait in a heap of at most `window` files, the earliest of them is written with
+    one transaction whenever the heap is full. Files are therefore written in date order, so ids
+    follow the season, as long as no file is preceded by more than `window` later ones in paths.
+    At most `window` plus `workers` staged files are held in memory.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+        paths (list): Paths to crawled json files or archives.
+        workers (int, optional): Number of worker processes. Defaults to the number of cores.
+        window (int, optional): Number of parsed files to reorder by date before writing. Defaults to 16.
+
+    Returns:
+        list: Path and number of added rows per file, in the order they were written.
+    """
+    workers = workers or os.cpu_count() or 1
+    queue = iter(enumerate(paths))
+    pending = {}  # future -> (index, path)
+    ready = []  # heap of (date, index, path, staged)
+    added = []
+
+    def write_earliest():
+        _, _, path, staged = heapq.heappop(ready)
+        with Session(engine) as session, session.begin():
+            added.append((path, write_staged(session, staged)))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            for index, path in itertools.islice(queue, workers - len(pending)):
+                pending[executor.submit(load_and_stage, path)] = (index, path)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, path = pending.pop(future)
+                staged = future.result()
+                heapq.heappush(ready, (staged_date(staged), index, path, staged))
+            while len(ready) > window:
+                write_earliest()
+    while ready:
+        write_earliest()
+    return added
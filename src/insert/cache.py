@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+
+from ..schema import Club, Human, Player, Team
+
+CachedPlayer = namedtuple("CachedPlayer", ["id", "association_id", "team"])
+
+
+class IdentityCache:
+    """Ids of clubs, teams and players for one ingest run.
+
+    The cache is warmed with one query per table and the populate functions add every row
+    they create or update, so repeated lookups are dictionary hits. It assumes that nobody
+    else writes to the database during the ingest and is not rolled back with a session.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+    """
+
+    def __init__(self, engine: Engine):
+        self.clubs = {}
+        self.teams = {}
+        self.season_teams = {}
+        self.competition_teams = {}
+        self.team_clubs = {}
+        self.players = {}
+        with Session(engine) as session:
+            for club_id, name in session.execute(select(Club.id, Club.name).order_by(Club.id)):
+                self.add_club(club_id, name)
+            for row in session.execute(
+                select(Team.id, Team.club, Team.rank, Team.year, Team.competition).order_by(Team.id)
+            ):
+                self.add_team(*row)
+            for player_id, name, club, association_id, team in session.execute(
+                select(Player.id, Human.name, Player.club, Player.association_id, Player.team)
+                .join(Human, Human.id == Player.human)
+                .order_by(Player.id.desc())
+            ):
+                # descending, so the oldest player of a name wins like in the database lookup
+                self.add_player(player_id, name, club, association_id, team)
+
+    def add_club(self, club_id: int, name: str):
+        self.clubs.setdefault(name, club_id)
+
+    def add_team(self, team_id: int, club: int, rank: str, year: str, competition: int):
+        self.teams.setdefault((club, rank, year, competition), team_id)
+        self.season_teams.setdefault((club, rank, year), team_id)
+        teams = self.competition_teams.setdefault((club, year, competition), [])
+        if team_id not in teams:
+            teams.append(team_id)
+        self.team_clubs[team_id] = club
+
+    def add_player(self, player_id: int, name: str, club: int, association_id: str, team: int):
+        self.players[(name, club)] = CachedPlayer(player_id, association_id, team)
+
+    def club(self, name: str):
+        """Id of the club with the given name or None."""
+        return self.clubs.get(name)
+
+    def team(self, club: int, rank: str, year: str, competition: int = None):
+        """Id of a team or None. Without competition, the first team of the club with that rank in the season."""
+        if competition is None:
+            return self.season_teams.get((club, rank, year))
+        return self.teams.get((club, rank, year, competition))
+
+    def club_teams(self, club: int, year: str, competition: int):
+        """Ids of the teams of a club in a competition."""
+        return self.competition_teams.get((club, year, competition), [])
+
+    def team_club(self, team: int):
+        """Id of the club of a team or None."""
+        return self.team_clubs.get(team)
+
+    def player(self, name: str, club: int):
+        """CachedPlayer with id, association id and team or None."""
+        return self.players.get((name, club))
@@ -4,7 +4,9 @@ from sqlalchemy import Engine, and_, select
 from sqlalchemy.orm import Session
 
 # import ..schema
+from ..generation import bump_generation
 from ..schema import Club, Competition, Team
+from .cache import IdentityCache
 
 
 def populate_clubs_and_teams(
@@ -13,12 +15,14 @@ def populate_clubs_and_teams(
     association: str,
     competition: str,
     season: datetime,
+    cache: IdentityCache = None,
 ):
     """Populate the database with clubs and their respective team letters.
 
     Args:
         engine (Engine): Engine connected to the database.
         clubs_and_teams (dict): A dictionary with clubs as keys and teams a values.
+        cache (IdentityCache, optional): Ingest cache for clubs and teams, new rows are flushed and added. Defaults to None.
     """
     # TODO: Add competition to team
     with Session(engine) as session:
@@ -38,35 +42,54 @@ def populate_clubs_and_teams(
         (comp_obj,) = comp_obj
         for club, teams in clubs_and_teams.items():
             try:
-                club_obj = session.query(Club).where(Club.name == club).first()
-                if not club_obj:
+                if cache is not None:
+                    club_id = cache.club(club)
+                else:
+                    club_obj = session.query(Club).where(Club.name == club).first()
+                    club_id = club_obj.id if club_obj else None
+                if club_id is None:
                     club_obj = Club(name=club)
                     session.add(club_obj)
                     session.flush()  # push to db
                     session.refresh(club_obj)  # get ids
+                    club_id = club_obj.id
+                    if cache is not None:
+                        cache.add_club(club_id, club)
                 for team in teams:
-                    team_obj = (
-                        session.query(Team)
-                        .where(
-                            and_(
-                                Team.rank == team,
-                                Team.club == club_obj.id,
-                                Team.year == season.isoformat(),
-                                Team.competition == comp_obj.id,
+                    if cache is not None:
+                        team_id = cache.team(club_id, team, season.isoformat(), comp_obj.id)
+                    else:
+                        team_obj = (
+                            session.query(Team)
+                            .where(
+                                and_(
+                                    Team.rank == team,
+                                    Team.club == club_id,
+                                    Team.year == season.isoformat(),
+                                    Team.competition == comp_obj.id,
+                                )
                             )
+                            .first()
                         )
-                        .first()
-                    )
-                    if not team_obj:
+                        team_id = team_obj.id if team_obj else None
+                    if team_id is None:
                         team_obj = Team(
                             rank=team,
-                            club=club_obj.id,
+                            club=club_id,
                             year=season.isoformat(),
                             competition=comp_obj.id,
                         )
                         session.add(team_obj)
+                        if cache is not None:
+                            session.flush()
+                            cache.add_team(
+                                team_obj.id, club_id, team, season.isoformat(), comp_obj.id
+                            )
             except:
                 session.rollback()
                 raise
             else:
                 session.commit()
+        # one generation bump per call instead of one per committed row
+        bump_generation(session)
+        session.commit()
@@ -4,6 +4,7 @@ from datetime import datetime
 from sqlalchemy import Engine, and_
 from sqlalchemy.orm import Session
 
+from ..generation import bump_generation
 from ..schema import Competition
 
 
@@ -46,3 +47,6 @@ def populate_competitions(
                     raise
                 else:
                     session.commit()
+        # one generation bump per call instead of one per committed row
+        bump_generation(session)
+        session.commit()
@@ -5,7 +5,9 @@ from datetime import datetime
 from sqlalchemy import Engine, and_, select, update
 from sqlalchemy.orm import Session
 
+from ..generation import bump_generation
 from ..schema import Club, Team, Human, Player, Competition
+from .cache import IdentityCache
 
 
 def create_human_id(name):
@@ -19,6 +21,7 @@ def get_player_or_create_player_and_human(
     team: int = None,
     association_id=None,
     flush_after_add=False,
+    cache: IdentityCache = None,
 ):
     """Get a player by club_id and his name. Name will be matched by human object.
     If a player exists without given association id, it is updated.
@@ -30,13 +33,19 @@ def get_player_or_create_player_and_human(
         name (str): Player name
         club_id (int): The id for the club. For doubles, more than one can be given. The first one is used for creation.
         association_id (Union[str,None], optional): The player number within the association. Defaults to None.
+        cache (IdentityCache, optional): Resolve the player from the cache instead of the database. New players are flushed. Defaults to None.
     """
-    stmt = (
-        select(Player)
-        .join(Human, Human.id == Player.human)
-        .where(and_(Human.name == name, Player.club == club_id))
-    )
-    player_obj = session.execute(stmt).first()
+    if cache is not None:
+        player_obj = cache.player(name, club_id)
+        player_obj = None if player_obj is None else (player_obj,)
+        flush_after_add = True
+    else:
+        stmt = (
+            select(Player)
+            .join(Human, Human.id == Player.human)
+            .where(and_(Human.name == name, Player.club == club_id))
+        )
+        player_obj = session.execute(stmt).first()
 
     if player_obj is None:
         if association_id is not None and "Spieler ist nicht" in association_id:
@@ -65,22 +74,28 @@ def get_player_or_create_player_and_human(
     else:
         player_obj = player_obj[0]
 
-    if player_obj.association_id == "" and association_id is not None:
+    player_association_id, player_team = player_obj.association_id, player_obj.team
+    if player_association_id == "" and association_id is not None:
+        player_association_id = str(association_id)
         update_stmt = (
             update(Player)
             .where(Player.id == player_obj.id)
-            .values(association_id=str(association_id))
+            .values(association_id=player_association_id)
         )
         session.execute(update_stmt)
 
     # TODO Check for Team date, maybe update team
-    if player_obj.team is None and team is not None:
+    if player_team is None and team is not None:
+        player_team = team
         update_stmt = (
             update(Player)
             .where(Player.id == player_obj.id)
             .values(team=team)
         )
         session.execute(update_stmt)
+
+    if cache is not None:
+        cache.add_player(player_obj.id, name, club_id, player_association_id, player_team)
     return player_obj
 
 
@@ -101,13 +116,23 @@ def reorder_name(player: str):
 
 
 def populate_players(
-    engine: Engine, players: list, association: str, competition: str, season: datetime
+    engine: Engine,
+    players: list,
+    association: str,
+    competition: str,
+    season: datetime,
+    cache: IdentityCache = None,
 ):
     """Populate the database with players.
 
+    Players without team rank, as the crawler writes them, join their club's team if the club
+    has exactly one team in the competition. Players of clubs with several teams are added
+    without team, like in `bulk.stage_file`.
+
     Args:
         engine (Engine): Engine connected to the database.
-        players (list): Player list of (id, name, club_name) tuple.
+        players (list): Player list of (id, name, club_name) or (id, name, club_name, team_rank) tuples.
+        cache (IdentityCache, optional): Ingest cache for clubs, teams and players. Defaults to None.
 
     Raises:
         ValueError: _description_
@@ -127,28 +152,52 @@ def populate_players(
                 f"Could not find default competition {association} {competition} for players!"
             )
         # TODO Player gets team instead of competition
-        for assoc_id, name, club_name, team_rank in players:
+        for player in players:
+            assoc_id, name, club_name, team_rank = player if len(player) == 4 else (*player, None)
             name = name.strip()
             try:
                 # Find club first to search player after name within club
                 # Assumption: No name collisions within clubs
-                club_stmt = select(Club).where(Club.name == club_name)
-                club_obj = session.execute(club_stmt).first()
-                if not club_obj:
+                if cache is not None:
+                    club_id = cache.club(club_name)
+                else:
+                    club_stmt = select(Club.id).where(Club.name == club_name)
+                    club_id = session.execute(club_stmt).scalar()
+                if club_id is None:
                     raise ValueError(
                         f"Club not found {club_name}. Please create clubs before players."
                     )
 
-                team_stmt = select(Team).where(
-                    and_(
-                        Team.rank == team_rank,
-                        Team.club == club_obj[0].id,
-                        Team.year == season.isoformat(),
-                        Team.competition == comp_obj[0].id
+                if team_rank is None:
+                    if cache is not None:
+                        team_ids = cache.club_teams(club_id, season.isoformat(), comp_obj[0].id)
+                    else:
+                        team_ids = session.execute(
+                            select(Team.id).where(
+                                and_(
+                                    Team.club == club_id,
+                                    Team.year == season.isoformat(),
+                                    Team.competition == comp_obj[0].id,
+                                )
+                            )
+                        ).scalars().all()
+                    # the team of a player is ambiguous if the club has several
+                    team_id = team_ids[0] if len(team_ids) == 1 else None
+                elif cache is not None:
+                    team_id = cache.team(
+                        club_id, team_rank, season.isoformat(), comp_obj[0].id
                     )
-                )
-                team_obj = session.execute(team_stmt).first()
-                if team_obj is None:
+                else:
+                    team_stmt = select(Team.id).where(
+                        and_(
+                            Team.rank == team_rank,
+                            Team.club == club_id,
+                            Team.year == season.isoformat(),
+                            Team.competition == comp_obj[0].id
+                        )
+                    )
+                    team_id = session.execute(team_stmt).scalar()
+                if team_id is None and team_rank is not None:
                     raise ValueError(
                         f"Team not found {club_name, team_rank}. Please create clubs before players."
                     )
@@ -157,12 +206,16 @@ def populate_players(
                 get_player_or_create_player_and_human(
                     session,
                     name,
-                    club_obj[0].id,
-                    team=team_obj[0].id,
+                    club_id,
+                    team=team_id,
                     association_id=assoc_id,
+                    cache=cache,
                 )
             except:
                 session.rollback()
                 raise
             else:
                 session.commit()
+        # one generation bump per call instead of one per committed row
+        bump_generation(session)
+        session.commit()
@@ -0,0 +1,209 @@
+import json
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import Engine
+
+from .cache import IdentityCache
+from .clubs import populate_clubs_and_teams
+from .competition import populate_competitions
+from .match import populate_teammatches
+from .player import populate_players
+
+CrawlRecord = namedtuple("CrawlRecord", ["kind", "association", "competition", "payload"])
+
+CHUNK_SIZE = 1 << 16
+_WHITESPACE = " \t\n\r"
+
+
+class JsonStreamReader:
+    """Walks a json document while reading it in chunks.
+
+    Objects and arrays are entered with items and elements, values are decoded with value.
+    Only the current chunk and the value being decoded are held in memory.
+
+    Args:
+        f (TextIO): File opened in text mode.
+        chunk_size (int, optional): Characters to read at once. Defaults to 64k.
+    """
+
+    def __init__(self, f, chunk_size: int = CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        if self.pos > len(self.buffer) // 2:
+            self.buffer = self.buffer[self.pos :]
+            self.pos = 0
+        chunk = self.f.read(self.chunk_size)
+        self.eof = chunk == ""
+        self.buffer += chunk
+        return not self.eof
+
+    def peek(self):
+        """Next non-whitespace character without consuming it, empty at the end of the document."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos : self.pos + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at {self.pos}, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def items(self):
+        """Enter an object and yield its keys. The caller consumes each value before the next key."""
+        self.expect("{")
+        first = True
+        while self.peek() != "}":
+            if not first:
+                self.expect(",")
+            first = False
+            key = self.value()
+            self.expect(":")
+            yield key
+        self.expect("}")
+
+    def elements(self):
+        """Enter an array and yield for each element. The caller consumes each element before the next."""
+        self.expect("[")
+        index = 0
+        while self.peek() != "]":
+            if index:
+                self.expect(",")
+            yield index
+            index += 1
+        self.expect("]")
+
+
+def _competition_records(reader: JsonStreamReader, association: str, competition: str):
+    """Records of one competition.
+
+    Team matches are paired with the legs in "matches" by index. The list of legs of the
+    competition is held until its team matches are read, so memory is bounded per competition,
+    not flat. This relies on the crawler writing "matches" before "team_matches".
+
+    Raises:
+        ValueError: If "team_matches" precede "matches".
+    """
+    matches = None
+    for section in reader.items():
+        if section == "clubs_teams":
+            for club in reader.items():
+                yield CrawlRecord("club", association, competition, (club, reader.value()))
+        elif section == "players":
+            for _ in reader.elements():
+                yield CrawlRecord("player", association, competition, tuple(reader.value()))
+        elif section == "matches":
+            matches = [reader.value() for _ in reader.elements()]
+        elif section == "team_matches":
+            if matches is None:
+                raise ValueError(
+                    f'"team_matches" of {association}: {competition} precede its "matches", the file can not be streamed'
+                )
+            for i, _ in enumerate(reader.elements()):
+                legs = None
+                if i < len(matches):
+                    legs, matches[i] = matches[i], None
+                yield CrawlRecord("team_match", association, competition, (reader.value(), legs))
+        else:
+            reader.value()
+
+
+def iter_crawl_records(path, chunk_size: int = CHUNK_SIZE):
+    """Read a crawled json file record by record.
+
+    Yields the crawl metadata (from_date, crawled_date, season), the crawled competitions,
+    and then one record per club, player and team match (paired with its legs).
+    Memory is bounded by the legs of a single competition, not by the size of the file, see
+    `_competition_records`.
+
+    Args:
+        path (Union[str, Path]): Path to the crawled file.
+        chunk_size (int, optional): Characters to read at once. Defaults to 64k.
+
+    Yields:
+        CrawlRecord: Kind, association, competition and payload of a record.
+    """
+    with open(path, "r") as f:
+        reader = JsonStreamReader(f, chunk_size)
+        for key in reader.items():
+            if key in ("from_date", "crawled_date", "season"):
+                yield CrawlRecord(key, None, None, reader.value())
+            elif key == "crawled_competitions":
+                yield CrawlRecord("competitions", None, None, reader.value())
+            else:
+                for competition in reader.items():
+                    yield from _competition_records(reader, key, competition)
+
+
+def stream_populate(engine: Engine, path, cache: IdentityCache = None, batch_size: int = 100):
+    """Populate the database from a crawled file while it is being read.
+
+    Records are handed to the populate functions in batches of one kind and competition.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+        path (Union[str, Path]): Path to the crawled file.
+        cache (IdentityCache, optional): Ingest cache for clubs, teams and players. Defaults to None.
+        batch_size (int, optional): Records per call of a populate function. Defaults to 100.
+    """
+    season = None
+    batch_key, batch = None, []
+
+    def flush():
+        if not batch:
+            return
+        kind, association, competition = batch_key
+        if kind == "club":
+            populate_clubs_and_teams(engine, dict(batch), association, competition, season, cache=cache)
+        elif kind == "player":
+            populate_players(engine, batch, association, competition, season, cache=cache)
+        elif kind == "team_match":
+            team_matches, matches = zip(*batch)
+            populate_teammatches(engine, list(team_matches), list(matches), season, cache=cache)
+        batch.clear()
+
+    for record in iter_crawl_records(path):
+        if record.kind == "season":
+            season = datetime.fromisoformat(record.payload)
+            continue
+        if record.kind in ("from_date", "crawled_date"):
+            continue
+        if season is None:
+            raise ValueError(f"Season of {path} must precede its {record.kind} records")
+        if record.kind == "competitions":
+            populate_competitions(engine, record.payload, season)
+            continue
+        key = (record.kind, record.association, record.competition)
+        if key != batch_key or len(batch) >= batch_size:
+            flush()
+            batch_key = key
+        batch.append(record.payload)
+    flush()
+    logging.debug(f"Streamed {path}")
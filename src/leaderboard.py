@@ -0,0 +1,102 @@
+import logging
+
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from .schema import Club, Human, Leaderboard, Player, SkillRating, Team
+
+# (player, team) keys per statement, well below SQLite's limit of bound parameters
+CHUNK_SIZE = 400
+# rank by mu - 3 sigma, like common_queries.leaderboard always did
+CONSERVATIVE_SIGMAS = 3
+
+
+def _leaderboard_rows():
+    """Leaderboard columns of every SkillRating, players without association id are not ranked."""
+    return (
+        select(
+            SkillRating.player,
+            SkillRating.team,
+            Team.competition,
+            Team.club,
+            Human.name,
+            Club.name,
+            SkillRating.rating_mu,
+            SkillRating.rating_sigma,
+            SkillRating.rating_mu - CONSERVATIVE_SIGMAS * SkillRating.rating_sigma,
+            SkillRating.latest_update,
+        )
+        .join(Player, Player.id == SkillRating.player)
+        .join(Human, Human.id == Player.human)
+        .join(Team, Team.id == SkillRating.team)
+        .join(Club, Club.id == Team.club)
+        .where(Player.association_id != "")
+    )
+
+
+_COLUMNS = [
+    "player",
+    "team",
+    "competition",
+    "club",
+    "name",
+    "club_name",
+    "rating_mu",
+    "rating_sigma",
+    "conservative_rating",
+    "latest_update",
+]
+
+
+def rank_competitions(session: Session, competitions=None):
+    """Recompute the ranks of the given or all competitions, only rows whose rank changed are written.
+
+    Args:
+        session (Session): The current db session. Committing is up to the caller.
+        competitions (Iterable, optional): Competition ids. Defaults to all competitions.
+    """
+    new_rank = func.rank().over(
+        partition_by=Leaderboard.competition, order_by=Leaderboard.conservative_rating.desc()
+    )
+    ranked = select(Leaderboard.id, new_rank.label("new_rank"))
+    if competitions is not None:
+        ranked = ranked.where(Leaderboard.competition.in_(list(competitions)))
+    ranked = ranked.subquery()
+    session.execute(
+        update(Leaderboard)
+        .where((Leaderboard.id == ranked.c.id) & Leaderboard.rank.is_distinct_from(ranked.c.new_rank))
+        .values(rank=ranked.c.new_rank)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def refresh_leaderboard(session: Session, keys=None):
+    """Copy ratings into the leaderboard and re-rank the affected competitions.
+
+    Args:
+        session (Session): The current db session. Committing is up to the caller.
+        keys (Iterable, optional): (player, team) keys whose rating changed. Defaults to None,
+            which rebuilds the whole leaderboard.
+    """
+    if keys is None:
+        session.execute(delete(Leaderboard))
+        session.execute(insert(Leaderboard).from_select(_COLUMNS, _leaderboard_rows()))
+        rank_competitions(session)
+        logging.info("Rebuilt the leaderboard")
+        return
+
+    keys = list(keys)
+    if not keys:
+        return
+    for start in range(0, len(keys), CHUNK_SIZE):
+        chunk = keys[start : start + CHUNK_SIZE]
+        session.execute(delete(Leaderboard).where(tuple_(Leaderboard.player, Leaderboard.team).in_(chunk)))
+        session.execute(
+            insert(Leaderboard).from_select(
+                _COLUMNS, _leaderboard_rows().where(tuple_(SkillRating.player, SkillRating.team).in_(chunk))
+            )
+        )
+    teams = {team for _, team in keys if team is not None}
+    competitions = session.execute(select(Team.competition).where(Team.id.in_(teams)).distinct()).scalars().all()
+    rank_competitions(session, competitions)
+    logging.info(f"Refreshed {len(keys)} leaderboard entries in {len(competitions)} competitions")
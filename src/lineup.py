@@ -0,0 +1,149 @@
+import itertools
+from collections import Counter, namedtuple
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from rating_kernel import win_probability_matrix
+
+# four singles positions, played twice. In the second round home position i meets away position i + 1.
+N_POSITIONS = 4
+SECOND_ROUND = [(i, (i + 1) % N_POSITIONS) for i in range(N_POSITIONS)]
+
+SinglesLeg = namedtuple("SinglesLeg", ["home", "away", "win_probability"])
+DoublesLeg = namedtuple("DoublesLeg", ["home", "away", "win_probability"])
+Lineup = namedtuple("Lineup", ["singles", "doubles", "expected_legs"])
+
+
+def _ratings(players):
+    return np.array([(p.rating.mu, p.rating.sigma) for p in players], dtype=np.float64).reshape(-1, 2)
+
+
+def likely_positions(players: list, positions: dict):
+    """Order players by the singles positions they usually play.
+
+    Args:
+        players (list): PlayerTuples as returned by `get_player_skill_for_team`.
+        positions (dict): Player name to the match numbers of their previous singles,
+            e.g. the home and away positions of `get_positions_for_player`.
+
+    Returns:
+        list: Up to four players, the one most likely to play position 1 first.
+    """
+    counts = np.zeros((len(players), N_POSITIONS))
+    for i, player in enumerate(players):
+        for position, count in Counter(positions.get(player.name, [])).items():
+            if 1 <= position <= N_POSITIONS:
+                counts[i, position - 1] = count
+    # a small bonus by rating picks the strongest players when the history does not decide
+    strength = np.argsort(np.argsort([p.rating.mu for p in players]))
+    counts += 1e-3 * (strength / len(players))[:, None]
+    rows, columns = linear_sum_assignment(counts, maximize=True)
+    return [players[row] for row in rows[np.argsort(columns)]]
+
+
+def best_singles(home_players: list, away_lineup: list):
+    """Assign home players to the singles positions to maximize the expected singles won.
+
+    Every home player plays both rounds, so a position is worth the win probability against
+    the away player at that position plus the one at the next position.
+
+    Args:
+        home_players (list): Home roster, PlayerTuples.
+        away_lineup (list): Away players at positions 1 to 4.
+
+    Returns:
+        list: Eight SinglesLeg in the order they are played, home None for positions that stay empty.
+    """
+    probabilities = win_probability_matrix(_ratings(home_players), _ratings(away_lineup))
+    n_away = len(away_lineup)
+    value = np.zeros((len(home_players), N_POSITIONS))
+    for home_position, away_position in [*zip(range(N_POSITIONS), range(N_POSITIONS)), *SECOND_ROUND]:
+        if away_position < n_away:
+            value[:, home_position] += probabilities[:, away_position]
+    rows, columns = linear_sum_assignment(value, maximize=True)
+    lineup = [None] * N_POSITIONS
+    for row, column in zip(rows, columns):
+        lineup[column] = row
+
+    legs = []
+    for home_position, away_position in [*zip(range(N_POSITIONS), range(N_POSITIONS)), *SECOND_ROUND]:
+        row = lineup[home_position]
+        away = away_lineup[away_position] if away_position < n_away else None
+        if row is None:
+            legs.append(SinglesLeg(None, away, 0.0))
+        elif away is None:
+            legs.append(SinglesLeg(home_players[row], None, 1.0))
+        else:
+            legs.append(SinglesLeg(home_players[row], away, float(probabilities[row, away_position])))
+    return legs
+
+
+def best_doubles(home_players: list, away_pairs: list):
+    """Choose two disjoint home pairs for both doubles blocks to maximize the expected doubles won.
+
+    The pairs stay the same in both blocks: the first home pair meets the first away pair and then
+    the second one, the second home pair meets them the other way round. Every pair thus plays both
+    away pairs, a pair is worth the sum of its two win probabilities.
+
+    Args:
+        home_players (list): Home roster, PlayerTuples.
+        away_pairs (list): Two pairs of away players, in the order they are played in the first block.
+
+    Returns:
+        list: Four DoublesLeg in the order they are played.
+    """
+    # two disjoint pairs need four players, three players already give three overlapping pairs
+    if len(home_players) < 4:
+        raise ValueError("At least four home players are needed for two doubles")
+    pairs = list(itertools.combinations(range(len(home_players)), 2))
+    ratings = _ratings(home_players)
+    home = np.stack([ratings[list(pair)] for pair in pairs])
+    away = np.stack([_ratings(pair) for pair in away_pairs])
+    probabilities = win_probability_matrix(home, away)
+
+    # value of the pairs i and j, pairs may not share a player
+    pair_value = probabilities.sum(axis=1)
+    value = pair_value[:, None] + pair_value[None, :]
+    members = np.zeros((len(pairs), len(home_players)), dtype=bool)
+    for i, pair in enumerate(pairs):
+        members[i, list(pair)] = True
+    overlapping = (members.astype(np.int32) @ members.T.astype(np.int32)) > 0
+    value[overlapping] = -np.inf
+    first, second = np.unravel_index(np.argmax(value), value.shape)
+    return [
+        DoublesLeg(tuple(home_players[i] for i in pairs[pair]), tuple(away_pairs[leg]), float(probabilities[pair, leg]))
+        for pair, leg in [(first, 0), (second, 1), (first, 1), (second, 0)]
+    ]
+
+
+def best_lineup(home_players: list, away_players: list, away_positions: dict = None, away_pairs: list = None):
+    """Lineup and doubles pairings of the home team that maximize the expected number of legs won.
+
+    A team match consists of four singles, two doubles, four singles with rotated opponents
+    and two more doubles. Singles positions are solved as an assignment problem, the doubles
+    by the best disjoint pair of pairs for both blocks, all on batched win probabilities.
+
+    Args:
+        home_players (list): Home roster, PlayerTuples from `get_player_skill_for_team`.
+        away_players (list): Away roster, PlayerTuples.
+        away_positions (dict, optional): Away player name to previous singles positions. Without it,
+            the four strongest away players are expected at positions 1 to 4. Defaults to None.
+        away_pairs (list, optional): The two away pairs of the first doubles block, in the second block
+            each meets the other home pair. Defaults to positions 1 and 2 and positions 3 and 4.
+
+    Returns:
+        Lineup: Singles and doubles legs in order of play and the expected number of legs won.
+    """
+    if away_positions is not None:
+        away_lineup = likely_positions(away_players, away_positions)
+    else:
+        away_lineup = sorted(away_players, key=lambda p: p.rating.mu, reverse=True)[:N_POSITIONS]
+    singles = best_singles(home_players, away_lineup)
+
+    if away_pairs is None:
+        away_pairs = [away_lineup[:2], away_lineup[2:4]]
+    doubles = best_doubles(home_players, away_pairs)
+
+    expected_legs = sum(leg.win_probability for leg in singles + doubles)
+    return Lineup(singles, doubles, expected_legs)
@@ -0,0 +1,85 @@
+import logging
+
+from sqlalchemy import Engine, and_, func, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+
+from .schema import Base
+
+
+def find_duplicates(connection, index):
+    """Count groups of rows that would violate a unique index. NULLs never collide in SQLite.
+
+    Args:
+        connection (Connection): Open connection to the database.
+        index (Index): The unique index.
+
+    Returns:
+        int: Number of duplicated keys.
+    """
+    columns = list(index.columns)
+    duplicates = (
+        select(*columns)
+        .where(and_(*[column.is_not(None) for column in columns]))
+        .group_by(*columns)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    return connection.execute(select(func.count()).select_from(duplicates)).scalar()
+
+
+def add_missing_columns(connection, inspector, table):
+    """Add nullable columns of the schema that an existing table lacks.
+
+    Args:
+        connection (Connection): Open connection to the database.
+        inspector (Inspector): Inspector of the connection.
+        table (Table): Table of the schema.
+
+    Returns:
+        list: Names of the added columns.
+    """
+    existing = {column["name"] for column in inspector.get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = CreateColumn(column).compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}'))
+        logging.info(f"Added column {table.name}.{column.name}")
+        added.append(column.name)
+    return added
+
+
+def migrate_database(engine: Engine):
+    """Bring a database created with an older schema up to date.
+
+    Creates missing tables, columns and every index of the schema that does not exist yet.
+    Unique indexes are skipped with an error if existing rows violate them.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+
+    Returns:
+        list: Names of the created indexes.
+    """
+    Base.metadata.create_all(engine)
+    created = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in Base.metadata.sorted_tables:
+            add_missing_columns(connection, inspector, table)
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                if index.unique:
+                    n_duplicates = find_duplicates(connection, index)
+                    if n_duplicates:
+                        logging.error(
+                            f"Skipping {index.name}, {n_duplicates} keys are duplicated in {table.name}"
+                        )
+                        continue
+                index.create(connection)
+                logging.info(f"Created index {index.name}")
+                created.append(index.name)
+    return created
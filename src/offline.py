@@ -0,0 +1,273 @@
+import csv
+import logging
+from collections import defaultdict, namedtuple
+from datetime import datetime
+
+import numpy as np
+import trueskill
+
+from .archive import load_crawl
+from .insert.bulk import stage_file, staged_date
+from .rating import Leg, home_wins, leg_keys, schedule_waves
+from .rating_kernel import TrueSkillKernel
+
+# a rating belongs to a player (name, club) playing for a team
+RatingKey = namedtuple(
+    "RatingKey", ["name", "club", "rank", "season", "association", "competition"]
+)
+OfflineRatings = namedtuple(
+    "OfflineRatings",
+    ["keys", "mu", "sigma", "latest_update", "history_slot", "history_date", "history_mu", "history_sigma"],
+)
+# predictive accuracy of a replay, probabilities are those of the actual winner
+Score = namedtuple("Score", ["log_loss", "brier", "accuracy", "n_legs"])
+
+
+def collect_legs(staged_files: list):
+    """Resolve the team matches and legs of staged files like the bulk insert does.
+
+    Team matches are identified by (date, home team, away team, competition), legs by their
+    position or players, the first occurrence wins. Teams of a team match are looked up in its
+    competition first and in the whole season otherwise.
+
+    Args:
+        staged_files (list): Outputs of stage_file, in insert order.
+
+    Returns:
+        tuple: Team keys (club, rank, season, competition), player keys (name, club) and
+            legs in replay order with indices into both lists.
+    """
+    teams, any_teams = {}, {}
+    players = {}
+    team_matches = {}  # natural key -> [date, home team, away team, positions, singles, doubles]
+    for staged in staged_files:
+        season = staged["season"]
+        for club, rank, comp_key in staged["teams"]:
+            team = (club, rank, season, comp_key)
+            teams.setdefault(team, len(teams))
+            any_teams.setdefault((club, rank, season), teams[team])
+
+        for team_match in staged["team_matches"]:
+            comp_key = team_match["competition"]
+            home_team, away_team = [
+                teams.get((*team, season, comp_key), any_teams.get((*team, season)))
+                for team in (team_match["home_team"], team_match["away_team"])
+            ]
+            if None in (home_team, away_team):
+                logging.info(f"Could not find team for {team_match['home_team']} {team_match['away_team']}")
+                continue
+            key = (team_match["date"], home_team, away_team, comp_key)
+            date, _, _, positions, singles, doubles = team_matches.setdefault(
+                key, [team_match["date"], home_team, away_team, set(), [], []]
+            )
+            home_club, away_club = team_match["home_team"][0], team_match["away_team"][0]
+            for position, home, away, result, _ in team_match["legs"]:
+                if position in positions:
+                    continue
+                home = tuple(players.setdefault((name, home_club), len(players)) for name in home)
+                away = tuple(players.setdefault((name, away_club), len(players)) for name in away)
+                legs = singles if len(home) == 1 else doubles
+                if any(leg[:2] == (home, away) for leg in legs):
+                    continue
+                positions.add(position)
+                legs.append((home, away, result))
+
+    # stable sort, team matches of the same date keep their insert order
+    legs = []
+    ordered = sorted(team_matches.values(), key=lambda team_match: team_match[0])
+    for index, (date, home_team, away_team, _, singles, doubles) in enumerate(ordered):
+        for home, away, result in singles + doubles:
+            legs.append(Leg(index, date, home, away, home_team, away_team, result))
+    return list(teams), list(players), legs
+
+
+class OfflineReplay:
+    """Legs of crawled season files compiled into dense arrays and replayed without a database.
+
+    Loading and scheduling happen once, so the same season can be replayed cheaply with many
+    TrueSkill environments. Results equal compute_ratings on a database holding the same files.
+
+    Args:
+        team_keys (list): (club, rank, season, (competition, association)) per team index.
+        player_keys (list): (name, club) per player index.
+        legs (list): Legs in replay order, players and teams given as indices.
+    """
+
+    def __init__(self, team_keys: list, player_keys: list, legs: list):
+        self.legs = legs
+        slots = {}  # (player, team) -> slot, created in leg order like the database replay
+        latest = []
+        for leg in legs:
+            valid = home_wins(leg.result) is not None
+            for key in leg_keys(leg):
+                if key not in slots:
+                    slots[key] = len(slots)
+                    latest.append(leg.date)
+                elif valid:
+                    latest[slots[key]] = leg.date
+        self.keys = []
+        for player, team in slots:
+            name, club = player_keys[player]
+            _, rank, season, (competition, association) = team_keys[team]
+            self.keys.append(RatingKey(name, club, rank, season, association, competition))
+        self.latest_update = latest
+
+        # waves of independent legs, one (winners, losers) pair per team size
+        valid_legs = [leg for leg in legs if home_wins(leg.result) is not None]
+        self.waves = []
+        history_slots, history_dates, history_keys = [], [], []
+        for wave in schedule_waves(valid_legs):
+            batches = defaultdict(lambda: ([], []))
+            for leg in wave:
+                keys = [slots[key] for key in leg_keys(leg)]
+                home, away = keys[: len(leg.home)], keys[len(leg.home) :]
+                winners, losers = batches[len(home)]
+                winners.append(home if home_wins(leg.result) else away)
+                losers.append(away if home_wins(leg.result) else home)
+                for slot in keys:
+                    history_slots.append(slot)
+                    history_dates.append(leg.date)
+                    history_keys.append((slot, leg.team_match))
+            self.waves.append(
+                [(np.array(winners), np.array(losers)) for winners, losers in batches.values()]
+            )
+        self.wave_ends = np.cumsum(
+            [sum(winners.size + losers.size for winners, losers in wave) for wave in self.waves],
+            dtype=np.int64,
+        )
+        self.history_slots = np.array(history_slots, dtype=np.int64)
+
+        # like the database history, keep the rating after the last leg of a team match
+        last = {key: i for i, key in enumerate(history_keys)}
+        self.history_keep = np.array(sorted(last.values()), dtype=np.int64)
+        self.history_dates = [history_dates[i] for i in self.history_keep]
+
+    @classmethod
+    def from_files(cls, paths: list):
+        """Build a replay from crawled json files or archives.
+
+        Args:
+            paths (list): Paths to crawled files of one or more seasons.
+        """
+        staged_files = []
+        for path in paths:
+            crawled_results = load_crawl(path)
+            crawled_results["season"] = datetime.fromisoformat(crawled_results["season"])
+            staged_files.append(stage_file(crawled_results))
+        staged_files.sort(key=staged_date)
+        return cls(*collect_legs(staged_files))
+
+    def kernel(self, env: trueskill.TrueSkill = None):
+        """A TrueSkillKernel with the initial rating of env in every slot."""
+        kernel = TrueSkillKernel(env, capacity=1)
+        kernel.mu = np.full(len(self.keys), kernel.env.mu, dtype=np.float64)
+        kernel.sigma = np.full(len(self.keys), kernel.env.sigma, dtype=np.float64)
+        return kernel
+
+    def score(self, env: trueskill.TrueSkill = None, eps: float = 1e-15):
+        """Replay all legs and score the win probability of each leg before it was rated.
+
+        Args:
+            env (trueskill.TrueSkill, optional): TrueSkill parameters. Defaults to the global environment.
+            eps (float, optional): Probabilities are clipped to [eps, 1 - eps] for the log-loss. Defaults to 1e-15.
+
+        Returns:
+            Score: Mean log-loss, Brier score and accuracy over all legs with a valid result.
+        """
+        kernel = self.kernel(env)
+        probabilities = []
+        for wave in self.waves:
+            for winners, losers in wave:
+                # legs of a wave are independent, so these are the ratings right before each leg
+                probabilities.append(kernel.win_probability(winners, losers))
+                kernel.rate(winners, losers)
+        winner_probability = np.concatenate(probabilities) if probabilities else np.empty(0)
+        clipped = np.clip(winner_probability, eps, 1 - eps)
+        return Score(
+            float(-np.log(clipped).mean()),
+            float(((1 - winner_probability) ** 2).mean()),
+            float((winner_probability > 0.5).mean()),
+            len(winner_probability),
+        )
+
+    def replay(self, env: trueskill.TrueSkill = None):
+        """Replay all legs.
+
+        Args:
+            env (trueskill.TrueSkill, optional): TrueSkill parameters. Defaults to the global environment.
+
+        Returns:
+            OfflineRatings: Final rating per key and the rating of each key after each of its team matches.
+        """
+        kernel = self.kernel(env)
+        history_mu = np.empty(len(self.history_slots))
+        history_sigma = np.empty(len(self.history_slots))
+        start = 0
+        for wave, end in zip(self.waves, self.wave_ends):
+            for winners, losers in wave:
+                kernel.rate(winners, losers)
+            slots = self.history_slots[start:end]
+            history_mu[start:end] = kernel.mu[slots]
+            history_sigma[start:end] = kernel.sigma[slots]
+            start = end
+        return OfflineRatings(
+            self.keys,
+            kernel.mu,
+            kernel.sigma,
+            self.latest_update,
+            self.history_slots[self.history_keep],
+            self.history_dates,
+            history_mu[self.history_keep],
+            history_sigma[self.history_keep],
+        )
+
+
+def write_ratings_csv(path, ratings: OfflineRatings):
+    """Write the final ratings, one row per key.
+
+    Args:
+        path (Union[str, Path]): Destination csv file.
+        ratings (OfflineRatings): Output of OfflineReplay.replay.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([*RatingKey._fields, "mu", "sigma", "latest_update"])
+        for key, mu, sigma, latest_update in zip(ratings.keys, ratings.mu, ratings.sigma, ratings.latest_update):
+            writer.writerow([*key, repr(float(mu)), repr(float(sigma)), latest_update])
+
+
+def write_history_csv(path, ratings: OfflineRatings):
+    """Write the rating of every key after each of its team matches, ordered by replay.
+
+    Args:
+        path (Union[str, Path]): Destination csv file.
+        ratings (OfflineRatings): Output of OfflineReplay.replay.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([*RatingKey._fields, "date", "mu", "sigma"])
+        for slot, date, mu, sigma in zip(
+            ratings.history_slot.tolist(), ratings.history_date, ratings.history_mu, ratings.history_sigma
+        ):
+            writer.writerow([*ratings.keys[slot], date, repr(float(mu)), repr(float(sigma))])
+
+
+def write_ratings_npz(path, ratings: OfflineRatings):
+    """Write ratings and history as arrays, keys as string columns.
+
+    Args:
+        path (Union[str, Path]): Destination .npz file.
+        ratings (OfflineRatings): Output of OfflineReplay.replay.
+    """
+    keys = {f"key_{field}": np.array(column, dtype=str) for field, column in zip(RatingKey._fields, zip(*ratings.keys))}
+    np.savez_compressed(
+        path,
+        **keys,
+        mu=ratings.mu,
+        sigma=ratings.sigma,
+        latest_update=np.array(ratings.latest_update, dtype=str),
+        history_slot=ratings.history_slot,
+        history_date=np.array(ratings.history_date, dtype=str),
+        history_mu=ratings.history_mu,
+        history_sigma=ratings.history_sigma,
+    )
@@ -0,0 +1,239 @@
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+
+data_sources = {
+    2022: "https://ndv.2k-dart-software.de/index.php/de/component/dartliga/index.php?option=com_dartliga&controller=showligagameplan&layout=showdashboard&filVbKey=6&filCompKey=1&filSaiKey=112&filVbsubKey=1&filStaffKey=667&filStaffFsGrpdataKey=0#",
+    2023: "https://ddv.2k-dart-software.de/index.php/de/component/dartliga/index.php?option=com_dartliga&controller=showligagameplan&layout=showdashboard&filVbKey=6&filCompKey=1&filSaiKey=126&filVbsubKey=1&filStaffKey=823&filStaffFsGrpdataKey=0",
+}
+
+# rows of a match report: singles 1-4, doubles 1-2, singles 1-4 again, doubles 1-2 again
+_MATCH_NUMBERS = [1, 2, 3, 4, 1, 2, 1, 2, 3, 4, 1, 2]
+
+
+def match_number(row: int):
+    """Match number of the i-th row of a match report.
+
+    Reports with more rows than the usual twelve keep going through the same scheme, the legs
+    are identified by their position anyway.
+    """
+    if row >= len(_MATCH_NUMBERS):
+        logging.warning(f"Match report has more than {len(_MATCH_NUMBERS)} rows, row {row + 1} gets a repeated match number")
+    return _MATCH_NUMBERS[row % len(_MATCH_NUMBERS)]
+
+
+def soup_of(html):
+    """Parse html unless it already is a BeautifulSoup tree."""
+    if isinstance(html, str):
+        return BeautifulSoup(html, "html.parser")
+    return html
+
+
+def text_of(tag):
+    """Text of a tag like `get_attribute("textContent")` of selenium."""
+    return tag.get_text() if tag is not None else ""
+
+
+def attribute_key(tag, name: str = None):
+    """Numeric key a button or link carries in its href, onclick or data attributes.
+
+    Args:
+        tag (Tag): The button or link.
+        name (str, optional): Name of the query parameter, e.g. "filVbKey". Without a name or
+            if it does not occur, the first number of the onclick and data attributes is used.
+
+    Returns:
+        Union[str, None]: The key.
+    """
+    values = [str(value) for attr, value in tag.attrs.items() if attr in ("href", "onclick") or attr.startswith("data-")]
+    if name is not None:
+        for value in values:
+            found = re.search(rf"{name}\W+(\d+)", value)
+            if found:
+                return found.group(1)
+    for value in values:
+        if value.startswith("#"):
+            continue
+        found = re.search(r"\d+", value)
+        if found:
+            return found.group(0)
+    return None
+
+
+def _header_columns(soup):
+    dashboard = soup.find(id="showligadashDashboard")
+    header_rows = dashboard.find(class_="well-sm")
+    assoc_div, comp_div = header_rows.find_all(recursive=False)[:2]
+    return assoc_div, comp_div
+
+
+def parse_associations(html, key_name: str = "filVbKey"):
+    """Associations of the dashboard header.
+
+    Args:
+        html (Union[str, BeautifulSoup]): The dashboard.
+        key_name (str, optional): Query parameter that selects an association. Defaults to "filVbKey".
+
+    Returns:
+        dict: Association title to its key, in page order.
+    """
+    assoc_div, _ = _header_columns(soup_of(html))
+    return {a.get("title"): attribute_key(a, key_name) for a in assoc_div.find_all("a")}
+
+
+def parse_competitions(html, key_name: str = "filStaffKey"):
+    """Competitions of the selected association in the dashboard header.
+
+    Args:
+        html (Union[str, BeautifulSoup]): The dashboard.
+        key_name (str, optional): Query parameter that selects a competition. Defaults to "filStaffKey".
+
+    Returns:
+        dict: Competition title to its key, in page order.
+    """
+    _, comp_div = _header_columns(soup_of(html))
+    return {a.get("title"): attribute_key(a, key_name) for a in comp_div.find_all("a")}
+
+
+def parse_club_team(heading: str):
+    """Split a squad heading into club and team.
+
+    "Club Name e.V. C (irrelevant extra)" -> ("Club Name e.V.", "C")
+    """
+    club_team_name = re.sub(r"\(.*\)", "", heading).strip()
+    return club_team_name[:-2].strip(), club_team_name[-1]
+
+
+def parse_player(text: str):
+    """Split a squad entry into name and association id.
+
+    "van Hooff, Jens (100405)" -> ("Jens van Hooff", "100405"), None for placeholders.
+    """
+    player = text.replace("TC", "").strip().split("(")
+    name_split = player[0].split(",")
+    name = f"{' '.join([n.strip() for n in name_split[1:]])} {name_split[0]}".strip()
+    if "Spieler ist nicht" in name:
+        return None
+    return name, player[-1][:-1]
+
+
+def parse_squads(html, teams: dict = None, players: list = None):
+    """Clubs, teams and players of the "Spielerkader" tab.
+
+    Args:
+        html (Union[str, BeautifulSoup]): The squad panel or a page containing it.
+        teams (dict, optional): club -> set of teams to add to. Defaults to a new one.
+        players (list, optional): List of (association id, name, club, team) to add to. Defaults to a new one.
+
+    Returns:
+        tuple: teams and players.
+    """
+    teams = defaultdict(set) if teams is None else teams
+    players = [] if players is None else players
+    soup = soup_of(html)
+    squad_panel = soup.find(id="showPlayerSquadAreaData") or soup
+    for team_heading in squad_panel.find_all(class_="panel-heading"):
+        team_id = team_heading.get("id", "").replace("teamTopic", "")
+        club, team = parse_club_team(text_of(team_heading))
+        logging.debug(f"Crawled club: {club} {team}")
+        teams[club].add(team)
+        team_data = squad_panel.find(id=f"teamData{team_id}")
+        if team_data is None:
+            continue
+        for span in team_data.find_all(class_="form-control-static"):
+            player = parse_player(text_of(span))
+            if player is None:
+                continue
+            name, player_id = player
+            logging.debug(f"Crawled player: {name, player_id, club, team}")
+            players.append((player_id, name, club, team))
+    return teams, players
+
+
+def parse_match_date(text: str):
+    """Date of a gameplan row, "Sa 16.09.23 19:30" -> datetime(2023, 9, 16, 19, 30). None without a date."""
+    if "." not in text:
+        return None
+    _, date, time_ = text.split(" ")
+    d, m, y = date.split(".")
+    h, min = time_.split(":")
+    return datetime(int(y) + 2000, int(m), int(d), int(h), int(min))
+
+
+def parse_gameplan(
+    html, association: str, competition: str, from_date: datetime = datetime(2022, 8, 1), report_of=attribute_key
+):
+    """Played team matches of the "Spielplan" tab.
+
+    Args:
+        html (Union[str, BeautifulSoup]): The gameplan area or a page containing it.
+        association (str): Name of the association.
+        competition (str): Name of the competition.
+        from_date (datetime, optional): Matches before this date are skipped. Defaults to datetime(2022, 8, 1).
+        report_of (Callable, optional): Turns the "Spielbericht" button into the report reference.
+            Defaults to the key of the match report.
+
+    Returns:
+        list: (matchday_info, report) per played team match. report is None if the row has no
+            "Spielbericht" button.
+    """
+    soup = soup_of(html)
+    gameplan = soup.find(id="showGameplanAreaData") or soup
+    played = []
+    for matchday in gameplan.find_all("tbody"):
+        for match_row in matchday.find_all("tr"):
+            if match_row.get("id"):
+                continue
+            match_info = match_row.find_all("td")
+            if not match_info:
+                continue
+            match_date = parse_match_date(text_of(match_info[0]))
+            if match_date is None:
+                continue
+            if match_date < from_date:
+                logging.info(f"skip, {match_date} before {from_date}")
+                continue
+
+            matchday_info = {
+                "date": match_date,
+                "home_team": text_of(match_info[1]).strip(),
+                "away_team": text_of(match_info[2]).strip(),
+                "result": text_of(match_info[3]).strip(),
+                "legs": text_of(match_info[4]).strip(),
+                "competition": competition,
+                "association": association,
+            }
+            if matchday_info["result"] == "-:-":
+                continue
+            button = match_info[-1].find(class_="ligameplBtnLigameplgameExist")
+            played.append((matchday_info, report_of(button) if button is not None else None))
+    return played
+
+
+def parse_match_report(html):
+    """Legs of a "Spielbericht".
+
+    Args:
+        html (Union[str, BeautifulSoup]): The match report dialog or a page containing it.
+
+    Returns:
+        list: Dicts with home_player, result, away_player and match_number, in order of play.
+    """
+    soup = soup_of(html)
+    report = soup.find(id="ligameplgame") or soup
+    table = report.find("table")
+    matches = []
+    for i, row in enumerate(table.find_all(class_="resultTable")):
+        match_info = row.find_all("td")
+        matches.append(
+            {
+                "home_player": text_of(match_info[2]),
+                "result": text_of(match_info[3]),
+                "away_player": text_of(match_info[4]),
+                "match_number": match_number(i),
+            }
+        )
+    return matches
@@ -1,275 +1,586 @@
+import io
+import itertools
 import logging
-from datetime import datetime
+from collections import defaultdict, namedtuple
 
+import numpy as np
 import trueskill
-from sqlalchemy import Engine, select, update
+from sqlalchemy import Engine, delete, func, insert, select, update
 from sqlalchemy.orm import Session
 from tqdm import tqdm
 
-from .schema import DoublesMatch, Player, SinglesMatch, SkillRating, TeamMatch
-
-# TODO Document change in new table
-
-
-def get_or_create_player_rating(
-    session: Session, player_id: int, team_id: int, match_date: datetime
-):
-    player_rating_stmt = select(SkillRating).where(
-        (SkillRating.player == player_id) & (SkillRating.team == team_id)
-    )
-    player_rating = session.execute(player_rating_stmt).first()
-
-    if not player_rating:
-        player_rating = SkillRating(
-            player=player_id,
-            team=team_id,
-            rating_mu=trueskill.MU,
-            rating_sigma=trueskill.SIGMA,
-            latest_update=match_date,
-        )
-        session.add(player_rating)
-        session.commit()
-        session.refresh(player_rating)
-    else:
-        (player_rating,) = player_rating
-
-    return player_rating
+from .generation import bump_generation
+from .leaderboard import refresh_leaderboard
+from .rating_kernel import TrueSkillKernel
+from .schema import (
+    DoublesMatch,
+    Leaderboard,
+    Player,
+    RatingCheckpoint,
+    RatingHistory,
+    SinglesMatch,
+    SkillRating,
+    TeamMatch,
+)
+
+# A single or double within a team match. Home and away hold one player id for singles and two for doubles.
+Leg = namedtuple(
+    "Leg", ["team_match", "date", "home", "away", "home_team", "away_team", "result"]
+)
 
 
 def reset_ratings(engine: Engine):
-    """Reset all ratings back to (25, 8.33).
+    """Reset all ratings back to (25, 8.33) and mark all team matches as unrated.
+    Checkpoints are dropped as well, the next call of `compute_ratings` replays everything.
 
     Args:
         engine (Engine): Engine connected to the database.
     """
     with Session(engine) as session:
-        stmt = update(SkillRating).values(rating_mu=25, rating_sigma=8.3333)
+        stmt = update(SkillRating).values(
+            rating_mu=trueskill.MU, rating_sigma=trueskill.SIGMA
+        )
         session.execute(stmt)
+        session.execute(update(TeamMatch).values(used_for_rating=False))
+        session.execute(delete(RatingCheckpoint))
+        session.execute(delete(RatingHistory))
+        refresh_leaderboard(session)
+        bump_generation(session)
         session.commit()
 
 
-def update_singles(session: Session, team_match: TeamMatch, singles: list):
-    for (single,) in singles:
+def pack_ratings(rows: list):
+    """Serialize (player, team, mu, sigma, latest_update) rows into compressed numpy arrays.
 
-        home_player_rating = get_or_create_player_rating(
-            session=session,
-            player_id=single.home_player,
-            team_id=team_match.home_team,
-            match_date=team_match.date,
-        )
+    Args:
+        rows (list): Rating rows. Team and latest_update may be None.
 
-        away_player_rating = get_or_create_player_rating(
-            session=session,
-            player_id=single.away_player,
-            team_id=team_match.away_team,
-            match_date=team_match.date,
-        )
+    Returns:
+        bytes: The compressed snapshot.
+    """
+    players, teams, mus, sigmas, dates = zip(*rows) if rows else ((),) * 5
+    date_values = sorted({d for d in dates if d is not None})
+    date_index = {d: i for i, d in enumerate(date_values)}
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        player=np.array(players, dtype=np.int32),
+        team=np.array([-1 if t is None else t for t in teams], dtype=np.int32),
+        mu=np.array(mus, dtype=np.float64),
+        sigma=np.array(sigmas, dtype=np.float64),
+        date=np.array([-1 if d is None else date_index[d] for d in dates], dtype=np.int32),
+        dates=np.array(date_values, dtype=str),
+    )
+    return buffer.getvalue()
 
-        try:
-            home_wins = single.result[0] > single.result[2]  # home:away
-        except Exception:
-            logging.info(f"Skipping {single} because of invalid result")
-            continue
 
-        home_ts = trueskill.Rating(
-            mu=home_player_rating.rating_mu,
-            sigma=home_player_rating.rating_sigma,
+def unpack_ratings(data: bytes):
+    """Inverse of `pack_ratings`.
+
+    Returns:
+        list: Rating rows (player, team, mu, sigma, latest_update).
+    """
+    arrays = np.load(io.BytesIO(data))
+    dates = arrays["dates"].tolist()
+    return [
+        (
+            int(player),
+            None if team == -1 else int(team),
+            float(mu),
+            float(sigma),
+            None if date == -1 else dates[date],
         )
-        away_ts = trueskill.Rating(
-            mu=away_player_rating.rating_mu,
-            sigma=away_player_rating.rating_sigma,
+        for player, team, mu, sigma, date in zip(
+            arrays["player"], arrays["team"], arrays["mu"], arrays["sigma"], arrays["date"]
         )
+    ]
 
-        if home_wins:
-            home_ts, away_ts = trueskill.rate_1vs1(home_ts, away_ts)
-        else:
-            away_ts, home_ts = trueskill.rate_1vs1(away_ts, home_ts)
 
-        # TODO Document update
+def restore_checkpoint(session: Session, date: str):
+    """Restore the latest checkpoint before a date and mark all later team matches as unrated.
+    Without an earlier checkpoint, all ratings are dropped and every team match gets replayed.
 
-        update_home_stmt = (
-            update(SkillRating)
-            .where(SkillRating.id == home_player_rating.id)
-            .values(
-                rating_mu=home_ts.mu,
-                rating_sigma=home_ts.sigma,
-                latest_update=team_match.date,
-            )
-        )
-        update_away_stmt = (
-            update(SkillRating)
-            .where(SkillRating.id == away_player_rating.id)
-            .values(
-                rating_mu=away_ts.mu,
-                rating_sigma=away_ts.sigma,
-                latest_update=team_match.date,
-            )
+    Args:
+        session (Session): The current db session. Committing is up to the caller.
+        date (str): ISO date of the earliest team match that has to be (re)rated.
+
+    Returns:
+        Union[RatingCheckpoint, None]: The restored checkpoint.
+    """
+    checkpoint_stmt = (
+        select(RatingCheckpoint)
+        .where(RatingCheckpoint.date < date)
+        .order_by(RatingCheckpoint.date.desc())
+        .limit(1)
+    )
+    checkpoint = session.execute(checkpoint_stmt).scalar()
+
+    session.execute(delete(SkillRating))
+    if checkpoint is None:
+        logging.info(f"No checkpoint before {date}, replaying all team matches")
+        session.execute(update(TeamMatch).values(used_for_rating=False))
+        session.execute(delete(RatingCheckpoint))
+        session.execute(delete(RatingHistory))
+        return None
+
+    logging.info(f"Restoring ratings from checkpoint {checkpoint.date}")
+    rows = unpack_ratings(checkpoint.ratings)
+    if rows:
+        session.execute(
+            insert(SkillRating),
+            [
+                {
+                    "player": player,
+                    "team": team,
+                    "rating_mu": mu,
+                    "rating_sigma": sigma,
+                    "latest_update": latest_update,
+                }
+                for player, team, mu, sigma, latest_update in rows
+            ],
         )
-        session.execute(update_home_stmt)
-        session.execute(update_away_stmt)
-        session.commit()
+    session.execute(
+        update(TeamMatch)
+        .where(TeamMatch.date > checkpoint.date)
+        .values(used_for_rating=False)
+    )
+    session.execute(
+        delete(RatingCheckpoint).where(RatingCheckpoint.date > checkpoint.date)
+    )
+    session.execute(delete(RatingHistory).where(RatingHistory.date > checkpoint.date))
+    return checkpoint
 
 
-def update_doubles(session: Session, team_match: TeamMatch, doubles: list):
-    for (double,) in doubles:
+def rollback_ratings(engine: Engine, date: str):
+    """Roll ratings back to the latest checkpoint before a date, e.g. to re-rate a corrected result.
+    The next call of `compute_ratings` replays all team matches after the checkpoint.
 
-        home_player1_rating = get_or_create_player_rating(
-            session=session,
-            player_id=double.home_player1,
-            team_id=team_match.home_team,
-            match_date=team_match.date,
-        )
+    Args:
+        engine (Engine): Engine connected to the database.
+        date (str): ISO date of the earliest team match that has to be re-rated.
+    """
+    with Session(engine) as session, session.begin():
+        restore_checkpoint(session, date)
+        refresh_leaderboard(session)
+        bump_generation(session)
 
-        home1_ts = trueskill.Rating(
-            mu=home_player1_rating.rating_mu,
-            sigma=home_player1_rating.rating_sigma,
-        )
 
-        home_player2_rating = get_or_create_player_rating(
-            session=session,
-            player_id=double.home_player2,
-            team_id=team_match.home_team,
-            match_date=team_match.date,
-        )
+def home_wins(result: str):
+    """Parse the winner from a "home:away" result string.
 
-        home2_ts = trueskill.Rating(
-            mu=home_player2_rating.rating_mu,
-            sigma=home_player2_rating.rating_sigma,
-        )
+    Args:
+        result (str): Result such as "3:1".
 
-        away_player1_rating = get_or_create_player_rating(
-            session=session,
-            player_id=double.away_player1,
-            team_id=team_match.away_team,
-            match_date=team_match.date,
-        )
+    Returns:
+        Union[bool, None]: Whether the home side won, None if the result is invalid.
+    """
+    try:
+        return result[0] > result[2]
+    except Exception:
+        return None
 
-        away1_ts = trueskill.Rating(
-            mu=away_player1_rating.rating_mu,
-            sigma=away_player1_rating.rating_sigma,
-        )
 
-        away_player2_rating = get_or_create_player_rating(
-            session=session,
-            player_id=double.away_player2,
-            team_id=team_match.away_team,
-            match_date=team_match.date,
-        )
+def load_unrated_legs(session: Session):
+    """Load all legs of team matches that have not been used for rating yet.
 
-        away2_ts = trueskill.Rating(
-            mu=away_player2_rating.rating_mu,
-            sigma=away_player2_rating.rating_sigma,
-        )
+    Singles and doubles are fetched with one query each instead of one query per team match.
+    Legs are ordered by team match date, singles before doubles within a team match.
 
-        home_team_ratings = [home1_ts, home2_ts]
-        away_team_ratings = [away1_ts, away2_ts]
+    Args:
+        session (Session): The current db session.
 
-        try:
-            home_wins = double.result[0] > double.result[2]
-        except Exception:
-            logging.info(f"Skipping {double} because of invalid result")
-            continue
-        ranks = [0, 1] if home_wins else [1, 0]
+    Returns:
+        tuple: List of unrated team matches and list of legs.
+    """
+    unrated = TeamMatch.used_for_rating == False  # noqa: E712
+    team_matches = (
+        session.execute(select(TeamMatch).where(unrated).order_by(TeamMatch.date))
+        .scalars()
+        .all()
+    )
 
-        (new_home1_ts, new_home2_ts), (new_away1_ts, new_away2_ts) = trueskill.rate(
-            [home_team_ratings, away_team_ratings], ranks=ranks
-        )
-        update_home1_stmt = (
-            update(SkillRating)
-            .where(SkillRating.id == home_player1_rating.id)
-            .values(
-                rating_mu=new_home1_ts.mu,
-                rating_sigma=new_home1_ts.sigma,
-                latest_update=team_match.date,
-            )
-        )
-        session.execute(update_home1_stmt)
-
-        update_home2_stmt = (
-            update(SkillRating)
-            .where(SkillRating.id == home_player2_rating.id)
-            .values(
-                rating_mu=new_home2_ts.mu,
-                rating_sigma=new_home2_ts.sigma,
-                latest_update=team_match.date,
+    singles = defaultdict(list)
+    singles_stmt = (
+        select(SinglesMatch)
+        .join(TeamMatch, SinglesMatch.team_match == TeamMatch.id)
+        .where(unrated)
+        .order_by(SinglesMatch.id)
+    )
+    for single in session.execute(singles_stmt).scalars():
+        singles[single.team_match].append(single)
+
+    doubles = defaultdict(list)
+    doubles_stmt = (
+        select(DoublesMatch)
+        .join(TeamMatch, DoublesMatch.team_match == TeamMatch.id)
+        .where(unrated)
+        .order_by(DoublesMatch.id)
+    )
+    for double in session.execute(doubles_stmt).scalars():
+        doubles[double.team_match].append(double)
+
+    legs = []
+    for team_match in team_matches:
+        for single in singles[team_match.id]:
+            legs.append(
+                Leg(
+                    team_match.id,
+                    team_match.date,
+                    (single.home_player,),
+                    (single.away_player,),
+                    team_match.home_team,
+                    team_match.away_team,
+                    single.result,
+                )
             )
-        )
-        session.execute(update_home2_stmt)
-
-        update_away1_stmt = (
-            update(SkillRating)
-            .where(SkillRating.id == away_player1_rating.id)
-            .values(
-                rating_mu=new_away1_ts.mu,
-                rating_sigma=new_away1_ts.sigma,
-                latest_update=team_match.date,
+        for double in doubles[team_match.id]:
+            legs.append(
+                Leg(
+                    team_match.id,
+                    team_match.date,
+                    (double.home_player1, double.home_player2),
+                    (double.away_player1, double.away_player2),
+                    team_match.home_team,
+                    team_match.away_team,
+                    double.result,
+                )
             )
-        )
-        session.execute(update_away1_stmt)
-
-        update_away2_stmt = (
-            update(SkillRating)
-            .where(SkillRating.id == away_player2_rating.id)
-            .values(
-                rating_mu=new_away2_ts.mu,
-                rating_sigma=new_away2_ts.sigma,
-                latest_update=team_match.date,
-            )
-        )
-        session.execute(update_away2_stmt)
-        session.commit()
+    return team_matches, legs
+
 
+def leg_keys(leg: Leg):
+    """Rating keys (player, team) of all players in a leg, home players first."""
+    return [(player, leg.home_team) for player in leg.home] + [
+        (player, leg.away_team) for player in leg.away
+    ]
 
-def compute_ratings(engine: Engine):
-    """Compute ratings for a competition by iterating through all its matches.
-    Currently only takes singles into account.
+
+def schedule_waves(legs: list):
+    """Split a date ordered stream of legs into waves of legs with disjoint rating keys.
+
+    Every leg is placed one wave after the latest wave that contains any of its players,
+    so each player's legs keep their chronological order. All legs of a wave are independent
+    and can be rated in one step with the same result as rating them one after another.
 
     Args:
-        engine (Engine): Engine connected to the database.
-        competition (str): Name of the competition.
+        legs (list): Legs in replay order.
+
+    Returns:
+        list: List of waves, each a list of legs.
+    """
+    waves = []
+    last_wave = {}  # (player, team) -> index of the latest wave containing the key
+    for leg in legs:
+        keys = leg_keys(leg)
+        wave = max((last_wave.get(key, -1) for key in keys), default=-1) + 1
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(leg)
+        for key in keys:
+            last_wave[key] = wave
+    return waves
+
+
+class RatingReplay:
+    """In-memory TrueSkill state keyed by (player, team).
+
+    Ratings are read from the database once, updated leg by leg without any queries
+    and written back in bulk.
     """
-    with Session(engine) as session:
-        stmt = (
-            select(TeamMatch)
-            # trunk-ignore(ruff/E712)
-            .where(TeamMatch.used_for_rating == False).order_by(TeamMatch.date)
-        )
-        team_matches = session.execute(stmt).all()
-        for team_match in tqdm(team_matches):
-            (team_match,) = team_match
 
-            singles_stmt = select(SinglesMatch).where(
-                SinglesMatch.team_match == team_match.id
+    def __init__(self):
+        self.ratings = {}  # (player, team) -> trueskill.Rating
+        self.latest_update = {}  # (player, team) -> date
+        self.rating_ids = {}  # (player, team) -> SkillRating.id of existing rows
+        self.touched = set()
+        self.history = {}  # (player, team, team_match) -> (date, mu, sigma) after the team match
+
+    @classmethod
+    def from_session(cls, session: Session):
+        """Load the current SkillRating rows into a new replay.
+
+        Args:
+            session (Session): The current db session.
+        """
+        replay = cls()
+        stmt = select(
+            SkillRating.id,
+            SkillRating.player,
+            SkillRating.team,
+            SkillRating.rating_mu,
+            SkillRating.rating_sigma,
+            SkillRating.latest_update,
+        ).order_by(SkillRating.id)
+        for rating_id, player, team, mu, sigma, latest_update in session.execute(stmt):
+            key = (player, team)
+            if key in replay.rating_ids:
+                # duplicated rows, the first one is the one that gets updated
+                continue
+            replay.rating_ids[key] = rating_id
+            replay.set_rating(key, mu, sigma, latest_update)
+        replay.touched.clear()
+        return replay
+
+    def set_rating(self, key: tuple, mu: float, sigma: float, date: str):
+        self.ratings[key] = trueskill.Rating(mu=mu, sigma=sigma)
+        self.latest_update[key] = date
+        self.touched.add(key)
+
+    def get_rating(self, key: tuple, date: str):
+        """Get the rating for (player, team), creating the default rating on first sight."""
+        if key not in self.ratings:
+            self.set_rating(key, trueskill.MU, trueskill.SIGMA, date)
+        return self.ratings[key]
+
+    def rate_leg(self, leg: Leg):
+        """Update the ratings of all players of a single or double.
+
+        Args:
+            leg (Leg): The leg to rate.
+        """
+        keys = leg_keys(leg)
+        home_keys, away_keys = keys[: len(leg.home)], keys[len(leg.home) :]
+        home_ratings = [self.get_rating(key, leg.date) for key in home_keys]
+        away_ratings = [self.get_rating(key, leg.date) for key in away_keys]
+
+        winner = home_wins(leg.result)
+        if winner is None:
+            logging.info(f"Skipping {leg} because of invalid result")
+            return
+
+        if len(home_ratings) == 1:
+            if winner:
+                home, away = trueskill.rate_1vs1(*home_ratings, *away_ratings)
+            else:
+                away, home = trueskill.rate_1vs1(*away_ratings, *home_ratings)
+            new_home, new_away = [home], [away]
+        else:
+            ranks = [0, 1] if winner else [1, 0]
+            new_home, new_away = trueskill.rate(
+                [home_ratings, away_ratings], ranks=ranks
             )
-            doubles_stmt = select(DoublesMatch).where(
-                DoublesMatch.team_match == team_match.id
+
+        for key, rating in zip(keys, [*new_home, *new_away]):
+            self.set_rating(key, rating.mu, rating.sigma, leg.date)
+            self.history[(*key, leg.team_match)] = (leg.date, rating.mu, rating.sigma)
+
+    def rate_legs(self, legs: list):
+        """Rate legs one after another.
+
+        Args:
+            legs (list): Legs in replay order.
+        """
+        for leg in legs:
+            self.rate_leg(leg)
+
+    def rows(self, keys=None):
+        """Yield (key, mu, sigma, latest_update) for the given or all keys."""
+        if keys is None:
+            keys = self.ratings.keys()
+        for key in keys:
+            rating = self.ratings[key]
+            yield key, rating.mu, rating.sigma, self.latest_update[key]
+
+    def write(self, session: Session):
+        """Write all touched ratings with one bulk UPDATE and one bulk INSERT.
+
+        Args:
+            session (Session): The current db session. Committing is up to the caller.
+        """
+        updates, inserts = [], []
+        for (player, team), mu, sigma, latest_update in self.rows(self.touched):
+            values = {
+                "rating_mu": mu,
+                "rating_sigma": sigma,
+                "latest_update": latest_update,
+            }
+            if (player, team) in self.rating_ids:
+                updates.append({"id": self.rating_ids[(player, team)], **values})
+            else:
+                inserts.append({"player": player, "team": team, **values})
+        if updates:
+            session.execute(update(SkillRating), updates)
+        if inserts:
+            session.execute(insert(SkillRating), inserts)
+        logging.info(f"Updated {len(updates)} and inserted {len(inserts)} ratings")
+
+        if self.history:
+            session.execute(
+                insert(RatingHistory),
+                [
+                    {
+                        "player": player,
+                        "team": team,
+                        "team_match": team_match,
+                        "date": date,
+                        "rating_mu": mu,
+                        "rating_sigma": sigma,
+                    }
+                    for (player, team, team_match), (date, mu, sigma) in self.history.items()
+                ],
             )
-            singles = session.execute(singles_stmt).all()
-            doubles = session.execute(doubles_stmt).all()
 
-            update_singles(session, team_match, singles)
-            update_doubles(session, team_match, doubles)
 
-            update_stmt = (
-                update(TeamMatch)
-                .where(TeamMatch.id == team_match.id)
-                .values(used_for_rating=True)
+class KernelRatingReplay(RatingReplay):
+    """RatingReplay backed by the numpy TrueSkillKernel instead of trueskill.Rating objects."""
+
+    def __init__(self):
+        super().__init__()
+        self.kernel = TrueSkillKernel()
+
+    def set_rating(self, key: tuple, mu: float, sigma: float, date: str):
+        slot = self.kernel.slot(key)
+        self.kernel.mu[slot] = mu
+        self.kernel.sigma[slot] = sigma
+        self.latest_update[key] = date
+        self.touched.add(key)
+
+    def get_rating(self, key: tuple, date: str):
+        """Get the kernel slot for (player, team), creating the default rating on first sight."""
+        if key not in self.kernel.slots:
+            self.set_rating(key, trueskill.MU, trueskill.SIGMA, date)
+        return self.kernel.slots[key]
+
+    def rate_leg(self, leg: Leg):
+        self.rate_legs([leg])
+
+    def rate_legs(self, legs: list):
+        """Rate legs wave by wave, each wave with one kernel call per team size.
+
+        Args:
+            legs (list): Legs in replay order.
+        """
+        # create missing ratings in leg order, even for legs with invalid results
+        valid_legs = []
+        for leg in legs:
+            for key in leg_keys(leg):
+                self.get_rating(key, leg.date)
+            if home_wins(leg.result) is None:
+                logging.info(f"Skipping {leg} because of invalid result")
+                continue
+            valid_legs.append(leg)
+
+        for wave in schedule_waves(valid_legs):
+            batches = defaultdict(lambda: ([], []))  # team size -> winners, losers
+            for leg in wave:
+                keys = [self.kernel.slots[key] for key in leg_keys(leg)]
+                home, away = keys[: len(leg.home)], keys[len(leg.home) :]
+                winners, losers = batches[len(home)]
+                if home_wins(leg.result):
+                    winners.append(home)
+                    losers.append(away)
+                else:
+                    winners.append(away)
+                    losers.append(home)
+                for key in leg_keys(leg):
+                    self.latest_update[key] = leg.date
+                    self.touched.add(key)
+            for winners, losers in batches.values():
+                self.kernel.rate(np.array(winners), np.array(losers))
+            for leg in wave:
+                for key in leg_keys(leg):
+                    slot = self.kernel.slots[key]
+                    self.history[(*key, leg.team_match)] = (
+                        leg.date,
+                        float(self.kernel.mu[slot]),
+                        float(self.kernel.sigma[slot]),
+                    )
+
+    def rows(self, keys=None):
+        if keys is None:
+            keys = self.kernel.keys
+        for key in keys:
+            slot = self.kernel.slots[key]
+            yield key, float(self.kernel.mu[slot]), float(
+                self.kernel.sigma[slot]
+            ), self.latest_update[key]
+
+
+REPLAY_BACKENDS = {"trueskill": RatingReplay, "numpy": KernelRatingReplay}
+
+
+def compute_ratings(
+    engine: Engine, backend: str = "trueskill", checkpoint_every: int = 1
+):
+    """Compute ratings for all team matches that have not been used for rating yet.
+
+    Matches are replayed in memory in order of their date and the results are written back
+    in a single transaction, together with one history row per player and team match.
+    If an unrated team match is older than the latest rated one, the ratings are first rolled
+    back to the nearest checkpoint before it.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+        backend (str, optional): "trueskill" to rate with the trueskill package or "numpy" for the
+            array based TrueSkillKernel. Defaults to "trueskill".
+        checkpoint_every (int, optional): Store a snapshot of all ratings after every n-th match day.
+            0 disables checkpoints. Defaults to 1.
+    """
+    if backend not in REPLAY_BACKENDS:
+        raise ValueError(f"Unknown rating backend {backend=}")
+    with Session(engine) as session, session.begin():
+        first_unrated = session.execute(
+            select(func.min(TeamMatch.date)).where(TeamMatch.used_for_rating == False)  # noqa: E712
+        ).scalar()
+        last_rated = session.execute(
+            select(func.max(TeamMatch.date)).where(TeamMatch.used_for_rating == True)  # noqa: E712
+        ).scalar()
+        if first_unrated is not None and last_rated is not None and first_unrated <= last_rated:
+            logging.info(f"Found back-dated team match {first_unrated}, rolling back")
+            restore_checkpoint(session, first_unrated)
+            rolled_back = True
+        else:
+            rolled_back = False
+
+        team_matches, legs = load_unrated_legs(session)
+        replay = REPLAY_BACKENDS[backend].from_session(session)
+        match_days = itertools.groupby(legs, key=lambda leg: leg.date[:10])
+        for i, (_, day_legs) in enumerate(tqdm(match_days)):
+            day_legs = list(day_legs)
+            replay.rate_legs(day_legs)
+            if checkpoint_every and (i + 1) % checkpoint_every == 0:
+                session.add(
+                    RatingCheckpoint(
+                        date=day_legs[-1].date,
+                        ratings=pack_ratings(
+                            [(*key, *row) for key, *row in replay.rows()]
+                        ),
+                    )
+                )
+        replay.write(session)
+
+        if team_matches:
+            session.execute(
+                update(TeamMatch),
+                [{"id": team_match.id, "used_for_rating": True} for team_match in team_matches],
             )
-            session.execute(update_stmt)
+        latest_date = team_matches[-1].date if team_matches else None
 
         exists_subq = (
             select(SkillRating).where(SkillRating.player == Player.id).exists()
         )
-        players_wo_rating_stmt = select(Player).where(~exists_subq)
-        players_wo_rating = session.execute(players_wo_rating_stmt)
-
-        for (player,) in tqdm(players_wo_rating):
-            player_rating = SkillRating(
-                player=player.id,
-                team=player.team,
-                rating_mu=trueskill.MU,
-                rating_sigma=trueskill.SIGMA,
-                latest_update=team_match.date,
+        players_wo_rating_stmt = select(Player.id, Player.team).where(~exists_subq)
+        players_wo_rating = session.execute(players_wo_rating_stmt).all()
+        if players_wo_rating:
+            session.execute(
+                insert(SkillRating),
+                [
+                    {
+                        "player": player_id,
+                        "team": team_id,
+                        "rating_mu": trueskill.MU,
+                        "rating_sigma": trueskill.SIGMA,
+                        "latest_update": latest_date,
+                    }
+                    for player_id, team_id in players_wo_rating
+                ],
             )
-            session.add(player_rating)
-            session.commit()
+
+        # a rollback replaces all ratings, otherwise only the touched ones changed
+        leaderboard_empty = session.execute(select(Leaderboard.id).limit(1)).first() is None
+        if rolled_back or leaderboard_empty:
+            refresh_leaderboard(session)
+        else:
+            refresh_leaderboard(session, replay.touched | {tuple(key) for key in players_wo_rating})
+        if rolled_back or leaderboard_empty or team_matches or players_wo_rating:
+            bump_generation(session)
@@ -0,0 +1,230 @@
+import math
+
+import numpy as np
+import trueskill
+
+# Coefficients of the erfc approximation used by trueskill's default backend
+_ERFC_COEFFS = (
+    0.17087277,
+    -0.82215223,
+    1.48851587,
+    -1.13520398,
+    0.27886807,
+    -0.18628806,
+    0.09678418,
+    0.37409196,
+    1.00002368,
+)
+
+
+def erfc(x: np.ndarray):
+    """Vectorized version of `trueskill.backends.erfc`."""
+    x = np.asarray(x, dtype=np.float64)
+    z = np.abs(x.reshape(-1))
+    t = 1.0 / (1.0 + z / 2.0)
+    # in place, the same operations as the scalar version without temporaries for large matrices
+    poly = np.full_like(t, _ERFC_COEFFS[0])
+    for coeff in _ERFC_COEFFS[1:]:
+        poly *= t
+        poly += coeff
+    poly *= t
+    r = np.square(z, out=z)
+    np.negative(r, out=r)
+    r -= 1.26551223
+    r += poly
+    np.exp(r, out=r)
+    r *= t
+    np.subtract(2.0, r, out=r, where=x.reshape(-1) < 0)
+    return r.reshape(x.shape)
+
+
+def cdf(x: np.ndarray):
+    """Standard normal cdf, identical to trueskill's default backend."""
+    return 0.5 * erfc(-np.asarray(x) / math.sqrt(2))
+
+
+def pdf(x: np.ndarray):
+    """Standard normal pdf, identical to trueskill's default backend."""
+    return 1 / math.sqrt(2 * math.pi) * np.exp(-(np.asarray(x) ** 2) / 2)
+
+
+def choose_backend(backend):
+    """Return vectorized (cdf, pdf) for a trueskill backend name.
+
+    Args:
+        backend (Union[str, None]): None for trueskill's own approximation or "scipy".
+    """
+    if backend is None:
+        return cdf, pdf
+    if backend == "scipy":
+        from scipy.stats import norm
+
+        return norm.cdf, norm.pdf
+    raise ValueError(f"Backend {backend!r} is not supported by the numpy kernel")
+
+
+def _pairings(team1: np.ndarray, team2: np.ndarray, env: trueskill.TrueSkill):
+    """Mean difference and total variance of every pairing of the rows of team1 and team2."""
+    team1 = np.asarray(team1, dtype=np.float64)
+    team2 = np.asarray(team2, dtype=np.float64)
+    # singles are teams of one
+    if team1.ndim == 2:
+        team1 = team1[:, None, :]
+    if team2.ndim == 2:
+        team2 = team2[:, None, :]
+    if team1.shape[-1] != 2 or team2.shape[-1] != 2:
+        raise ValueError("Ratings must be given as (mu, sigma) along the last axis")
+    size = team1.shape[1] + team2.shape[1]
+    mu1, var1 = team1[..., 0].sum(axis=1), (team1[..., 1] ** 2).sum(axis=1)
+    mu2, var2 = team2[..., 0].sum(axis=1), (team2[..., 1] ** 2).sum(axis=1)
+    delta_mu = mu1[:, None] - mu2[None, :]
+    variance = size * env.beta**2 + var1[:, None] + var2[None, :]
+    return delta_mu, variance, size
+
+
+def win_probability_matrix(team1: np.ndarray, team2: np.ndarray, env: trueskill.TrueSkill = None):
+    """Probability that each team of team1 beats each team of team2, like `report_utils.win_probability`.
+
+    Args:
+        team1 (np.ndarray): (mu, sigma) of N players, shape (N, 2), or of N teams, shape (N, team_size, 2).
+        team2 (np.ndarray): (mu, sigma) of M players or teams, team sizes may differ from team1.
+        env (trueskill.TrueSkill, optional): Environment for beta and the cdf. Defaults to the global environment.
+
+    Returns:
+        np.ndarray: Win probabilities, shape (N, M).
+    """
+    env = trueskill.global_env() if env is None else env
+    cdf, _ = choose_backend(env.backend)
+    delta_mu, variance, _ = _pairings(team1, team2, env)
+    return cdf(delta_mu / np.sqrt(variance))
+
+
+def match_quality_matrix(team1: np.ndarray, team2: np.ndarray, env: trueskill.TrueSkill = None):
+    """Draw probability based match quality of each pairing, like `trueskill.quality` for two teams.
+
+    Args:
+        team1 (np.ndarray): (mu, sigma) of N players, shape (N, 2), or of N teams, shape (N, team_size, 2).
+        team2 (np.ndarray): (mu, sigma) of M players or teams, team sizes may differ from team1.
+        env (trueskill.TrueSkill, optional): Environment for beta. Defaults to the global environment.
+
+    Returns:
+        np.ndarray: Match qualities between 0 and 1, shape (N, M).
+    """
+    env = trueskill.global_env() if env is None else env
+    delta_mu, variance, size = _pairings(team1, team2, env)
+    return np.sqrt(size * env.beta**2 / variance) * np.exp(-(delta_mu**2) / (2 * variance))
+
+
+class TrueSkillKernel:
+    """TrueSkill updates for batches of independent two-team matches.
+
+    Ratings live in contiguous float64 arrays indexed by a dense slot per key.
+    Results match `trueskill.rate` for two teams without draws.
+    """
+
+    def __init__(self, env: trueskill.TrueSkill = None, capacity: int = 1024):
+        if env is None:
+            env = trueskill.global_env()
+        if callable(env.draw_probability):
+            raise ValueError("Dynamic draw probabilities are not supported")
+        self.env = env
+        self.cdf, self.pdf = choose_backend(env.backend)
+        self.mu = np.empty(capacity, dtype=np.float64)
+        self.sigma = np.empty(capacity, dtype=np.float64)
+        self.slots = {}  # key -> slot
+        self.keys = []  # slot -> key
+        self._draw_margins = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def slot(self, key, mu: float = None, sigma: float = None):
+        """Get the slot of a key, adding it with the given or default rating if it is new."""
+        if key in self.slots:
+            return self.slots[key]
+        slot = len(self.keys)
+        if slot == len(self.mu):
+            self.mu = np.resize(self.mu, 2 * slot)
+            self.sigma = np.resize(self.sigma, 2 * slot)
+        self.mu[slot] = self.env.mu if mu is None else mu
+        self.sigma[slot] = self.env.sigma if sigma is None else sigma
+        self.slots[key] = slot
+        self.keys.append(key)
+        return slot
+
+    def draw_margin(self, size: int):
+        if size not in self._draw_margins:
+            self._draw_margins[size] = trueskill.calc_draw_margin(
+                self.env.draw_probability, size, self.env
+            )
+        return self._draw_margins[size]
+
+    def v_win(self, diff: np.ndarray, draw_margin: np.ndarray):
+        x = diff - draw_margin
+        denom = self.cdf(x)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(denom != 0, self.pdf(x) / denom, -x)
+
+    def w_win(self, diff: np.ndarray, draw_margin: np.ndarray):
+        x = diff - draw_margin
+        v = self.v_win(diff, draw_margin)
+        w = v * (v + x)
+        if not np.all((0 < w) & (w < 1)):
+            raise FloatingPointError(
+                'Cannot calculate correctly, set backend to "mpmath"'
+            )
+        return w
+
+    def win_probability(self, team1: np.ndarray, team2: np.ndarray):
+        """Probability that team1 beats team2, like `report_utils.win_probability` with the kernel's beta.
+
+        Args:
+            team1 (np.ndarray): Slots of the first teams, shape (n_matches, team_size).
+            team2 (np.ndarray): Slots of the second teams, shape (n_matches, team_size).
+
+        Returns:
+            np.ndarray: Win probability per match.
+        """
+        team1 = np.atleast_2d(team1)
+        team2 = np.atleast_2d(team2)
+        size = team1.shape[1] + team2.shape[1]
+        delta_mu = self.mu[team1].sum(axis=1) - self.mu[team2].sum(axis=1)
+        sum_sigma = (self.sigma[team1] ** 2).sum(axis=1) + (self.sigma[team2] ** 2).sum(axis=1)
+        return self.cdf(delta_mu / np.sqrt(size * self.env.beta**2 + sum_sigma))
+
+    def rate(self, winners: np.ndarray, losers: np.ndarray):
+        """Rate a batch of matches in place. No slot may appear in more than one match.
+
+        Args:
+            winners (np.ndarray): Slots of the winning teams, shape (n_matches, team_size).
+            losers (np.ndarray): Slots of the losing teams, shape (n_matches, team_size).
+        """
+        winners = np.atleast_2d(winners)
+        losers = np.atleast_2d(losers)
+        if winners.size == 0:
+            return
+        tau, beta = self.env.tau, self.env.beta
+        size = winners.shape[1] + losers.shape[1]
+
+        # dynamics: every rating gets a bit more uncertain before the match
+        win_var = self.sigma[winners] ** 2 + tau**2
+        lose_var = self.sigma[losers] ** 2 + tau**2
+
+        c2 = win_var.sum(axis=1) + lose_var.sum(axis=1) + size * beta**2
+        c = np.sqrt(c2)
+        diff = (self.mu[winners].sum(axis=1) - self.mu[losers].sum(axis=1)) / c
+        draw_margin = self.draw_margin(size) / c
+        v = self.v_win(diff, draw_margin)
+        w = self.w_win(diff, draw_margin)
+
+        mean_step = (v / c)[:, None]
+        var_step = (w / c2)[:, None]
+        self.mu[winners] += win_var * mean_step
+        self.mu[losers] -= lose_var * mean_step
+        self.sigma[winners] = np.sqrt(win_var * (1 - win_var * var_step))
+        self.sigma[losers] = np.sqrt(lose_var * (1 - lose_var * var_step))
+
+    def ratings(self):
+        """Yield (key, mu, sigma) for every slot."""
+        for slot, key in enumerate(self.keys):
+            yield key, float(self.mu[slot]), float(self.sigma[slot])
@@ -12,6 +12,8 @@ from sqlalchemy import select, insert, update, create_engine, Date, and_
 from sqlalchemy.orm import Session, aliased
 import schema
 from common_queries import get_positions_for_player
+from rating_kernel import win_probability_matrix
+from lineup import best_lineup
 
 def win_probability(team1, team2):
     delta_mu = sum(r.mu for r in team1) - sum(r.mu for r in team2)
@@ -123,15 +125,9 @@ def plot_paired_skill_distributions(home_players, away_players):
     return fig
 
 def plot_match_qualities(players_a, players_b):
-    qualities = np.zeros((len(players_a), len(players_b)))
-    a_indices = list(range(len(players_a)))
-    b_indices = list(range(len(players_b)))
-
-    for i_pa, i_pb in itertools.product(a_indices, b_indices):
-        player_a = players_a[i_pa]
-        player_b = players_b[i_pb]
-        pa_win = win_probability([player_a.rating], [player_b.rating])
-        qualities[i_pa, i_pb] = pa_win
+    ratings_a = np.array([(p.rating.mu, p.rating.sigma) for p in players_a]).reshape(-1, 2)
+    ratings_b = np.array([(p.rating.mu, p.rating.sigma) for p in players_b]).reshape(-1, 2)
+    qualities = win_probability_matrix(ratings_a, ratings_b)
     f = plt.figure(figsize=(14,10))
 
     cmap = sns.color_palette("coolwarm", as_cmap=True)
@@ -155,8 +151,8 @@ def plot_positions():
     # get usual match positions into player tuple first, then, plot histogram here
     pass
 
-def best_fixture(players):
+def best_fixture(home_players, away_players, away_positions=None):
     # get combination with highest combined winning percentage
-    pass
+    return best_lineup(home_players, away_players, away_positions=away_positions)
 
 
@@ -1,4 +1,13 @@
-from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+)
 from sqlalchemy.orm import DeclarativeBase
 
 
@@ -9,6 +18,10 @@ class Base(DeclarativeBase):
 class Human(Base):
 
     __tablename__ = "Human"
+    __table_args__ = (
+        # covers name -> id lookups when joining players by name
+        Index("ix_Human_name_id", "name", "id"),
+    )
 
     id = Column(String, unique=True, primary_key=True)
     name = Column(String)
@@ -38,6 +51,15 @@ class Player(Base):
 class Competition(Base):
 
     __tablename__ = "Competition"
+    __table_args__ = (
+        Index(
+            "ix_Competition_name_association_year",
+            "name",
+            "association",
+            "year",
+            unique=True,
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String)
@@ -62,6 +84,17 @@ class Club(Base):
 class Team(Base):
 
     __tablename__ = "Team"
+    __table_args__ = (
+        # team matches are resolved by (club, rank, year) without the competition
+        Index(
+            "ix_Team_club_rank_year_competition",
+            "club",
+            "rank",
+            "year",
+            "competition",
+            unique=True,
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     rank = Column(String)
@@ -76,10 +109,21 @@ class Team(Base):
 class TeamMatch(Base):
 
     __tablename__ = "Teammatch"
+    __table_args__ = (
+        Index(
+            "ix_Teammatch_date_home_team_away_team_competition",
+            "date",
+            "home_team",
+            "away_team",
+            "competition",
+            unique=True,
+        ),
+        Index("ix_Teammatch_used_for_rating_date", "used_for_rating", "date"),
+    )
 
     id = Column(Integer, primary_key=True)
     date = Column(String)
-    competition = Column(Integer, ForeignKey("Competition.id"))
+    competition = Column(Integer, ForeignKey("Competition.id"), index=True)
     result = Column(String)
     home_team = Column(Integer, ForeignKey("Team.id"))
     away_team = Column(Integer, ForeignKey("Team.id"))
@@ -92,6 +136,10 @@ class TeamMatch(Base):
 class SinglesMatch(Base):
 
     __tablename__ = "Singlesmatch"
+    __table_args__ = (
+        # legs are identified by their position in the match report
+        Index("ix_Singlesmatch_team_match_position", "team_match", "position", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     team_match = Column(Integer, ForeignKey("Teammatch.id"), nullable=True)
@@ -99,6 +147,7 @@ class SinglesMatch(Base):
     away_player = Column(Integer, ForeignKey("Player.id"))
     result = Column(String)  # this could be expanded to home legs, away legs, sets ...
     match_number = Column(Integer)
+    position = Column(Integer, nullable=True)  # 1-based index of the leg within the team match
 
     def __repr__(self) -> str:
         return f"SinglesMatch {self.id=} {self.team_match=} {self.home_player=} {self.away_player=} {self.result=}"
@@ -107,6 +156,10 @@ class SinglesMatch(Base):
 class DoublesMatch(Base):
 
     __tablename__ = "Doublesmatch"
+    __table_args__ = (
+        # legs are identified by their position in the match report
+        Index("ix_Doublesmatch_team_match_position", "team_match", "position", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     team_match = Column(Integer, ForeignKey("Teammatch.id"), nullable=True)
@@ -116,11 +169,15 @@ class DoublesMatch(Base):
     away_player2 = Column(Integer, ForeignKey("Player.id"))
     result = Column(String)  # this could be expanded to home legs, away legs, sets ...
     match_number = Column(Integer)
+    position = Column(Integer, nullable=True)  # 1-based index of the leg within the team match
 
 
 class SkillRating(Base):
 
     __tablename__ = "Skillrating"
+    __table_args__ = (
+        Index("ix_Skillrating_player_team", "player", "team", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     player = Column(Integer, ForeignKey("Player.id"))
@@ -131,3 +188,98 @@ class SkillRating(Base):
 
     def __repr__(self) -> str:
         return f"SkillRating {self.id=} {self.player=} {self.team=} {self.rating_mu=} {self.rating_sigma=}"
+
+
+class Leaderboard(Base):
+
+    __tablename__ = "Leaderboard"
+    __table_args__ = (
+        Index("ix_Leaderboard_player_team", "player", "team", unique=True),
+        # paged top-N per competition, conservative and by mu
+        Index("ix_Leaderboard_competition_rank", "competition", "rank"),
+        Index("ix_Leaderboard_competition_rating_mu", "competition", "rating_mu"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    player = Column(Integer, ForeignKey("Player.id"))
+    team = Column(Integer, ForeignKey("Team.id"))
+    competition = Column(Integer, ForeignKey("Competition.id"))
+    club = Column(Integer, ForeignKey("Club.id"))
+    name = Column(String)
+    club_name = Column(String)
+    rating_mu = Column(Float)
+    rating_sigma = Column(Float)
+    conservative_rating = Column(Float)  # mu - 3 sigma
+    rank = Column(Integer)  # by conservative rating within the competition, ties share a rank
+    latest_update = Column(String)
+
+    def __repr__(self) -> str:
+        return f"Leaderboard {self.competition=} {self.rank=} {self.name=} {self.conservative_rating=}"
+
+
+class RatingCheckpoint(Base):
+
+    __tablename__ = "Ratingcheckpoint"
+
+    id = Column(Integer, primary_key=True)
+    date = Column(String, index=True)  # date of the latest team match covered by the snapshot
+    ratings = Column(LargeBinary)  # compressed snapshot of all SkillRating rows
+
+    def __repr__(self) -> str:
+        return f"RatingCheckpoint {self.id=} {self.date=}"
+
+
+class RatingHistory(Base):
+
+    __tablename__ = "Ratinghistory"
+    __table_args__ = (
+        # trajectories and "rating as of" lookups per player
+        Index("ix_Ratinghistory_player_team_date", "player", "team", "date"),
+        Index("ix_Ratinghistory_date", "date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    player = Column(Integer, ForeignKey("Player.id"))
+    team = Column(Integer, ForeignKey("Team.id"))
+    team_match = Column(Integer, ForeignKey("Teammatch.id"))
+    date = Column(String)
+    rating_mu = Column(Float)
+    rating_sigma = Column(Float)
+
+    def __repr__(self) -> str:
+        return f"RatingHistory {self.player=} {self.team=} {self.date=} {self.rating_mu=} {self.rating_sigma=}"
+
+
+class DataGeneration(Base):
+
+    __tablename__ = "Datageneration"
+
+    id = Column(Integer, primary_key=True)  # a single row
+    generation = Column(Integer)  # bumped by every insert and rating run, invalidates cached queries
+
+    def __repr__(self) -> str:
+        return f"DataGeneration {self.generation=}"
+
+
+class CrawledMatch(Base):
+
+    __tablename__ = "Crawledmatch"
+    __table_args__ = (
+        Index(
+            "ix_Crawledmatch_match", "association", "competition", "date", "home_team", "away_team", unique=True
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    association = Column(String)
+    competition = Column(String)
+    date = Column(String)
+    home_team = Column(String)
+    away_team = Column(String)
+    result = Column(String)  # result of the gameplan row when the report was crawled
+    legs = Column(String)
+    report_hash = Column(String)  # sha256 of the parsed match report
+    crawled_date = Column(String)
+
+    def __repr__(self) -> str:
+        return f"CrawledMatch {self.date=} {self.home_team=} {self.away_team=} {self.result=}"
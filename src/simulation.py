@@ -0,0 +1,251 @@
+from collections import namedtuple
+
+import numpy as np
+import trueskill
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+
+import schema
+from lineup import N_POSITIONS, SECOND_ROUND
+
+# The twelve legs of a team match in the order of the match report (see Crawler2K._get_results_from_overlay):
+# four singles, two doubles, four singles against rotated opponents, two doubles with swapped opponents.
+# Entries are lineup positions of the home and away players.
+LEGS = [
+    *[((i,), (i,)) for i in range(N_POSITIONS)],
+    ((0, 1), (0, 1)),
+    ((2, 3), (2, 3)),
+    *[((home,), (away,)) for home, away in SECOND_ROUND],
+    ((0, 1), (2, 3)),
+    ((2, 3), (0, 1)),
+]
+N_LEGS = len(LEGS)
+# points for a win and a draw of a team match
+WIN_POINTS, DRAW_POINTS = 2, 1
+
+SeasonSimulation = namedtuple(
+    "SeasonSimulation", ["teams", "position_probabilities", "expected_points", "n_simulations"]
+)
+
+
+def _leg_matrices():
+    """Matrices that sum lineup skills into the home and away side of every leg, shape (N_POSITIONS, N_LEGS)."""
+    home = np.zeros((N_POSITIONS, N_LEGS))
+    away = np.zeros((N_POSITIONS, N_LEGS))
+    for leg, (home_positions, away_positions) in enumerate(LEGS):
+        home[list(home_positions), leg] = 1
+        away[list(away_positions), leg] = 1
+    return home, away
+
+
+LEG_HOME, LEG_AWAY = _leg_matrices()
+# performance noise of a leg grows with the number of players
+LEG_SIZES = LEG_HOME.sum(axis=0) + LEG_AWAY.sum(axis=0)
+
+
+def sample_skills(lineups: np.ndarray, n: int, rng: np.random.Generator):
+    """Draw a skill for every player of every lineup, shape (n, *lineups.shape[:-1]).
+
+    Args:
+        lineups (np.ndarray): (mu, sigma) per lineup position, shape (..., N_POSITIONS, 2).
+        n (int): Number of simulations.
+        rng (np.random.Generator): Random generator.
+    """
+    lineups = np.asarray(lineups, dtype=np.float64)
+    return lineups[..., 0] + lineups[..., 1] * rng.standard_normal((n, *lineups.shape[:-1]))
+
+
+def sample_legs_won(home_skills: np.ndarray, away_skills: np.ndarray, rng: np.random.Generator, beta: float):
+    """Number of legs the home side wins, given sampled skills of both lineups.
+
+    Args:
+        home_skills (np.ndarray): Skills of the home lineups, shape (..., N_POSITIONS).
+        away_skills (np.ndarray): Skills of the away lineups, same shape.
+        rng (np.random.Generator): Random generator.
+        beta (float): Performance noise per player.
+
+    Returns:
+        np.ndarray: Legs won by the home side, shape (...).
+    """
+    # single precision halves the memory traffic, the noise dominates the run time
+    skill_difference = (home_skills @ LEG_HOME - away_skills @ LEG_AWAY).astype(np.float32)
+    noise = rng.standard_normal(skill_difference.shape, dtype=np.float32)
+    noise *= (beta * np.sqrt(LEG_SIZES)).astype(np.float32)
+    noise += skill_difference
+    return np.count_nonzero(noise > 0, axis=-1)
+
+
+def simulate_team_match(
+    home_lineup: np.ndarray,
+    away_lineup: np.ndarray,
+    n: int = 100_000,
+    seed: int = None,
+    env: trueskill.TrueSkill = None,
+):
+    """Simulate a team match between two lineups.
+
+    Args:
+        home_lineup (np.ndarray): (mu, sigma) of the home players at positions 1 to 4, shape (4, 2).
+        away_lineup (np.ndarray): (mu, sigma) of the away players, shape (4, 2).
+        n (int, optional): Number of simulations. Defaults to 100_000.
+        seed (int, optional): Seed of the random generator. Defaults to None.
+        env (trueskill.TrueSkill, optional): Environment for beta. Defaults to the global environment.
+
+    Returns:
+        tuple: Probabilities of a home win, a draw and an away win, and the legs won by home per simulation.
+    """
+    env = trueskill.global_env() if env is None else env
+    rng = np.random.default_rng(seed)
+    home_skills = sample_skills(home_lineup, n, rng)
+    away_skills = sample_skills(away_lineup, n, rng)
+    legs_won = sample_legs_won(home_skills, away_skills, rng, env.beta)
+    win = np.mean(legs_won > N_LEGS / 2)
+    draw = np.mean(legs_won == N_LEGS / 2)
+    return (float(win), float(draw), float(1 - win - draw)), legs_won
+
+
+def simulate_season(
+    lineups: np.ndarray,
+    fixtures: np.ndarray,
+    points: np.ndarray = None,
+    leg_difference: np.ndarray = None,
+    n: int = 100_000,
+    seed: int = None,
+    env: trueskill.TrueSkill = None,
+    chunk_size: int = 10_000,
+):
+    """Simulate the remaining fixtures of a competition and count the final positions of every team.
+
+    Skills are drawn once per simulated season, so an underrated team stays strong in all its matches.
+    Teams are ranked by points, then by leg difference and ties are broken at random.
+
+    Args:
+        lineups (np.ndarray): (mu, sigma) of the lineup of every team, shape (n_teams, 4, 2).
+        fixtures (np.ndarray): Home and away team index of the remaining team matches, shape (n_fixtures, 2).
+        points (np.ndarray, optional): Current points per team. Defaults to zeros.
+        leg_difference (np.ndarray, optional): Current legs won minus legs lost per team. Defaults to zeros.
+        n (int, optional): Number of simulated seasons. Defaults to 100_000.
+        seed (int, optional): Seed of the random generator. Defaults to None.
+        env (trueskill.TrueSkill, optional): Environment for beta. Defaults to the global environment.
+        chunk_size (int, optional): Seasons simulated at once, bounds the memory. Defaults to 10_000.
+
+    Returns:
+        tuple: Probability of every final position per team, shape (n_teams, n_teams), and expected points.
+    """
+    env = trueskill.global_env() if env is None else env
+    rng = np.random.default_rng(seed)
+    lineups = np.asarray(lineups, dtype=np.float64)
+    fixtures = np.asarray(fixtures, dtype=np.int64).reshape(-1, 2)
+    n_teams = len(lineups)
+    points = np.zeros(n_teams) if points is None else np.asarray(points, dtype=np.float64)
+    leg_difference = np.zeros(n_teams) if leg_difference is None else np.asarray(leg_difference, dtype=np.float64)
+
+    # incidence of teams in fixtures, turns per fixture results into per team sums
+    home_incidence = np.zeros((len(fixtures), n_teams))
+    away_incidence = np.zeros((len(fixtures), n_teams))
+    home_incidence[np.arange(len(fixtures)), fixtures[:, 0]] = 1
+    away_incidence[np.arange(len(fixtures)), fixtures[:, 1]] = 1
+
+    position_counts = np.zeros((n_teams, n_teams), dtype=np.int64)
+    total_points = np.zeros(n_teams)
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        skills = sample_skills(lineups, size, rng)
+        home_legs = sample_legs_won(skills[:, fixtures[:, 0]], skills[:, fixtures[:, 1]], rng, env.beta)
+        home_points = np.where(home_legs > N_LEGS / 2, WIN_POINTS, np.where(home_legs == N_LEGS / 2, DRAW_POINTS, 0))
+        away_points = np.where(home_legs < N_LEGS / 2, WIN_POINTS, np.where(home_legs == N_LEGS / 2, DRAW_POINTS, 0))
+        season_points = points + home_points @ home_incidence + away_points @ away_incidence
+        home_difference = 2 * home_legs - N_LEGS
+        season_difference = leg_difference + home_difference @ home_incidence - home_difference @ away_incidence
+
+        # lexicographic order of points, leg difference and a random tie break
+        order = np.lexsort((rng.random((size, n_teams)), -season_difference, -season_points), axis=-1)
+        positions = np.empty_like(order)
+        np.put_along_axis(positions, order, np.arange(n_teams)[None, :], axis=-1)
+        for team in range(n_teams):
+            position_counts[team] += np.bincount(positions[:, team], minlength=n_teams)
+        total_points += season_points.sum(axis=0)
+    return position_counts / n, total_points / n
+
+
+def _team_lineups(session: Session, team_ids: list, env: trueskill.TrueSkill):
+    """Lineup of the four best rated players per team, missing players get the default rating."""
+    lineups = np.empty((len(team_ids), N_POSITIONS, 2))
+    lineups[..., 0], lineups[..., 1] = env.mu, env.sigma
+    index = {team_id: i for i, team_id in enumerate(team_ids)}
+    filled = np.zeros(len(team_ids), dtype=np.int64)
+    stmt = (
+        select(schema.SkillRating.team, schema.SkillRating.rating_mu, schema.SkillRating.rating_sigma)
+        .where(schema.SkillRating.team.in_(team_ids))
+        .order_by(schema.SkillRating.team, schema.SkillRating.rating_mu.desc())
+    )
+    for team_id, mu, sigma in session.execute(stmt):
+        i = index[team_id]
+        if filled[i] < N_POSITIONS:
+            lineups[i, filled[i]] = mu, sigma
+            filled[i] += 1
+    return lineups
+
+
+def simulate_competition(
+    engine: Engine,
+    competition_id: int,
+    n: int = 100_000,
+    seed: int = None,
+    env: trueskill.TrueSkill = None,
+):
+    """Simulate the rest of a competition from the current ratings.
+
+    Every team meets every other team at home and away. Played team matches count with their
+    result, all other pairings are simulated with the four best rated players of each team.
+
+    Args:
+        engine (Engine): Engine connected to the database.
+        competition_id (int): Database id of the competition.
+        n (int, optional): Number of simulated seasons. Defaults to 100_000.
+        seed (int, optional): Seed of the random generator. Defaults to None.
+        env (trueskill.TrueSkill, optional): Environment for beta and default ratings. Defaults to the global environment.
+
+    Returns:
+        SeasonSimulation: Team ids, probability of every final position per team and expected points.
+    """
+    env = trueskill.global_env() if env is None else env
+    with Session(engine) as session:
+        team_ids = session.execute(
+            select(schema.Team.id).where(schema.Team.competition == competition_id).order_by(schema.Team.id)
+        ).scalars().all()
+        team_matches = session.execute(
+            select(schema.TeamMatch.home_team, schema.TeamMatch.away_team, schema.TeamMatch.result).where(
+                schema.TeamMatch.competition == competition_id
+            )
+        ).all()
+        lineups = _team_lineups(session, team_ids, env)
+
+    index = {team_id: i for i, team_id in enumerate(team_ids)}
+    points = np.zeros(len(team_ids))
+    leg_difference = np.zeros(len(team_ids))
+    played = set()
+    for home_team, away_team, result in team_matches:
+        if home_team not in index or away_team not in index:
+            continue
+        try:
+            home_legs, away_legs = (int(legs) for legs in result.split(":"))
+        except (AttributeError, ValueError):
+            continue
+        home, away = index[home_team], index[away_team]
+        played.add((home, away))
+        points[home] += WIN_POINTS if home_legs > away_legs else DRAW_POINTS if home_legs == away_legs else 0
+        points[away] += WIN_POINTS if away_legs > home_legs else DRAW_POINTS if home_legs == away_legs else 0
+        leg_difference[home] += home_legs - away_legs
+        leg_difference[away] += away_legs - home_legs
+
+    fixtures = [
+        (home, away)
+        for home in range(len(team_ids))
+        for away in range(len(team_ids))
+        if home != away and (home, away) not in played
+    ]
+    position_probabilities, expected_points = simulate_season(
+        lineups, fixtures, points, leg_difference, n=n, seed=seed, env=env
+    )
+    return SeasonSimulation(team_ids, position_probabilities, expected_points, n)
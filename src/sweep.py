@@ -0,0 +1,108 @@
+import csv
+import itertools
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import trueskill
+
+from .offline import OfflineReplay, Score
+
+# TrueSkill parameters that can be swept, in the order of trueskill.TrueSkill
+PARAMETERS = ["mu", "sigma", "beta", "tau", "draw_probability"]
+DEFAULTS = {
+    "mu": trueskill.MU,
+    "sigma": trueskill.SIGMA,
+    "beta": trueskill.BETA,
+    "tau": trueskill.TAU,
+    "draw_probability": trueskill.DRAW_PROBABILITY,
+}
+
+# replay of the worker process, compiled once by the pool initializer
+_replay = None
+
+
+def grid_search(**values):
+    """All combinations of the given parameter values, other parameters keep the trueskill defaults.
+
+    Args:
+        **values: Parameter name to list of values, e.g. beta=[2, 4, 6].
+
+    Returns:
+        list: Parameter dicts.
+    """
+    for name in values:
+        if name not in PARAMETERS:
+            raise ValueError(f"Unknown TrueSkill parameter {name!r}")
+    names = list(values)
+    return [
+        {**DEFAULTS, **dict(zip(names, combination))}
+        for combination in itertools.product(*values.values())
+    ]
+
+
+def random_search(n: int, seed: int = 0, **ranges):
+    """Random parameter dicts, each parameter drawn log-uniformly from its (low, high) range.
+
+    Args:
+        n (int): Number of configurations.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+        **ranges: Parameter name to (low, high), e.g. tau=(0.01, 1). A draw probability of 0 is drawn uniformly.
+
+    Returns:
+        list: Parameter dicts.
+    """
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n):
+        config = dict(DEFAULTS)
+        for name, (low, high) in ranges.items():
+            if name not in PARAMETERS:
+                raise ValueError(f"Unknown TrueSkill parameter {name!r}")
+            if low > 0:
+                config[name] = math.exp(rng.uniform(math.log(low), math.log(high)))
+            else:
+                config[name] = rng.uniform(low, high)
+        configs.append(config)
+    return configs
+
+
+def _init_worker(paths: list):
+    global _replay
+    _replay = OfflineReplay.from_files(paths)
+
+
+def _score_config(config: dict):
+    return _replay.score(trueskill.TrueSkill(**config))
+
+
+def sweep(paths: list, configs: list, workers: int = None):
+    """Score every configuration by replaying all legs of the crawled files.
+
+    Each worker process compiles the legs once and then scores its share of configurations.
+
+    Args:
+        paths (list): Crawled json files or archives.
+        configs (list): Parameter dicts, e.g. from grid_search or random_search.
+        workers (int, optional): Number of worker processes. Defaults to the number of cores.
+
+    Returns:
+        list: (config, Score) ranked by log-loss, best first.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(list(paths),)) as executor:
+        scores = list(executor.map(_score_config, configs, chunksize=max(1, len(configs) // 64)))
+    return sorted(zip(configs, scores), key=lambda result: (result[1].log_loss, result[1].brier))
+
+
+def write_sweep_csv(path, results: list):
+    """Write the ranked results of sweep, one row per configuration.
+
+    Args:
+        path (Union[str, Path]): Destination csv file.
+        results (list): Output of sweep.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", *PARAMETERS, *Score._fields])
+        for rank, (config, score) in enumerate(results, start=1):
+            writer.writerow([rank, *(config[name] for name in PARAMETERS), *score])
@@ -0,0 +1,55 @@
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.archive import Archive, load_crawl, read_columns, write_archive
+
+TEST_DATA_PATH = "./test/testdata.json"
+
+
+@pytest.fixture()
+def data():
+    with open(TEST_DATA_PATH, "r") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_archive_round_trip(data, tmp_path, compress):
+    path = tmp_path / "crawl.npz"
+    write_archive(path, data, compress=compress)
+    # trunk-ignore(bandit/B101)
+    assert load_crawl(path) == data
+    # trunk-ignore(bandit/B101)
+    assert path.stat().st_size < Path(TEST_DATA_PATH).stat().st_size / 2
+
+
+def test_archive_edge_cases(data, tmp_path):
+    crawled = data["DBH"]["Kreisliga 5"]
+    crawled["players"][0] = [*crawled["players"][0], "A"]  # crawler output with team rank
+    crawled["matches"][0] = None  # team match without report
+    crawled["matches"][1] = []
+    crawled["clubs_teams"]["Club without teams"] = []
+    path = tmp_path / "crawl.npz"
+    write_archive(path, data)
+    # trunk-ignore(bandit/B101)
+    assert load_crawl(path) == data
+
+
+def test_uncompressed_archive_is_memory_mapped(data, tmp_path):
+    path = tmp_path / "crawl.npz"
+    write_archive(path, data, compress=False)
+    columns = read_columns(path)
+    # trunk-ignore(bandit/B101)
+    assert isinstance(columns["leg_home"], np.memmap)
+
+    archive = Archive(path)
+    legs = [leg for legs in data["DBH"]["Kreisliga 5"]["matches"] for leg in legs or []]
+    # trunk-ignore(bandit/B101)
+    assert archive.decode("leg_home") == [leg["home_player"] for leg in legs]
+    # trunk-ignore(bandit/B101)
+    assert archive["leg_number"].tolist() == [leg["match_number"] for leg in legs]
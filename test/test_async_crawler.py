@@ -0,0 +1,90 @@
+import asyncio
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.async_crawler import AsyncCrawl2K, AsyncFetcher, TokenBucket, competition_results
+from src.crawl_state import CrawlIndex
+from src.fixture_server import FixtureServer
+from src.http_crawler import Http2K, pooled_session
+
+FROM_DATE = datetime(2023, 8, 1)
+
+
+def test_token_bucket_limits_rate():
+    async def acquire(n):
+        bucket = TokenBucket(rate=100, capacity=5)
+        start = time.monotonic()
+        await asyncio.gather(*[bucket.acquire() for _ in range(n)])
+        return time.monotonic() - start
+
+    # the burst is free, the remaining 20 requests take 0.2s at 100 per second
+    # trunk-ignore(bandit/B101)
+    assert asyncio.run(acquire(5)) < 0.05
+    # trunk-ignore(bandit/B101)
+    assert asyncio.run(acquire(25)) == pytest.approx(0.2, abs=0.08)
+
+
+def test_async_crawl_matches_http_crawler():
+    with FixtureServer(latency=0.01) as server:
+        with Http2K(2023, url=server.url) as crawler:
+            teams, players = crawler.get_clubs_and_teams(["DBH"], ["Kreisliga"])
+            matchdays, matches = crawler.get_matches(["DBH"], ["Kreisliga"], from_date=FROM_DATE)
+
+        fetcher = AsyncFetcher(per_host=3)
+        crawled, failed = AsyncCrawl2K(2023, fetcher=fetcher, url=server.url).run(from_date=FROM_DATE)
+        fetcher.close()
+        max_in_flight = server.counter["max_in_flight"]
+
+    # two associations with two competitions each
+    # trunk-ignore(bandit/B101)
+    assert len(crawled) == 4 and failed == []
+    crawl = [c for c in crawled if (c.association, c.competition) == ("DBH", "Kreisliga")][0]
+    # trunk-ignore(bandit/B101)
+    assert (crawl.teams, crawl.players, crawl.team_matches, crawl.matches) == (teams, players, matchdays, matches)
+    # trunk-ignore(bandit/B101)
+    assert max_in_flight == 3
+
+    results = competition_results(crawl, datetime(2023, 8, 1), FROM_DATE)
+    # trunk-ignore(bandit/B101)
+    assert results["crawled_competitions"] == {"DBH": ["Kreisliga"]}
+    # trunk-ignore(bandit/B101)
+    assert results["DBH"]["Kreisliga"]["team_matches"][0]["date"] == "2023-09-15T19:30:00"
+
+
+def test_async_fetcher_retries_requests():
+    with FixtureServer(fail_every=3) as server:
+        fetcher = AsyncFetcher(session=pooled_session(retries=0), per_host=2, backoff=0.01)
+        crawled, failed = AsyncCrawl2K(2023, fetcher=fetcher, url=server.url).run(["DBH"], from_date=FROM_DATE)
+        fetcher.close()
+    # trunk-ignore(bandit/B101)
+    assert len(crawled) == 2 and failed == [] and fetcher.n_retries > 0
+
+    with FixtureServer(fail_every=1) as server:
+        fetcher = AsyncFetcher(per_host=2, retries=1, backoff=0.01)
+        crawler = AsyncCrawl2K(2023, fetcher=fetcher, url=server.url)
+        with pytest.raises(Exception):
+            crawler.run(from_date=FROM_DATE)
+        fetcher.close()
+
+
+def test_async_crawl_with_index(tmp_path):
+    crawl_index = CrawlIndex.open(tmp_path / "crawl.db")
+    with FixtureServer() as server:
+        crawler = AsyncCrawl2K(2023, url=server.url)
+        crawled, _ = crawler.run(["DBH"], from_date=FROM_DATE, crawl_index=crawl_index)
+        crawl_index.save()
+        first = server.counter["requests"]
+        again, _ = crawler.run(["DBH"], from_date=FROM_DATE, crawl_index=crawl_index)
+        crawler.fetcher.close()
+        second = server.counter["requests"] - first
+    # trunk-ignore(bandit/B101)
+    assert [len(c.team_matches) for c in crawled] == [3, 3] and [len(c.team_matches) for c in again] == [1, 1]
+    # two reports per competition are not opened again
+    # trunk-ignore(bandit/B101)
+    assert first - second == 4
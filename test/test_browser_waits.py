@@ -0,0 +1,83 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.browser_waits import ARM_SCRIPT, SETTLED_SCRIPT, BrowserWaits, LatencyStats
+
+
+class ScriptedBrowser:
+    """Answers the wait scripts like a page whose ajax request finishes after `busy_polls` checks
+    and changes the observed area after `quiet_polls` checks."""
+
+    def __init__(self, busy_polls, quiet_polls=0):
+        self.busy_polls = busy_polls
+        self.quiet_polls = quiet_polls
+        self.scripts = []
+
+    def execute_script(self, script, *args):
+        self.scripts.append(script)
+        if script == SETTLED_SCRIPT:
+            self.busy_polls -= 1
+            self.quiet_polls -= 1
+            return [self.busy_polls < 0, int(self.quiet_polls < 0)]
+        return None
+
+
+def test_latency_stats():
+    stats = LatencyStats()
+    for seconds in [0.1, 0.2, 0.3, 0.4]:
+        stats.record("open report", seconds)
+    stats.record("competition", 2.0)
+    summary = stats.summary()
+    # trunk-ignore(bandit/B101)
+    assert list(summary) == ["competition", "open report"]
+    # trunk-ignore(bandit/B101)
+    assert summary["open report"]["total"] == pytest.approx(1.0)
+    # trunk-ignore(bandit/B101)
+    assert (summary["open report"]["count"], summary["open report"]["max"]) == (4, 0.4)
+
+
+def test_after_waits_until_settled():
+    browser = ScriptedBrowser(busy_polls=3)
+    waits = BrowserWaits(browser, timeout=2, poll=0.01)
+    clicks = []
+    waits.after("competition", lambda: clicks.append(len(browser.scripts)), "showligadashDashboard")
+    # the observer is armed before the click, then the page is polled until it settled
+    # trunk-ignore(bandit/B101)
+    assert browser.scripts[0] == ARM_SCRIPT and clicks == [1]
+    # trunk-ignore(bandit/B101)
+    assert browser.scripts[1:] == [SETTLED_SCRIPT] * 4
+    # trunk-ignore(bandit/B101)
+    assert waits.stats.summary()["competition"]["timeouts"] == 0
+
+
+def test_after_records_timeouts():
+    waits = BrowserWaits(ScriptedBrowser(busy_polls=10**6), timeout=0.05, poll=0.01)
+    waits.after("gameplan", lambda: None)
+    # trunk-ignore(bandit/B101)
+    assert waits.stats.summary()["gameplan"]["timeouts"] == 1
+
+
+def test_after_waits_for_a_change_of_the_area():
+    # the page looks settled before the ajax request of the click started
+    browser = ScriptedBrowser(busy_polls=0, quiet_polls=3)
+    waits = BrowserWaits(browser, timeout=2, poll=0.01)
+    waits.after("competition", lambda: None, "showligadashDashboard")
+    # trunk-ignore(bandit/B101)
+    assert browser.scripts[1:] == [SETTLED_SCRIPT] * 4
+
+    # without an area the quiet page is enough
+    browser = ScriptedBrowser(busy_polls=0, quiet_polls=3)
+    BrowserWaits(browser, timeout=2, poll=0.01).after("load", lambda: None)
+    # trunk-ignore(bandit/B101)
+    assert browser.scripts[1:] == [SETTLED_SCRIPT]
+
+
+def test_unchanged_area_times_out():
+    waits = BrowserWaits(ScriptedBrowser(busy_polls=0, quiet_polls=10**6), timeout=0.05, poll=0.01)
+    waits.after("association", lambda: None, "showligadashDashboard")
+    # trunk-ignore(bandit/B101)
+    assert waits.stats.summary()["association"]["timeouts"] == 1
@@ -0,0 +1,167 @@
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.insert import (
+    bulk_populate,
+    bulk_populate_files,
+    populate_clubs_and_teams,
+    populate_competitions,
+    populate_teammatches,
+    stage_file,
+)
+from src.schema import (
+    Base,
+    Club,
+    Competition,
+    DoublesMatch,
+    Human,
+    Player,
+    SinglesMatch,
+    Team,
+    TeamMatch,
+)
+
+TEST_DATA_PATH = "./test/testdata.json"
+TABLES = [Competition, Club, Team, Human, Player, TeamMatch, SinglesMatch, DoublesMatch]
+
+
+@pytest.fixture()
+def data():
+    with open(TEST_DATA_PATH, "r") as f:
+        data = json.load(f)
+    data["season"] = datetime.fromisoformat(data["season"])
+    return data
+
+
+def create_database():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def count_rows(engine):
+    with Session(engine) as session:
+        return {
+            table.__tablename__: session.execute(select(func.count()).select_from(table)).scalar()
+            for table in TABLES
+        }
+
+
+def read_legs(engine):
+    """Singles by date and player names, independent of database ids."""
+    with Session(engine) as session:
+        rows = session.execute(
+            select(TeamMatch.date, SinglesMatch.home_player, SinglesMatch.away_player, SinglesMatch.result)
+            .join(TeamMatch, TeamMatch.id == SinglesMatch.team_match)
+        ).all()
+        names = dict(session.execute(select(Player.id, Human.name).join(Human, Human.id == Player.human)).all())
+    return sorted((date, names[home], names[away], result) for date, home, away, result in rows)
+
+
+def test_bulk_insert_is_idempotent(data):
+    engine = create_database()
+    added = bulk_populate(engine, data)
+    counts = count_rows(engine)
+    # trunk-ignore(bandit/B101)
+    assert added["team_matches"] == counts["Teammatch"] > 0
+    # trunk-ignore(bandit/B101)
+    assert added["singles"] + added["doubles"] == counts["Singlesmatch"] + counts["Doublesmatch"]
+
+    added = bulk_populate(engine, data)
+    # trunk-ignore(bandit/B101)
+    assert set(added.values()) == {0}
+    # trunk-ignore(bandit/B101)
+    assert count_rows(engine) == counts
+
+
+def test_bulk_insert_matches_orm_insert(data):
+    orm, bulk = create_database(), create_database()
+    populate_competitions(orm, data["crawled_competitions"], data["season"])
+    for association, competitions in data["crawled_competitions"].items():
+        for competition in competitions:
+            crawled = data[association][competition]
+            populate_clubs_and_teams(orm, crawled["clubs_teams"], association, competition, data["season"])
+            populate_teammatches(orm, crawled["team_matches"], crawled["matches"], data["season"])
+
+    # the orm path above creates players from the matches only
+    for association, competitions in data["crawled_competitions"].items():
+        for competition in competitions:
+            data[association][competition]["players"] = []
+    bulk_populate(bulk, data)
+
+    # trunk-ignore(bandit/B101)
+    assert count_rows(bulk) == count_rows(orm)
+    # trunk-ignore(bandit/B101)
+    assert read_legs(bulk) == read_legs(orm)
+
+
+def test_stage_file_assigns_unambiguous_teams(data):
+    staged = stage_file(data)
+    clubs_teams = data["DBH"]["Kreisliga 5"]["clubs_teams"]
+    for name, club, rank, _, _ in staged["players"]:
+        if len(clubs_teams.get(club, [])) == 1:
+            # trunk-ignore(bandit/B101)
+            assert rank == clubs_teams[club][0]
+        else:
+            # trunk-ignore(bandit/B101)
+            assert rank is None
+
+
+def test_parallel_insert_writes_in_date_order(data, tmp_path):
+    # split the season into two crawls and pass the later one first
+    crawled = data["DBH"]["Kreisliga 5"]
+    order = sorted(range(len(crawled["team_matches"])), key=lambda i: crawled["team_matches"][i]["date"])
+    half = len(order) // 2
+    paths = []
+    for name, indices in [("late", order[half:]), ("early", order[:half])]:
+        part = json.loads(json.dumps(data, default=str))
+        part["DBH"]["Kreisliga 5"]["team_matches"] = [crawled["team_matches"][i] for i in indices]
+        part["DBH"]["Kreisliga 5"]["matches"] = [crawled["matches"][i] for i in indices]
+        paths.append(tmp_path / f"{name}.json")
+        paths[-1].write_text(json.dumps(part))
+
+    engine = create_database()
+    added = bulk_populate_files(engine, paths, workers=2)
+    # trunk-ignore(bandit/B101)
+    assert [path.stem for path, _ in added] == ["early", "late"]
+
+    with Session(engine) as session:
+        dates = session.execute(select(TeamMatch.date).order_by(TeamMatch.id)).scalars().all()
+    split = sum(counts["team_matches"] for path, counts in added if path.stem == "early")
+    # trunk-ignore(bandit/B101)
+    assert max(dates[:split]) <= min(dates[split:])
+
+    sequential = create_database()
+    bulk_populate(sequential, data)
+    # trunk-ignore(bandit/B101)
+    assert count_rows(engine) == count_rows(sequential)
+    # trunk-ignore(bandit/B101)
+    assert read_legs(engine) == read_legs(sequential)
+
+
+def test_parallel_insert_with_small_window(data, tmp_path):
+    # files are written while others are still parsed, the result is the same
+    paths = []
+    for name in ["first", "second", "third"]:
+        paths.append(tmp_path / f"{name}.json")
+        paths[-1].write_text(json.dumps(data, default=str))
+
+    engine = create_database()
+    added = bulk_populate_files(engine, paths, workers=2, window=1)
+    # trunk-ignore(bandit/B101)
+    assert sorted(path.stem for path, _ in added) == ["first", "second", "third"]
+
+    sequential = create_database()
+    bulk_populate(sequential, data)
+    # trunk-ignore(bandit/B101)
+    assert count_rows(engine) == count_rows(sequential)
+    # trunk-ignore(bandit/B101)
+    assert read_legs(engine) == read_legs(sequential)
@@ -0,0 +1,104 @@
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, select, update
+from sqlalchemy.orm import Session
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.insert import (
+    IdentityCache,
+    populate_clubs_and_teams,
+    populate_competitions,
+    populate_players,
+    populate_teammatches,
+)
+from src.schema import Base, DataGeneration, DoublesMatch, Human, Player, SinglesMatch, Team, TeamMatch
+
+TEST_DATA_PATH = "./test/testdata.json"
+
+with open(TEST_DATA_PATH, "r") as f:
+    data = json.load(f)
+    data["season"] = datetime.fromisoformat(data["season"])
+
+
+def ingest(engine, cache=None):
+    populate_competitions(engine, data["crawled_competitions"], data["season"])
+    for association, competitions in data["crawled_competitions"].items():
+        for competition in competitions:
+            crawled = data[association][competition]
+            # players as the crawler writes them, without team ranks
+            populate_clubs_and_teams(engine, crawled["clubs_teams"], association, competition, data["season"], cache=cache)
+            populate_players(engine, crawled["players"], association, competition, data["season"], cache=cache)
+            populate_teammatches(engine, crawled["team_matches"], crawled["matches"], data["season"], cache=cache)
+
+
+def read_tables(engine):
+    with Session(engine) as session:
+        return {
+            table.__tablename__: sorted(
+                tuple(getattr(row, column.name) for column in table.__table__.columns if column.name != "human")
+                for row in session.execute(select(table)).scalars()
+            )
+            for table in [Team, Player, TeamMatch, SinglesMatch, DoublesMatch]
+        }
+
+
+def test_cached_ingest_matches_uncached():
+    engines = [create_engine("sqlite://") for _ in range(2)]
+    for engine in engines:
+        Base.metadata.create_all(engine)
+    uncached, cached = engines
+    ingest(uncached)
+    ingest(cached, IdentityCache(cached))
+    # trunk-ignore(bandit/B101)
+    assert read_tables(cached) == read_tables(uncached)
+
+    # a warm cache from the database resolves every player and re-ingesting adds nothing
+    expected = read_tables(cached)
+    cache = IdentityCache(cached)
+    with Session(cached) as session:
+        for player_id, name, club in session.execute(
+            select(Player.id, Human.name, Player.club).join(Human, Human.id == Player.human)
+        ):
+            # trunk-ignore(bandit/B101)
+            assert cache.player(name, club).id == player_id
+    ingest(cached, cache)
+    # trunk-ignore(bandit/B101)
+    assert read_tables(cached) == expected
+
+
+def test_generation_is_bumped_once_per_call():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    ingest(engine, IdentityCache(engine))
+    n_competitions = sum(len(competitions) for competitions in data["crawled_competitions"].values())
+    with Session(engine) as session:
+        # trunk-ignore(bandit/B101)
+        assert session.execute(select(DataGeneration.generation)).scalar() == 1 + 3 * n_competitions
+
+
+def test_legs_are_keyed_by_position():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    ingest(engine, IdentityCache(engine))
+    expected = read_tables(engine)
+    with Session(engine) as session:
+        for table in (SinglesMatch, DoublesMatch):
+            # trunk-ignore(bandit/B101)
+            assert session.execute(select(func.count()).where(table.position.is_(None))).scalar() == 0
+
+    # legs inserted before positions were stored are recognized by their players
+    with Session(engine) as session, session.begin():
+        for table in (SinglesMatch, DoublesMatch):
+            session.execute(update(table).values(position=None))
+    ingest(engine, IdentityCache(engine))
+    with Session(engine) as session:
+        n_legs = sum(
+            session.execute(select(func.count()).select_from(table)).scalar()
+            for table in (SinglesMatch, DoublesMatch)
+        )
+    # trunk-ignore(bandit/B101)
+    assert n_legs == len(expected["Singlesmatch"]) + len(expected["Doublesmatch"])
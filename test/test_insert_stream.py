@@ -0,0 +1,67 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.insert import IdentityCache, iter_crawl_records, stream_populate
+from src.schema import Base
+
+from test_insert_cache import data, ingest, read_tables
+
+TEST_DATA_PATH = "./test/testdata.json"
+
+
+def rebuild(path, chunk_size):
+    """Assemble the records of a file back into the crawler's nested layout."""
+    rebuilt = {}
+    for record in iter_crawl_records(path, chunk_size=chunk_size):
+        if record.association is None:
+            key = "crawled_competitions" if record.kind == "competitions" else record.kind
+            rebuilt[key] = record.payload
+            continue
+        crawled = rebuilt.setdefault(record.association, {}).setdefault(
+            record.competition, {"clubs_teams": {}, "matches": [], "players": [], "team_matches": []}
+        )
+        if record.kind == "club":
+            club, ranks = record.payload
+            crawled["clubs_teams"][club] = ranks
+        elif record.kind == "player":
+            crawled["players"].append(list(record.payload))
+        else:
+            team_match, legs = record.payload
+            crawled["team_matches"].append(team_match)
+            crawled["matches"].append(legs)
+    return rebuilt
+
+
+@pytest.mark.parametrize("chunk_size", [3, 1000, 1 << 16])
+def test_records_rebuild_the_file(chunk_size):
+    with open(TEST_DATA_PATH, "r") as f:
+        expected = json.load(f)
+    # trunk-ignore(bandit/B101)
+    assert rebuild(TEST_DATA_PATH, chunk_size) == expected
+
+
+def test_stream_populate_matches_eager_ingest():
+    # the test data is streamed as the crawler wrote it, players without team ranks
+    eager = create_engine("sqlite://")
+    Base.metadata.create_all(eager)
+    ingest(eager)
+
+    streamed = create_engine("sqlite://")
+    Base.metadata.create_all(streamed)
+    stream_populate(streamed, TEST_DATA_PATH, cache=IdentityCache(streamed), batch_size=7)
+    # trunk-ignore(bandit/B101)
+    assert read_tables(streamed) == read_tables(eager)
+
+
+def test_team_matches_before_matches_are_rejected(tmp_path):
+    crawled = {"team_matches": [{"date": "2023-09-15T19:30:00"}], "matches": [[]]}
+    path = tmp_path / "crawl.json"
+    path.write_text(json.dumps({"season": "2023-08-01T00:00:00", "DBH": {"Kreisliga": crawled}}))
+    with pytest.raises(ValueError, match="precede"):
+        list(iter_crawl_records(path))
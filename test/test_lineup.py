@@ -0,0 +1,106 @@
+import itertools
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pytest
+import trueskill
+
+sys.path.append(str(Path(".").absolute()))
+sys.path.append(str(Path("src").absolute()))
+
+from lineup import SECOND_ROUND, best_doubles, best_lineup, likely_positions
+
+PlayerTuple = namedtuple("PlayerTuple", ["name", "id", "rating"])
+
+
+def roster(prefix, n, seed):
+    rng = np.random.default_rng(seed)
+    return [
+        PlayerTuple(f"{prefix}{i}", i, trueskill.Rating(rng.normal(25, 5), rng.uniform(1, 5)))
+        for i in range(n)
+    ]
+
+
+def win_probability(team1, team2):
+    delta_mu = sum(p.rating.mu for p in team1) - sum(p.rating.mu for p in team2)
+    sum_sigma = sum(p.rating.sigma**2 for p in team1 + team2)
+    env = trueskill.global_env()
+    return env.cdf(delta_mu / np.sqrt(len(team1 + team2) * env.beta**2 + sum_sigma))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_singles_match_brute_force(seed):
+    home, away = roster("h", 6, seed), roster("a", 6, seed + 100)
+    lineup = best_lineup(home, away)
+    away_lineup = [leg.away for leg in lineup.singles[:4]]
+
+    def expected_singles(order):
+        pairings = [*zip(range(4), range(4)), *SECOND_ROUND]
+        return sum(win_probability([order[h]], [away_lineup[a]]) for h, a in pairings)
+
+    best = max(expected_singles(order) for order in itertools.permutations(home, 4))
+    # trunk-ignore(bandit/B101)
+    assert sum(leg.win_probability for leg in lineup.singles) == pytest.approx(best)
+    # every home player keeps the position, the second round is rotated
+    # trunk-ignore(bandit/B101)
+    assert [leg.home for leg in lineup.singles[:4]] == [leg.home for leg in lineup.singles[4:]]
+    # trunk-ignore(bandit/B101)
+    assert [leg.away for leg in lineup.singles[4:]] == away_lineup[1:] + away_lineup[:1]
+
+
+def test_doubles_match_brute_force():
+    home, away = roster("h", 7, 0), roster("a", 4, 1)
+    away_pairs = [away[:2], away[2:]]
+    doubles = best_doubles(home, away_pairs)
+
+    def expected_doubles(first, second):
+        # both blocks, the home pairs stay and meet the other away pair in the second block
+        legs = [(first, 0), (second, 1), (first, 1), (second, 0)]
+        return sum(win_probability(list(pair), away_pairs[away]) for pair, away in legs)
+
+    best = max(
+        expected_doubles(first, second)
+        for first, second in itertools.permutations(itertools.combinations(home, 2), 2)
+        if not {p.name for p in first} & {p.name for p in second}
+    )
+    # trunk-ignore(bandit/B101)
+    assert len(doubles) == 4
+    # trunk-ignore(bandit/B101)
+    assert sum(leg.win_probability for leg in doubles) == pytest.approx(best)
+    # trunk-ignore(bandit/B101)
+    assert not {p.name for p in doubles[0].home} & {p.name for p in doubles[1].home}
+    # the second block keeps the home pairs and swaps the away pairs, like simulation.LEGS
+    # trunk-ignore(bandit/B101)
+    assert [(leg.home, leg.away) for leg in doubles[2:]] == [
+        (doubles[0].home, doubles[1].away),
+        (doubles[1].home, doubles[0].away),
+    ]
+
+
+def test_doubles_need_four_players():
+    home, away = roster("h", 3, 0), roster("a", 4, 1)
+    with pytest.raises(ValueError):
+        best_doubles(home, [away[:2], away[2:]])
+
+
+def test_likely_positions():
+    away = roster("a", 6, 0)
+    positions = {"a5": [1, 1, 2], "a0": [2, 2], "a3": [4, 3, 3], "a1": [4]}
+    # trunk-ignore(bandit/B101)
+    assert [p.name for p in likely_positions(away, positions)] == ["a5", "a0", "a3", "a1"]
+
+
+def test_best_lineup_is_fast():
+    home, away = roster("h", 8, 0), roster("a", 8, 1)
+    best_lineup(home, away)
+    start = time.perf_counter()
+    lineup = best_lineup(home, away, away_positions={"a1": [1, 2], "a4": [3]})
+    # trunk-ignore(bandit/B101)
+    assert time.perf_counter() - start < 0.1
+    # trunk-ignore(bandit/B101)
+    assert len(lineup.singles) == 8 and len(lineup.doubles) == 4
+    # trunk-ignore(bandit/B101)
+    assert 0 < lineup.expected_legs < 12
@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+from sqlalchemy import create_engine, inspect, text
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.migrations import migrate_database
+from src.schema import Base
+
+
+def create_unindexed_database(engine):
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(text(f'DROP INDEX "{index.name}"'))
+
+
+def test_migration_creates_indexes():
+    engine = create_engine("sqlite://")
+    create_unindexed_database(engine)
+
+    created = migrate_database(engine)
+    expected = {index.name for table in Base.metadata.sorted_tables for index in table.indexes}
+    # trunk-ignore(bandit/B101)
+    assert set(created) == expected
+    # running it again is a no-op
+    # trunk-ignore(bandit/B101)
+    assert migrate_database(engine) == []
+
+
+def test_migration_skips_violated_unique_index():
+    engine = create_engine("sqlite://")
+    create_unindexed_database(engine)
+    with engine.begin() as connection:
+        for _ in range(2):
+            connection.execute(
+                text("INSERT INTO Skillrating (player, team, rating_mu, rating_sigma) VALUES (1, 1, 25, 8)")
+            )
+        # NULL years do not collide
+        for _ in range(2):
+            connection.execute(
+                text("INSERT INTO Competition (name, association, year) VALUES ('Liga', 'DBH', NULL)")
+            )
+
+    created = migrate_database(engine)
+    # trunk-ignore(bandit/B101)
+    assert "ix_Skillrating_player_team" not in created
+    # trunk-ignore(bandit/B101)
+    assert "ix_Competition_name_association_year" in created
+    indexes = {index["name"] for index in inspect(engine).get_indexes("Skillrating")}
+    # trunk-ignore(bandit/B101)
+    assert "ix_Skillrating_player_team" not in indexes
+
+
+def test_migration_adds_columns():
+    engine = create_engine("sqlite://")
+    create_unindexed_database(engine)
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE Singlesmatch DROP COLUMN position"))
+
+    created = migrate_database(engine)
+    columns = {column["name"] for column in inspect(engine).get_columns("Singlesmatch")}
+    # trunk-ignore(bandit/B101)
+    assert "position" in columns
+    # trunk-ignore(bandit/B101)
+    assert "ix_Singlesmatch_team_match_position" in created
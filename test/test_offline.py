@@ -0,0 +1,121 @@
+import csv
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+import trueskill
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.archive import write_archive
+from src.insert import bulk_populate
+from src.offline import OfflineReplay, write_history_csv, write_ratings_csv
+from src.rating import compute_ratings
+from src.schema import Base, Club, Human, Player, RatingHistory, SkillRating, Team
+
+TEST_DATA_PATH = "./test/testdata.json"
+
+
+@pytest.fixture()
+def replay():
+    return OfflineReplay.from_files([TEST_DATA_PATH])
+
+
+def database_ratings():
+    with open(TEST_DATA_PATH, "r") as f:
+        data = json.load(f)
+    data["season"] = datetime.fromisoformat(data["season"])
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    bulk_populate(engine, data)
+    compute_ratings(engine, backend="numpy", checkpoint_every=0)
+
+    with Session(engine) as session:
+        ratings = session.execute(
+            select(Human.name, Club.name, Team.rank, SkillRating.rating_mu, SkillRating.rating_sigma, SkillRating.latest_update)
+            .join(Player, Player.id == SkillRating.player)
+            .join(Human, Human.id == Player.human)
+            .join(Club, Club.id == Player.club)
+            .join(Team, Team.id == SkillRating.team)
+        ).all()
+        history = session.execute(
+            select(Human.name, Club.name, Team.rank, RatingHistory.date, RatingHistory.rating_mu, RatingHistory.rating_sigma)
+            .join(Player, Player.id == RatingHistory.player)
+            .join(Human, Human.id == Player.human)
+            .join(Club, Club.id == Player.club)
+            .join(Team, Team.id == RatingHistory.team)
+        ).all()
+    return {(name, club, rank): tuple(row) for name, club, rank, *row in ratings}, sorted(history)
+
+
+def test_offline_replay_matches_database(replay):
+    ratings, history = database_ratings()
+    result = replay.replay()
+
+    offline = {
+        (key.name, key.club, key.rank): (mu, sigma, latest_update)
+        for key, mu, sigma, latest_update in zip(result.keys, result.mu, result.sigma, result.latest_update)
+    }
+    # trunk-ignore(bandit/B101)
+    assert len(offline) == len(result.keys)
+    for key, (mu, sigma, latest_update) in offline.items():
+        # trunk-ignore(bandit/B101)
+        assert ratings[key] == (pytest.approx(mu), pytest.approx(sigma), latest_update)
+
+    offline_history = sorted(
+        (result.keys[slot].name, result.keys[slot].club, result.keys[slot].rank, date, mu, sigma)
+        for slot, date, mu, sigma in zip(
+            result.history_slot.tolist(), result.history_date, result.history_mu, result.history_sigma
+        )
+    )
+    # trunk-ignore(bandit/B101)
+    assert len(offline_history) == len(history)
+    for offline_row, row in zip(offline_history, history):
+        # trunk-ignore(bandit/B101)
+        assert offline_row == pytest.approx(tuple(row))
+
+
+def test_offline_replay_environment(replay):
+    default = replay.replay()
+    again = replay.replay()
+    # trunk-ignore(bandit/B101)
+    assert np.array_equal(default.mu, again.mu) and np.array_equal(default.sigma, again.sigma)
+
+    env = trueskill.TrueSkill(mu=1500, sigma=500, beta=250, tau=5, draw_probability=0)
+    tuned = replay.replay(env)
+    # trunk-ignore(bandit/B101)
+    assert tuned.mu.mean() == pytest.approx(1500, rel=1e-2)
+    # trunk-ignore(bandit/B101)
+    assert np.all(tuned.sigma < 500)
+
+
+def test_offline_replay_from_archive(replay, tmp_path):
+    with open(TEST_DATA_PATH, "r") as f:
+        write_archive(tmp_path / "testdata.npz", json.load(f))
+    from_archive = OfflineReplay.from_files([tmp_path / "testdata.npz"]).replay()
+    result = replay.replay()
+    # trunk-ignore(bandit/B101)
+    assert from_archive.keys == result.keys
+    # trunk-ignore(bandit/B101)
+    assert np.array_equal(from_archive.mu, result.mu)
+
+
+def test_write_csv(replay, tmp_path):
+    result = replay.replay()
+    write_ratings_csv(tmp_path / "ratings.csv", result)
+    write_history_csv(tmp_path / "history.csv", result)
+
+    with open(tmp_path / "ratings.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    # trunk-ignore(bandit/B101)
+    assert len(rows) == len(result.keys)
+    # trunk-ignore(bandit/B101)
+    assert [float(row["mu"]) for row in rows] == result.mu.tolist()
+    with open(tmp_path / "history.csv", newline="") as f:
+        # trunk-ignore(bandit/B101)
+        assert sum(1 for _ in f) == len(result.history_mu) + 1
@@ -0,0 +1,574 @@
+import gc
+import random
+import sys
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pytest
+import trueskill
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import Session
+
+sys.path.append(str(Path(".").absolute()))
+sys.path.append(str(Path("src").absolute()))
+
+import common_queries
+
+from src.generation import bump_generation
+from src.leaderboard import refresh_leaderboard
+from src.rating import (
+    KernelRatingReplay,
+    compute_ratings,
+    leg_keys,
+    load_unrated_legs,
+    reset_ratings,
+    rollback_ratings,
+    schedule_waves,
+)
+from src.rating_kernel import (
+    TrueSkillKernel,
+    erfc,
+    match_quality_matrix,
+    win_probability_matrix,
+)
+from src.schema import (
+    Base,
+    Club,
+    Competition,
+    DoublesMatch,
+    Human,
+    Leaderboard,
+    Player,
+    RatingCheckpoint,
+    SinglesMatch,
+    SkillRating,
+    Team,
+    TeamMatch,
+)
+
+N_TEAMS = 4
+PLAYERS_PER_TEAM = 5
+
+
+def create_season(engine, n_days=6, seed=0):
+    """Fill the database with a small random round robin and return its legs in replay order."""
+    rng = random.Random(seed)
+    legs = []
+    with Session(engine) as session:
+        teams, players = [], {}
+        for t in range(N_TEAMS):
+            club = Club(name=f"Club {t}")
+            session.add(club)
+            session.flush()
+            team = Team(rank="A", club=club.id, year="2023-08-01T00:00:00", competition=1)
+            session.add(team)
+            session.flush()
+            teams.append(team.id)
+            players[team.id] = []
+            for p in range(PLAYERS_PER_TEAM):
+                session.add(Human(id=f"human{t}{p}", name=f"Player {t}{p}"))
+                player = Player(human=f"human{t}{p}", club=club.id, association_id="", team=team.id)
+                session.add(player)
+                session.flush()
+                players[team.id].append(player.id)
+
+        for day in range(n_days):
+            order = rng.sample(teams, len(teams))
+            for home, away in zip(order[::2], order[1::2]):
+                team_match = TeamMatch(
+                    date=f"2023-09-{day + 1:02d}T19:00:00",
+                    competition=1,
+                    result="",
+                    home_team=home,
+                    away_team=away,
+                )
+                session.add(team_match)
+                session.flush()
+                for number in range(1, 9):
+                    home_player, away_player = rng.choice(players[home]), rng.choice(players[away])
+                    result = rng.choice(["3:0", "3:2", "1:3", "2:3", ":"])
+                    session.add(
+                        SinglesMatch(
+                            team_match=team_match.id,
+                            home_player=home_player,
+                            away_player=away_player,
+                            result=result,
+                            match_number=number,
+                        )
+                    )
+                    legs.append(((home_player,), (away_player,), home, away, result))
+                doubles = []
+                for number in range(1, 5):
+                    h1, h2 = rng.sample(players[home], 2)
+                    a1, a2 = rng.sample(players[away], 2)
+                    result = rng.choice(["3:1", "0:3"])
+                    session.add(
+                        DoublesMatch(
+                            team_match=team_match.id,
+                            home_player1=h1,
+                            home_player2=h2,
+                            away_player1=a1,
+                            away_player2=a2,
+                            result=result,
+                            match_number=number,
+                        )
+                    )
+                    doubles.append(((h1, h2), (a1, a2), home, away, result))
+                legs.extend(doubles)
+        session.commit()
+    return legs
+
+
+def replay_reference(legs):
+    """Rate legs one by one with the trueskill package."""
+    ratings = {}
+    for home, away, home_team, away_team, result in legs:
+        home_keys = [(p, home_team) for p in home]
+        away_keys = [(p, away_team) for p in away]
+        for key in home_keys + away_keys:
+            ratings.setdefault(key, trueskill.Rating())
+        if result == ":":
+            continue
+        ranks = [0, 1] if result[0] > result[2] else [1, 0]
+        new_home, new_away = trueskill.rate(
+            [[ratings[k] for k in home_keys], [ratings[k] for k in away_keys]], ranks=ranks
+        )
+        ratings.update(zip(home_keys + away_keys, [*new_home, *new_away]))
+    return ratings
+
+
+@pytest.fixture()
+def engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def read_ratings(engine):
+    with Session(engine) as session:
+        rows = session.execute(
+            select(SkillRating.player, SkillRating.team, SkillRating.rating_mu, SkillRating.rating_sigma)
+        ).all()
+    return {(player, team): (mu, sigma) for player, team, mu, sigma in rows}
+
+
+@pytest.mark.parametrize("backend", ["trueskill", "numpy"])
+def test_compute_ratings_matches_reference(engine, backend):
+    legs = create_season(engine)
+    compute_ratings(engine, backend=backend)
+
+    expected = replay_reference(legs)
+    ratings = read_ratings(engine)
+    # every player gets a rating, even those without a rated leg
+    # trunk-ignore(bandit/B101)
+    assert len(ratings) == N_TEAMS * PLAYERS_PER_TEAM
+    for key, rating in expected.items():
+        # trunk-ignore(bandit/B101)
+        assert ratings[key] == pytest.approx((rating.mu, rating.sigma), abs=1e-9)
+
+
+def test_compute_ratings_is_incremental(engine):
+    create_season(engine)
+    compute_ratings(engine)
+    ratings = read_ratings(engine)
+    compute_ratings(engine)
+    # trunk-ignore(bandit/B101)
+    assert read_ratings(engine) == ratings
+    with Session(engine) as session:
+        n_unrated = session.execute(
+            select(func.count()).select_from(TeamMatch).where(TeamMatch.used_for_rating == False)  # noqa: E712
+        ).scalar()
+    # trunk-ignore(bandit/B101)
+    assert n_unrated == 0
+
+
+@pytest.mark.parametrize(
+    "env",
+    [
+        trueskill.TrueSkill(),
+        trueskill.TrueSkill(mu=30, sigma=7, beta=3, tau=0.2, draw_probability=0.2),
+        trueskill.TrueSkill(backend="scipy"),
+    ],
+)
+@pytest.mark.parametrize("team_size", [1, 2])
+def test_kernel_matches_trueskill(env, team_size):
+    rng = np.random.default_rng(0)
+    n_matches = 500
+    mu = rng.uniform(5, 45, (n_matches, 2 * team_size))
+    sigma = rng.uniform(0.5, 9, (n_matches, 2 * team_size))
+
+    kernel = TrueSkillKernel(env, capacity=4)
+    slots = np.array(
+        [[kernel.slot((i, j), mu[i, j], sigma[i, j]) for j in range(2 * team_size)] for i in range(n_matches)]
+    )
+    kernel.rate(slots[:, :team_size], slots[:, team_size:])
+
+    for i in range(n_matches):
+        teams = [
+            [env.create_rating(mu[i, j], sigma[i, j]) for j in range(team_size)],
+            [env.create_rating(mu[i, j], sigma[i, j]) for j in range(team_size, 2 * team_size)],
+        ]
+        expected = [rating for team in env.rate(teams, ranks=[0, 1]) for rating in team]
+        for slot, rating in zip(slots[i], expected):
+            # trunk-ignore(bandit/B101)
+            assert kernel.mu[slot] == pytest.approx(rating.mu, abs=1e-9)
+            # trunk-ignore(bandit/B101)
+            assert kernel.sigma[slot] == pytest.approx(rating.sigma, abs=1e-9)
+
+
+def test_erfc_matches_trueskill():
+    x = np.random.default_rng(0).normal(0, 3, 1000)
+    expected = [trueskill.backends.erfc(value) for value in x]
+    # trunk-ignore(bandit/B101)
+    assert erfc(x).tolist() == pytest.approx(expected, abs=1e-15)
+    # trunk-ignore(bandit/B101)
+    assert erfc(x.reshape(10, 100)).shape == (10, 100)
+    # trunk-ignore(bandit/B101)
+    assert float(erfc(0.5)) == pytest.approx(trueskill.backends.erfc(0.5), abs=1e-15)
+
+
+@pytest.mark.parametrize(
+    "env", [trueskill.TrueSkill(), trueskill.TrueSkill(beta=2, backend="scipy")]
+)
+@pytest.mark.parametrize("sizes", [(1, 1), (2, 2), (2, 1)])
+def test_matrices_match_trueskill(env, sizes):
+    rng = np.random.default_rng(0)
+    team1 = np.stack([rng.uniform(5, 45, (7, sizes[0])), rng.uniform(0.5, 9, (7, sizes[0]))], axis=-1)
+    team2 = np.stack([rng.uniform(5, 45, (5, sizes[1])), rng.uniform(0.5, 9, (5, sizes[1]))], axis=-1)
+    if sizes == (1, 1):
+        # singles may be given without the team axis
+        team1, team2 = team1[:, 0], team2[:, 0]
+
+    probabilities = win_probability_matrix(team1, team2, env)
+    qualities = match_quality_matrix(team1, team2, env)
+    # trunk-ignore(bandit/B101)
+    assert probabilities.shape == qualities.shape == (7, 5)
+    for i in range(7):
+        for j in range(5):
+            ratings1 = [env.create_rating(*rating) for rating in team1[i].reshape(-1, 2)]
+            ratings2 = [env.create_rating(*rating) for rating in team2[j].reshape(-1, 2)]
+            delta_mu = sum(r.mu for r in ratings1) - sum(r.mu for r in ratings2)
+            sum_sigma = sum(r.sigma**2 for r in ratings1 + ratings2)
+            size = len(ratings1) + len(ratings2)
+            expected = env.cdf(delta_mu / np.sqrt(size * env.beta**2 + sum_sigma))
+            # trunk-ignore(bandit/B101)
+            assert probabilities[i, j] == pytest.approx(expected, abs=1e-12)
+            # trunk-ignore(bandit/B101)
+            assert qualities[i, j] == pytest.approx(env.quality([ratings1, ratings2]), abs=1e-12)
+
+
+def test_waves_match_sequential_replay(engine):
+    create_season(engine, n_days=10)
+    with Session(engine) as session:
+        _, legs = load_unrated_legs(session)
+
+    waves = schedule_waves(legs)
+    # trunk-ignore(bandit/B101)
+    assert len(waves) < len(legs)
+    position = {id(leg): i for i, leg in enumerate(legs)}
+    last_seen = {}
+    for wave in waves:
+        keys = [key for leg in wave for key in leg_keys(leg)]
+        # trunk-ignore(bandit/B101)
+        assert len(keys) == len(set(keys))
+        for leg in wave:
+            for key in leg_keys(leg):
+                # trunk-ignore(bandit/B101)
+                assert last_seen.get(key, -1) < position[id(leg)]
+                last_seen[key] = position[id(leg)]
+
+    sequential, batched = KernelRatingReplay(), KernelRatingReplay()
+    for leg in legs:
+        sequential.rate_leg(leg)
+    batched.rate_legs(legs)
+    # trunk-ignore(bandit/B101)
+    assert sorted(sequential.rows()) == sorted(batched.rows())
+
+
+def read_checkpoints(engine):
+    with Session(engine) as session:
+        return dict(session.execute(select(RatingCheckpoint.date, RatingCheckpoint.ratings)).all())
+
+
+def add_back_dated_match(engine, date):
+    """Insert a team match between the first two teams after the season has been rated."""
+    with Session(engine) as session:
+        home, away = session.execute(select(Team.id).order_by(Team.id).limit(2)).scalars()
+        home_players = session.execute(select(Player.id).where(Player.team == home)).scalars().all()
+        away_players = session.execute(select(Player.id).where(Player.team == away)).scalars().all()
+        team_match = TeamMatch(date=date, competition=1, result="", home_team=home, away_team=away)
+        session.add(team_match)
+        session.flush()
+        for number, (home_player, away_player) in enumerate(zip(home_players, away_players)):
+            session.add(
+                SinglesMatch(
+                    team_match=team_match.id,
+                    home_player=home_player,
+                    away_player=away_player,
+                    result="3:1" if number % 2 else "0:3",
+                    match_number=number + 1,
+                )
+            )
+        session.commit()
+
+
+@pytest.mark.parametrize("backend", ["trueskill", "numpy"])
+def test_back_dated_match_restores_checkpoint(backend):
+    engines = [create_engine("sqlite://") for _ in range(2)]
+    for engine in engines:
+        Base.metadata.create_all(engine)
+        create_season(engine, n_days=8)
+    incremental, full = engines
+
+    compute_ratings(incremental, backend=backend)
+    first_run = read_checkpoints(incremental)
+    add_back_dated_match(incremental, "2023-09-05T20:00:00")
+    compute_ratings(incremental, backend=backend)
+
+    add_back_dated_match(full, "2023-09-05T20:00:00")
+    compute_ratings(full, backend=backend)
+
+    expected = read_ratings(full)
+    ratings = read_ratings(incremental)
+    # trunk-ignore(bandit/B101)
+    assert ratings.keys() == expected.keys()
+    for key, rating in expected.items():
+        # trunk-ignore(bandit/B101)
+        assert ratings[key] == pytest.approx(rating, abs=1e-12)
+    # checkpoints before the back-dated match are kept from the first run, later ones are replaced
+    checkpoints = read_checkpoints(incremental)
+    kept = {date: ratings for date, ratings in first_run.items() if date < "2023-09-05T20:00:00"}
+    # trunk-ignore(bandit/B101)
+    assert len(kept) == 5
+    # trunk-ignore(bandit/B101)
+    assert all(checkpoints[date] == ratings for date, ratings in kept.items())
+    # trunk-ignore(bandit/B101)
+    assert len(checkpoints) == 9
+
+
+def test_reset_ratings_replays_everything(engine):
+    create_season(engine)
+    compute_ratings(engine)
+    ratings = read_ratings(engine)
+    reset_ratings(engine)
+    with Session(engine) as session:
+        # trunk-ignore(bandit/B101)
+        assert session.execute(select(func.count()).select_from(RatingCheckpoint)).scalar() == 0
+    compute_ratings(engine)
+    for key, rating in read_ratings(engine).items():
+        # trunk-ignore(bandit/B101)
+        assert rating == pytest.approx(ratings[key], abs=1e-12)
+
+
+def test_rating_history(engine):
+    create_season(engine, n_days=8)
+    with Session(engine) as session:
+        session.add(Competition(id=1, name="Kreisliga", association="DBH", year="2023-08-01T00:00:00"))
+        # players without association id are left out, like in the leaderboard
+        unranked = session.execute(select(func.min(Player.id))).scalar()
+        for player in session.execute(select(Player).where(Player.id != unranked)).scalars():
+            player.association_id = str(player.id)
+        session.commit()
+    compute_ratings(engine, backend="numpy")
+    ratings = {key: rating for key, rating in read_ratings(engine).items() if key[0] != unranked}
+
+    latest = common_queries.leaderboard_at(engine, "2023-12-31", conservative=False)
+    # trunk-ignore(bandit/B101)
+    assert len(latest) == len(ratings)
+    board = common_queries.leaderboard(engine, "Kreisliga", "2023-08-01T00:00:00", conservative=False)
+    # trunk-ignore(bandit/B101)
+    assert [(p.id, p.rating) for p in latest] == [(p.id, p.rating) for p in board]
+    for entry in latest:
+        trajectory = common_queries.get_rating_trajectory(engine, entry.id)
+        # trunk-ignore(bandit/B101)
+        assert [point.date for point in trajectory] == sorted(point.date for point in trajectory)
+        # trunk-ignore(bandit/B101)
+        assert (trajectory[-1].mu, trajectory[-1].sigma) == ratings[(entry.id, trajectory[-1].team)]
+        # trunk-ignore(bandit/B101)
+        assert entry.rating == trajectory[-1].mu
+
+    mid_season = common_queries.leaderboard_at(engine, "2023-09-04T23:59:59")
+    # trunk-ignore(bandit/B101)
+    assert [p.rating for p in mid_season] == sorted((p.rating for p in mid_season), reverse=True)
+    for entry in mid_season:
+        # trunk-ignore(bandit/B101)
+        assert entry.date <= "2023-09-04T23:59:59"
+        point = [p for p in common_queries.get_rating_trajectory(engine, entry.id) if p.date == entry.date][0]
+        # trunk-ignore(bandit/B101)
+        assert entry.rating == pytest.approx(point.mu - 3 * point.sigma)
+
+    # a date without time covers the matches played on that day
+    match_day = common_queries.leaderboard_at(engine, "2023-09-04")
+    # trunk-ignore(bandit/B101)
+    assert sorted(match_day) == sorted(mid_season)
+    # trunk-ignore(bandit/B101)
+    assert any(entry.date.startswith("2023-09-04") for entry in match_day)
+
+
+def test_player_skill_for_team(engine):
+    legs = create_season(engine, n_days=4)
+    compute_ratings(engine, backend="numpy")
+    with Session(engine) as session:
+        session.add(Competition(id=1, name="Kreisliga", association="DBH", year="2023-08-01T00:00:00"))
+        session.commit()
+        club_team = dict(session.execute(select(Club.name, Team.id).join(Team, Team.club == Club.id)).all())
+        names = dict(session.execute(select(Player.id, Human.name).join(Human, Human.id == Player.human)).all())
+    ratings = read_ratings(engine)
+
+    team = club_team["Club 1"]
+    singles_players = {
+        player
+        for home, away, home_team, away_team, _ in legs
+        if len(home) == 1
+        for player, player_team in [(home[0], home_team), (away[0], away_team)]
+        if player_team == team
+    }
+    ignored = names[min(singles_players)]
+    roster = common_queries.get_player_skill_for_team(engine, "Club 1", "Kreisliga", ignore_players=[ignored])
+
+    # trunk-ignore(bandit/B101)
+    assert {p.id for p in roster} == singles_players - {min(singles_players)}
+    # trunk-ignore(bandit/B101)
+    assert [p.rating.mu for p in roster] == sorted((p.rating.mu for p in roster), reverse=True)
+    for player in roster:
+        # trunk-ignore(bandit/B101)
+        assert player.name == names[player.id]
+        # trunk-ignore(bandit/B101)
+        assert (player.rating.mu, player.rating.sigma) == pytest.approx(ratings[(player.id, team)])
+
+
+def read_leaderboard(engine):
+    with Session(engine) as session:
+        rows = session.execute(
+            select(Leaderboard.player, Leaderboard.team, Leaderboard.rating_mu, Leaderboard.rating_sigma, Leaderboard.rank)
+        ).all()
+    return {(player, team): (mu, sigma, rank) for player, team, mu, sigma, rank in rows}
+
+
+def rebuilt_leaderboard(engine):
+    with Session(engine) as session:
+        refresh_leaderboard(session)
+        session.commit()
+    return read_leaderboard(engine)
+
+
+def test_leaderboard_follows_ratings(engine):
+    create_season(engine, n_days=8)
+    with Session(engine) as session:
+        session.add(Competition(id=1, name="Kreisliga", association="DBH", year="2023-08-01T00:00:00"))
+        for player in session.execute(select(Player)).scalars():
+            player.association_id = str(player.id)
+        session.commit()
+    compute_ratings(engine, backend="numpy")
+    first = read_leaderboard(engine)
+    ratings = read_ratings(engine)
+    # trunk-ignore(bandit/B101)
+    assert {key: entry[:2] for key, entry in first.items()} == ratings
+
+    # ranks follow the conservative rating, ties share a rank
+    by_rating = sorted(first.values(), key=lambda entry: entry[0] - 3 * entry[1], reverse=True)
+    # trunk-ignore(bandit/B101)
+    assert [entry[2] for entry in by_rating] == list(range(1, len(by_rating) + 1))
+    top = common_queries.leaderboard(engine, "Kreisliga", "2023-08-01T00:00:00")
+    # trunk-ignore(bandit/B101)
+    assert [p.rating for p in top] == sorted((p.rating for p in top), reverse=True)
+    page = common_queries.leaderboard(engine, "Kreisliga", "2023-08-01T00:00:00", offset=3, limit=5)
+    # trunk-ignore(bandit/B101)
+    assert page == top[3:8]
+    best = common_queries.leaderboard_rank(engine, top[0].id)
+    # trunk-ignore(bandit/B101)
+    assert [(entry.rank, entry.rating) for entry in best] == [(1, top[0].rating)]
+
+    # incremental refreshes end up where a full rebuild does
+    add_back_dated_match(engine, "2023-09-30T20:00:00")
+    compute_ratings(engine, backend="numpy")
+    incremental = read_leaderboard(engine)
+    # trunk-ignore(bandit/B101)
+    assert incremental != first
+    # trunk-ignore(bandit/B101)
+    assert incremental == rebuilt_leaderboard(engine)
+
+    rollback_ratings(engine, "2023-09-04T00:00:00")
+    # trunk-ignore(bandit/B101)
+    assert {key: entry[:2] for key, entry in read_leaderboard(engine).items()} == read_ratings(engine)
+    reset_ratings(engine)
+    # trunk-ignore(bandit/B101)
+    assert {key: entry[:2] for key, entry in read_leaderboard(engine).items()} == read_ratings(engine)
+
+
+def test_query_cache_hits_skip_the_database(engine, monkeypatch):
+    create_season(engine, n_days=2)
+    with Session(engine) as session:
+        session.add(Competition(id=1, name="Kreisliga", association="DBH", year="2023-08-01T00:00:00"))
+        session.commit()
+    compute_ratings(engine, backend="numpy")
+    common_queries.query_cache.clear()
+    monkeypatch.setattr(common_queries.query_cache, "ttl", 60)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    roster = common_queries.get_player_skill_for_team(engine, "Club 1", "Kreisliga")
+    statements.clear()
+    # trunk-ignore(bandit/B101)
+    assert common_queries.get_player_skill_for_team(engine, "Club 1", "Kreisliga") == roster
+    # trunk-ignore(bandit/B101)
+    assert statements == []
+
+    # a commit through the engine makes the next lookup read the generation again
+    with Session(engine) as session:
+        bump_generation(session)
+        session.commit()
+    statements.clear()
+    common_queries.get_player_skill_for_team(engine, "Club 1", "Kreisliga")
+    # trunk-ignore(bandit/B101)
+    assert any("Datageneration" in statement for statement in statements)
+    # trunk-ignore(bandit/B101)
+    assert common_queries.query_cache.info()[1] == 2
+
+
+def test_query_cache_releases_engines():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    common_queries.query_cache.clear()
+    common_queries.get_associations_and_competitions(engine)
+    # trunk-ignore(bandit/B101)
+    assert common_queries.query_cache.info().size == 1
+    collected = weakref.ref(engine)
+    engine.dispose()
+    del engine
+    gc.collect()
+    # trunk-ignore(bandit/B101)
+    assert collected() is None
+    # trunk-ignore(bandit/B101)
+    assert common_queries.query_cache.info().size == 0
+
+
+def test_query_cache_follows_generation(engine):
+    create_season(engine, n_days=4)
+    with Session(engine) as session:
+        session.add(Competition(id=1, name="Kreisliga", association="DBH", year="2023-08-01T00:00:00"))
+        session.commit()
+    compute_ratings(engine, backend="numpy")
+    common_queries.query_cache.clear()
+
+    roster = common_queries.get_player_skill_for_team(engine, "Club 1", "Kreisliga")
+    again = common_queries.get_player_skill_for_team(engine, "Club 1", "Kreisliga")
+    # trunk-ignore(bandit/B101)
+    assert again == roster and again is not roster
+    # trunk-ignore(bandit/B101)
+    assert common_queries.query_cache.info()[:3] == (1, 1, 1)
+    # PlayerTuples with their unhashable ratings are valid keys
+    common_queries.get_previous_matches(engine, roster[:2], roster[2:])
+    common_queries.get_previous_matches(engine, roster[:2], roster[2:])
+    # trunk-ignore(bandit/B101)
+    assert common_queries.query_cache.info()[:3] == (2, 2, 2)
+
+    # a rating run drops the cached results
+    add_back_dated_match(engine, "2023-09-30T20:00:00")
+    compute_ratings(engine, backend="numpy")
+    updated = common_queries.get_player_skill_for_team(engine, "Club 1", "Kreisliga")
+    # trunk-ignore(bandit/B101)
+    assert updated == common_queries.get_player_skill_for_team.__wrapped__(engine, "Club 1", "Kreisliga")
+    # trunk-ignore(bandit/B101)
+    assert common_queries.query_cache.info()[1:3] == (3, 1)
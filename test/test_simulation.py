@@ -0,0 +1,96 @@
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+sys.path.append(str(Path(".").absolute()))
+sys.path.append(str(Path("src").absolute()))
+
+from rating_kernel import win_probability_matrix
+from simulation import LEGS, N_LEGS, simulate_competition, simulate_season, simulate_team_match
+
+from src.insert import bulk_populate
+from src.rating import compute_ratings
+from src.schema import Base, Competition
+
+TEST_DATA_PATH = "./test/testdata.json"
+
+
+def lineup(mus, sigma=2.0):
+    return np.array([(mu, sigma) for mu in mus])
+
+
+def test_leg_structure():
+    singles = [leg for leg in LEGS if len(leg[0]) == 1]
+    doubles = [leg for leg in LEGS if len(leg[0]) == 2]
+    # trunk-ignore(bandit/B101)
+    assert (len(singles), len(doubles), N_LEGS) == (8, 4, 12)
+    for position in range(4):
+        # trunk-ignore(bandit/B101)
+        assert sum(position in home for home, _ in singles) == 2
+        # trunk-ignore(bandit/B101)
+        assert sum(position in away for _, away in singles) == 2
+
+
+def test_team_match_matches_win_probabilities():
+    home, away = lineup([28, 26, 24, 22]), lineup([27, 25, 25, 20], sigma=3)
+    probabilities, legs_won = simulate_team_match(home, away, n=200_000, seed=0)
+
+    # every leg is won with the win probability of its players
+    expected_legs = sum(
+        win_probability_matrix(home[list(home_positions)][None], away[list(away_positions)][None])[0, 0]
+        for home_positions, away_positions in LEGS
+    )
+    # trunk-ignore(bandit/B101)
+    assert legs_won.mean() == pytest.approx(expected_legs, abs=0.02)
+    # trunk-ignore(bandit/B101)
+    assert sum(probabilities) == pytest.approx(1)
+    # trunk-ignore(bandit/B101)
+    assert simulate_team_match(home, away, n=1000, seed=1)[0] == simulate_team_match(home, away, n=1000, seed=1)[0]
+
+
+def test_season_positions():
+    lineups = np.stack([lineup([40] * 4), lineup([25] * 4), lineup([25] * 4), lineup([10] * 4)])
+    fixtures = [(home, away) for home in range(4) for away in range(4) if home != away]
+    positions, expected_points = simulate_season(lineups, fixtures, n=20_000, seed=0, chunk_size=3_000)
+
+    # trunk-ignore(bandit/B101)
+    assert np.allclose(positions.sum(axis=0), 1) and np.allclose(positions.sum(axis=1), 1)
+    # trunk-ignore(bandit/B101)
+    assert positions[0, 0] > 0.99 and positions[3, 3] > 0.99
+    # trunk-ignore(bandit/B101)
+    assert positions[1, 1] == pytest.approx(positions[2, 1], abs=0.02)
+    # every fixture hands out two points
+    # trunk-ignore(bandit/B101)
+    assert expected_points.sum() == pytest.approx(2 * len(fixtures))
+
+    # without fixtures left, the table is final
+    positions, _ = simulate_season(lineups, [], points=[4, 8, 8, 2], leg_difference=[0, 3, 5, 0], n=10, seed=0)
+    # trunk-ignore(bandit/B101)
+    assert positions.argmax(axis=1).tolist() == [2, 1, 0, 3]
+
+
+def test_simulate_competition():
+    with open(TEST_DATA_PATH, "r") as f:
+        data = json.load(f)
+    data["season"] = datetime.fromisoformat(data["season"])
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    bulk_populate(engine, data)
+    compute_ratings(engine, backend="numpy")
+    with Session(engine) as session:
+        competition_id = session.execute(select(Competition.id)).scalars().first()
+
+    simulation = simulate_competition(engine, competition_id, n=5_000, seed=0)
+    # trunk-ignore(bandit/B101)
+    assert len(simulation.teams) == len(simulation.position_probabilities)
+    # trunk-ignore(bandit/B101)
+    assert np.allclose(simulation.position_probabilities.sum(axis=1), 1)
+    again = simulate_competition(engine, competition_id, n=5_000, seed=0)
+    # trunk-ignore(bandit/B101)
+    assert np.array_equal(simulation.position_probabilities, again.position_probabilities)
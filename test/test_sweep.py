@@ -0,0 +1,72 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import trueskill
+
+sys.path.append(str(Path(".").absolute()))
+
+from src.offline import OfflineReplay
+from src.rating_kernel import TrueSkillKernel
+from src.sweep import DEFAULTS, grid_search, random_search, sweep
+
+TEST_DATA_PATH = "./test/testdata.json"
+
+
+def test_kernel_win_probability():
+    kernel = TrueSkillKernel()
+    ratings = [trueskill.Rating(mu=20 + i, sigma=3 + i / 2) for i in range(4)]
+    for i, rating in enumerate(ratings):
+        kernel.slot(i, rating.mu, rating.sigma)
+
+    env = trueskill.global_env()
+    for team1, team2 in [([0], [1]), ([3], [2]), ([0, 1], [2, 3])]:
+        # same formula as report_utils.win_probability
+        delta_mu = sum(ratings[i].mu for i in team1) - sum(ratings[i].mu for i in team2)
+        sum_sigma = sum(ratings[i].sigma ** 2 for i in team1 + team2)
+        expected = env.cdf(delta_mu / np.sqrt(len(team1 + team2) * env.beta**2 + sum_sigma))
+        # trunk-ignore(bandit/B101)
+        assert kernel.win_probability(np.array([team1]), np.array([team2]))[0] == pytest.approx(expected)
+
+
+def test_score():
+    replay = OfflineReplay.from_files([TEST_DATA_PATH])
+    score = replay.score()
+    n_legs = sum(winners.shape[0] for wave in replay.waves for winners, _ in wave)
+    # trunk-ignore(bandit/B101)
+    assert score.n_legs == n_legs
+    # the first legs are played by unrated players
+    # trunk-ignore(bandit/B101)
+    assert 0 < score.brier < score.log_loss
+    # trunk-ignore(bandit/B101)
+    assert score.log_loss != replay.score(trueskill.TrueSkill(beta=2)).log_loss
+
+
+def test_search_spaces():
+    configs = grid_search(beta=[2, 4], tau=[0.1, 0.2, 0.3])
+    # trunk-ignore(bandit/B101)
+    assert len(configs) == 6
+    # trunk-ignore(bandit/B101)
+    assert all(config["mu"] == DEFAULTS["mu"] for config in configs)
+
+    configs = random_search(5, seed=1, beta=(1, 10), draw_probability=(0, 0.2))
+    # trunk-ignore(bandit/B101)
+    assert configs == random_search(5, seed=1, beta=(1, 10), draw_probability=(0, 0.2))
+    # trunk-ignore(bandit/B101)
+    assert all(1 <= config["beta"] <= 10 and 0 <= config["draw_probability"] <= 0.2 for config in configs)
+
+    with pytest.raises(ValueError):
+        grid_search(alpha=[1])
+
+
+def test_sweep_ranks_configurations():
+    configs = grid_search(beta=[1, 4, 16])
+    results = sweep([TEST_DATA_PATH], configs, workers=2)
+
+    replay = OfflineReplay.from_files([TEST_DATA_PATH])
+    # trunk-ignore(bandit/B101)
+    assert [score.log_loss for _, score in results] == sorted(score.log_loss for _, score in results)
+    for config, score in results:
+        # trunk-ignore(bandit/B101)
+        assert score == replay.score(trueskill.TrueSkill(**config))